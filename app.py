@@ -1,29 +1,35 @@
-
 import os
 import sqlite3
 from uuid import uuid4
 from pathlib import Path
-import re, unicodedata, json
-import json
-import qrcode
-from fastapi import FastAPI, Request, Form, HTTPException, Body
+import re, unicodedata, json, csv, itertools
+from fastapi import FastAPI, Request, Form, HTTPException, Body, BackgroundTasks, UploadFile, File
 from fastapi.responses import RedirectResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+import anyio
 from jinja2 import Environment, FileSystemLoader, select_autoescape
-from PIL import Image, ImageDraw, ImageFont
-from PIL import Image, ImageDraw, ImageFont
 import time
-from PIL import Image, ImageDraw, ImageFont
 from fastapi.responses import Response
-import io, textwrap, qrcode
-from fastapi.responses import JSONResponse
+import io, textwrap, gzip, mimetypes, stat
+from fastapi.responses import JSONResponse, StreamingResponse
 from sys import platform as _plat
 import shutil, subprocess
-from fastapi import Form
+import threading, hashlib, zlib, multiprocessing, base64, asyncio, logging, sys, hmac
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque
+from contextvars import ContextVar, copy_context
+from functools import lru_cache, wraps
+from bisect import bisect_left
+from starlette.routing import Match, Mount
 
 APP_TITLE = "Home QR Inventory"
+log = logging.getLogger("inventory")
 BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.join(BASE_DIR, "data.sqlite3")
+DB_PATH = os.getenv("DB_PATH", os.path.join(BASE_DIR, "data.sqlite3"))
 QRCODES_DIR = os.path.join(BASE_DIR, "qrcodes")
 Path(QRCODES_DIR).mkdir(exist_ok=True)
 TLS_CERT_FILE = os.path.join(BASE_DIR, "cert.pem")  
@@ -64,13 +70,24 @@ def export_mkcert_root_only() -> bool:
     if not os.path.exists(src):
         return False
     # Provide multiple extensions for easy install on different OSes
+    st = os.stat(src)
     for name in ("rootCA.pem", "rootCA.crt", "rootCA.cer"):
+        dest = os.path.join(CERTS_DIR, name)
+        try:
+            cur = os.stat(dest)
+            if cur.st_size == st.st_size and cur.st_mtime >= st.st_mtime:
+                continue                      # already exported
+        except OSError:
+            pass
         try:
-            shutil.copyfile(src, os.path.join(CERTS_DIR, name))
+            shutil.copyfile(src, dest)
         except Exception:
             pass
     return True
 
+def has_mkcert_root() -> bool:
+    return os.path.exists(os.path.join(CERTS_DIR, "rootCA.pem"))
+
 # Hard-coded base for QR
 QR_BASE_URL = os.getenv("QR_BASE_URL", "http://192.168.1.245:80000").rstrip("/")
 
@@ -81,14 +98,1938 @@ def qr_payload_for_container(cid: str) -> str:
 
 
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# -------------- Metrics --------------
+# MetricsMiddleware gives every request a fresh stats dict in a ContextVar (inherited by the
+# threads that run handlers and DB calls); TimedCursor, render() and the @timed image functions
+# add to it. When the response is done it is aggregated under the route template (never the raw
+# path) and served as Prometheus text on /metrics. Figures are per process.
+METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500, 1000)
+REQUEST_PHASES = ("sqlite", "image", "template")
+
+_request_stats: ContextVar[dict | None] = ContextVar("_request_stats", default=None)
+
+def _label_str(names, values) -> str:
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{n}="{esc(v)}"' for n, v in zip(names, values))
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: tuple):
+        self.name, self.doc, self.labels = name, doc, labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, values: tuple, amount: float = 1):
+        with self._lock:
+            self._series[values] = self._series.get(values, 0) + amount
+
+    def expose(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, v in sorted(self._series.items()):
+                out.append(f"{self.name}{{{_label_str(self.labels, values)}}} {v:g}")
+        return out
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per label-value tuple."""
+    def __init__(self, name: str, doc: str, labels: tuple, buckets: tuple):
+        self.name, self.doc, self.labels, self.buckets = name, doc, labels, buckets
+        self._series = {}                     # values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, values: tuple, v: float):
+        i = bisect_left(self.buckets, v)
+        with self._lock:
+            s = self._series.get(values)
+            if s is None:
+                s = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += v
+
+    def expose(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, list(s)) for k, s in self._series.items())
+        for values, s in series:
+            labels = _label_str(self.labels, values)
+            sep = "," if labels else ""
+            total = 0
+            for bound, n in zip(self.buckets + ("+Inf",), s):
+                total += n
+                out.append(f'{self.name}_bucket{{{labels}{sep}le="{bound}"}} {total}')
+            out.append(f"{self.name}_sum{{{labels}}} {s[-1]:.6f}")
+            out.append(f"{self.name}_count{{{labels}}} {total}")
+        return out
+
+http_requests = Counter("inventory_http_requests_total", "HTTP requests by route template and status.",
+                        ("method", "route", "status"))
+http_latency = Histogram("inventory_http_request_duration_seconds", "Time from request to the last response byte.",
+                         ("method", "route"), METRICS_LATENCY_BUCKETS)
+request_queries = Histogram("inventory_http_request_queries", "SQL statements executed per request.",
+                            ("route",), METRICS_QUERY_BUCKETS)
+request_phase = Histogram("inventory_http_request_phase_seconds",
+                          "Time per request spent in SQLite, image (Pillow/qrcode) rendering and template rendering.",
+                          ("route", "phase"), METRICS_LATENCY_BUCKETS)
+render_seconds = Histogram("inventory_render_seconds", "Template and image renders by name.",
+                           ("kind", "name"), METRICS_LATENCY_BUCKETS)
+METRICS = [http_requests, http_latency, request_queries, request_phase, render_seconds]
+
+def account(phase: str, seconds: float, queries: int = 0):
+    """Add time (and statements) to the current request, if any."""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[phase] += seconds
+        stats["queries"] += queries
+
+def timed(phase: str):
+    """Decorator: observe the call in render_seconds and charge it to the request's `phase`."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                render_seconds.observe((phase, fn.__name__), dt)
+                account(phase, dt)
+        return wrapper
+    return deco
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor that charges statement execution and row fetching to the current request, and hands
+    a statement to slow_log once its SQLite time (execute plus fetches so far) crosses the threshold.
+    """
+    _sql = _params = None
+    _spent = 0.0
+
+    def _charge(self, t0: float, queries: int = 0):
+        dt = time.perf_counter() - t0
+        account("sqlite", dt, queries)
+        before, self._spent = self._spent, self._spent + dt
+        limit = slow_log.threshold
+        if limit and before < limit <= self._spent:
+            slow_log.record(self.connection, self._sql, self._params, self._spent)
+
+    def execute(self, sql, parameters=()):
+        self._sql, self._params, self._spent = sql, parameters, 0.0
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._charge(t0, 1)
 
-def init_db():
-    conn = get_db(); cur = conn.cursor()
+    def executemany(self, sql, seq_of_parameters):
+        self._sql, self._params, self._spent = sql, None, 0.0
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._charge(t0, 1)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._charge(t0)
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._charge(t0)
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._charge(t0)
+
+@lru_cache(maxsize=4096)
+def _route_for(method: str, path: str) -> str:
+    scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return route.path + "/{path}" if isinstance(route, Mount) else route.path
+    return "<unmatched>"
+
+def route_template(scope) -> str:
+    """The matched route's path template; looked up for requests answered before routing (304s, mounts)."""
+    route = scope.get("route")
+    return route.path if route is not None else _route_for(scope["method"], scope["path"])
+
+def record_request(scope, status: int, seconds: float, stats: dict):
+    route, method = route_template(scope), scope["method"]
+    http_requests.inc((method, route, str(status)))
+    http_latency.observe((method, route), seconds)
+    request_queries.observe((route,), stats["queries"])
+    for phase in REQUEST_PHASES:
+        request_phase.observe((route, phase), stats[phase])
+    SamplingProfiler.request_done(route)
+
+class MetricsMiddleware:
+    """Times every HTTP request (to its last body chunk) and records it under its route template."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = {"queries": 0, "sqlite": 0.0, "image": 0.0, "template": 0.0,
+                 "request": f"{scope['method']} {scope['path']}"}
+        token = _request_stats.set(stats)
+        t0 = time.perf_counter()
+        status, done = 500, None
+
+        async def send_wrapper(message):
+            nonlocal status, done
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                done = time.perf_counter()
+            await send(message)
 
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            record_request(scope, status, (done or time.perf_counter()) - t0, stats)
+
+def metrics_text() -> str:
+    """All metrics plus pool/executor/cache/loop gauges, in the Prometheus text format."""
+    lines = []
+    for m in METRICS:
+        lines += m.expose()
+    pool, ex, cache = db_pool.snapshot(), db_executor.snapshot(), response_cache.snapshot()
+    gauges = [
+        ("inventory_db_pool_open_connections", "Open reader connections.", pool["open"]),
+        ("inventory_db_pool_idle_connections", "Idle reader connections.", pool["idle"]),
+        ("inventory_db_pool_waits", "Reader acquisitions that had to wait (since start).", pool["waits"]),
+        ("inventory_db_writer_waits", "Writer acquisitions that had to wait (since start).", pool["writer_waits"]),
+        ("inventory_db_executor_in_flight", "Queued plus running async DB calls.", ex["in_flight"]),
+        ("inventory_response_cache_hits", "Rendered-response cache hits (since start).", cache["hits"]),
+        ("inventory_response_cache_bytes", "Bytes held by the rendered-response cache.", cache["bytes"]),
+        ("inventory_event_loop_max_lag_seconds", "Largest event-loop lag seen.", loop_monitor.max_lag),
+        ("inventory_change_feed_errors", "Change-feed polls that failed with an unexpected error (since start).",
+         change_feed.stats["errors"]),
+    ]
+    for name, doc, v in gauges:
+        lines += [f"# HELP {name} {doc}", f"# TYPE {name} gauge", f"{name} {v:g}"]
+    return "\n".join(lines) + "\n"
+
+# Stats and debug endpoints (/metrics, /api/db/stats, /api/stats/loop, /api/debug/*) expose query
+# shapes, pool and queue internals and cache sizes: they need ADMIN_TOKEN, sent as
+# "Authorization: Bearer <token>" or X-Admin-Token, and are off when it is not set.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set ADMIN_TOKEN)")
+    auth = request.headers.get("authorization", "")
+    token = auth[7:] if auth.lower().startswith("bearer ") else request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+
+# -------------- Slow-query log --------------
+# Statements whose SQLite time crosses SLOW_QUERY_MS are recorded by shape (literals and IN-lists
+# collapsed, so `IN (?,?,?)` and `IN (?,?)` are one entry) with their parameter count, duration,
+# the request that ran them and EXPLAIN QUERY PLAN, which is re-captured at most every
+# SLOW_QUERY_EXPLAIN_TTL seconds per shape. Recent entries are kept in a ring buffer and appended
+# as JSON lines to a rotating file; /api/debug/slow-queries lists the worst shapes.
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "50"))                  # <= 0 disables
+SLOW_QUERY_RING = int(os.getenv("SLOW_QUERY_RING", "200"))
+SLOW_QUERY_SHAPES = 500                                                   # aggregates kept (LRU)
+SLOW_QUERY_EXPLAIN_TTL = float(os.getenv("SLOW_QUERY_EXPLAIN_TTL", "300"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", os.path.join(BASE_DIR, "slow-queries.log"))   # "" disables
+SLOW_QUERY_LOG_BYTES = int(os.getenv("SLOW_QUERY_LOG_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = 3
+
+_SQL_STRING = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SQL_PARAM_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_SQL_EXPLAINABLE = re.compile(r"\s*(SELECT|WITH|INSERT|REPLACE|UPDATE|DELETE)\b", re.I)
+
+def sql_shape(sql: str) -> str:
+    """Normalized statement text: literals become ?, placeholder lists become ?+, whitespace collapsed."""
+    shape = _SQL_NUMBER.sub("?", _SQL_STRING.sub("?", sql))
+    return " ".join(_SQL_PARAM_LIST.sub("?+", shape).split())
+
+def _param_count(params) -> int | None:
+    if params is None:
+        return None                           # executemany
+    return len(params)
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, size: int = SLOW_QUERY_RING, path: str = SLOW_QUERY_LOG):
+        self.threshold = threshold_ms / 1000 if threshold_ms > 0 else 0
+        self.recent = deque(maxlen=size)
+        self.path = path
+        self._shapes = OrderedDict()          # shape -> aggregate, least recently seen first
+        self._lock = threading.Lock()
+        self._logger = None
+
+    def _explain(self, conn, shape: str, sql: str, params) -> dict:
+        """Cached plan for `shape`; re-run EXPLAIN QUERY PLAN when missing or older than the TTL."""
+        with self._lock:
+            agg = self._shapes.get(shape)
+            if agg and agg["plan"] is not None and time.time() - agg["explained_at"] < SLOW_QUERY_EXPLAIN_TTL:
+                return {k: agg[k] for k in ("plan", "full_scan", "temp_btree", "explained_at")}
+        if params is None or not _SQL_EXPLAINABLE.match(sql):
+            return {"plan": None, "full_scan": False, "temp_btree": False, "explained_at": None}
+        try:
+            rows = conn.cursor(sqlite3.Cursor).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error as e:
+            return {"plan": [f"(explain failed: {e})"], "full_scan": False, "temp_btree": False, "explained_at": None}
+        depth, plan = {0: -1}, []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            plan.append("  " * depth[node_id] + detail)
+        return {"plan": plan,
+                # "SCAN t" without an index is a full table scan; covering-index scans read less but still all rows
+                "full_scan": any(d.startswith("SCAN ") and " USING " not in d for _, _, _, d in rows),
+                "temp_btree": any("TEMP B-TREE" in d for _, _, _, d in rows),
+                "explained_at": time.time()}
+
+    def record(self, conn, sql: str, params, seconds: float):
+        try:
+            shape = sql_shape(sql)
+            plan = self._explain(conn, shape, sql, params)
+            stats = _request_stats.get()
+            entry = {"at": round(time.time(), 3), "ms": round(seconds * 1000, 3), "shape": shape,
+                     "params": _param_count(params), "request": stats.get("request") if stats else None, **plan}
+            with self._lock:
+                self.recent.append(entry)
+                agg = self._shapes.pop(shape, None) or {"shape": shape, "count": 0, "total_ms": 0.0, "max_ms": 0.0}
+                agg["count"] += 1
+                agg["total_ms"] = round(agg["total_ms"] + entry["ms"], 3)
+                agg["max_ms"] = max(agg["max_ms"], entry["ms"])
+                agg.update(last_ms=entry["ms"], last_at=entry["at"], params=entry["params"], request=entry["request"], **plan)
+                self._shapes[shape] = agg
+                while len(self._shapes) > SLOW_QUERY_SHAPES:
+                    self._shapes.popitem(last=False)
+            self._write(entry)
+        except Exception:
+            pass                              # diagnostics must never fail the query being diagnosed
+
+    def _write(self, entry: dict):
+        if not self.path:
+            return
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    handler = RotatingFileHandler(self.path, maxBytes=SLOW_QUERY_LOG_BYTES,
+                                                  backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8", delay=True)
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger = logging.getLogger("inventory.slow_queries")
+                    logger.propagate = False
+                    logger.setLevel(logging.INFO)
+                    logger.addHandler(handler)
+                    self._logger = logger
+        self._logger.info(json.dumps(entry, ensure_ascii=False))
+
+    def worst(self, limit: int = 20, order: str = "max_ms") -> list[dict]:
+        with self._lock:
+            shapes = [dict(a) for a in self._shapes.values()]
+        return sorted(shapes, key=lambda a: a[order], reverse=True)[:limit]
+
+    def snapshot(self, limit: int = 20, order: str = "max_ms") -> dict:
+        with self._lock:
+            recent = list(self.recent)[-limit:][::-1]
+            shapes = len(self._shapes)
+        return {"threshold_ms": self.threshold * 1000, "log": self.path or None, "shapes": shapes,
+                "worst": self.worst(limit, order), "recent": recent}
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self._shapes.clear()
+
+slow_log = SlowQueryLog()
+
+
+# -------------- Profiling --------------
+# POST /api/debug/profile (admin only) runs a sampling profiler: a background thread reads every
+# thread's stack from sys._current_frames() each interval, so profiled code runs unmodified.
+# With a route, only stacks that pass through that route's handler (or functions nested in it,
+# e.g. its run_db callbacks) are kept, and the session can end after the next K such requests.
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = 120
+# leaf frames of threads that are just waiting (pools, event loop); dropped from unfiltered profiles
+_IDLE_LEAVES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"),
+                ("thread.py", "_worker"), ("threading.py", "_wait_for_tstate_lock")}
+
+def _handler_codes(route_path: str) -> set:
+    """Code objects of the handlers for a route template, including functions defined inside them."""
+    codes, todo = set(), [r.endpoint.__code__ for r in app.router.routes
+                          if getattr(r, "path", None) == route_path and hasattr(r, "endpoint")]
+    while todo:
+        code = todo.pop()
+        if code not in codes:
+            codes.add(code)
+            todo.extend(c for c in code.co_consts if hasattr(c, "co_code"))
+    return codes
+
+_STDLIB_DIR = os.path.dirname(os.__file__)
+
+def _frame_name(code) -> str:
+    path = code.co_filename
+    if "site-packages" + os.sep in path:
+        path = path.split("site-packages" + os.sep, 1)[1]
+    elif path.startswith((BASE_DIR, _STDLIB_DIR)):
+        path = os.path.relpath(path, BASE_DIR if path.startswith(BASE_DIR) else _STDLIB_DIR)
+    return f"{code.co_name} ({path.replace(';', ',')}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """One profiling session; at most one runs at a time (see start())."""
+    _active = None
+    _active_lock = threading.Lock()
+
+    def __init__(self, seconds: float, interval: float, route: str | None = None, requests: int | None = None):
+        self.seconds, self.interval, self.route, self.requests = seconds, interval, route, requests
+        self.codes = _handler_codes(route) if route else None
+        self.counts = {}                      # stack (tuple of code objects, leaf first) -> samples
+        self.samples = self.completed = 0
+        self.stop, self.done = threading.Event(), threading.Event()
+        self.started = self.elapsed = 0.0
+
+    @classmethod
+    def start(cls, *args, **kwargs) -> "SamplingProfiler":
+        prof = cls(*args, **kwargs)
+        with cls._active_lock:
+            if cls._active is not None:
+                raise RuntimeError("a profiling session is already running")
+            cls._active = prof
+        prof.started = time.perf_counter()
+        threading.Thread(target=prof._run, name="profiler", daemon=True).start()
+        return prof
+
+    @classmethod
+    def request_done(cls, route: str):
+        """Called for every finished request; ends a request-count session after its K-th target."""
+        prof = cls._active
+        if prof is not None and prof.requests and route == prof.route:
+            prof.completed += 1
+            if prof.completed >= prof.requests:
+                prof.stop.set()
+
+    def _run(self):
+        me, codes, counts = threading.get_ident(), self.codes, self.counts
+        deadline = self.started + self.seconds
+        try:
+            while not self.stop.wait(self.interval) and time.perf_counter() < deadline:
+                for tid, frame in sys._current_frames().items():
+                    if tid == me:
+                        continue
+                    stack, keep = [], codes is None
+                    while frame is not None:
+                        code = frame.f_code
+                        if not keep and code in codes:
+                            keep = True
+                        stack.append(code)
+                        frame = frame.f_back
+                    if not keep:
+                        continue
+                    if codes is None and (os.path.basename(stack[0].co_filename), stack[0].co_name) in _IDLE_LEAVES:
+                        continue
+                    key = tuple(stack)
+                    counts[key] = counts.get(key, 0) + 1
+                    self.samples += 1
+        finally:
+            self.elapsed = time.perf_counter() - self.started
+            with self._active_lock:
+                type(self)._active = None
+            self.done.set()
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's folded format: "root;...;leaf count" per line (flamegraph.pl, speedscope, inferno)."""
+        lines = [";".join(_frame_name(c) for c in reversed(stack)) + f" {n}"
+                 for stack, n in sorted(self.counts.items(), key=lambda kv: -kv[1])]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def speedscope(self) -> dict:
+        frames, index, samples, weights = [], {}, [], []
+        for stack, n in self.counts.items():
+            ids = []
+            for code in reversed(stack):
+                if code not in index:
+                    index[code] = len(frames)
+                    frames.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+                ids.append(index[code])
+            samples.append(ids)
+            weights.append(round(n * self.interval, 6))
+        name = f"{self.route or 'all threads'} ({self.samples} samples, {self.elapsed:.1f}s)"
+        return {"$schema": "https://www.speedscope.app/file-format-schema.json", "exporter": APP_TITLE,
+                "name": name, "activeProfileIndex": 0, "shared": {"frames": frames},
+                "profiles": [{"type": "sampled", "name": name, "unit": "seconds", "startValue": 0,
+                              "endValue": round(sum(weights), 6), "samples": samples, "weights": weights}]}
+
+
+# -------------- Database pool --------------
+# Connections are opened once and reused: readers come from a bounded pool, all writes
+# go through a single writer connection. Pragmas are applied once per connection.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))               # max reader connections
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))      # seconds to wait for a free connection
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", str(64 * 1024)))
+
+# connections handed out during the current request (see ConnectionGuardMiddleware)
+_request_conns: ContextVar[list | None] = ContextVar("_request_conns", default=None)
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool instead of closing it."""
+    pool = None
+    writer = False
+
+    def close(self):
+        if self.pool is None:
+            return super().close()
+        self.pool.release(self)
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    # the C-level shortcuts would bypass the timed cursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT):
+        self.path, self.size, self.timeout = path, size, timeout
+        self._idle = []                       # LIFO: the most recently used (warmest) connection first
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self.stats = {
+            "hits": 0, "misses": 0, "waits": 0, "wait_seconds": 0.0,
+            "writer_acquires": 0, "writer_waits": 0, "writer_wait_seconds": 0.0,
+        }
+
+    def _connect(self, writer: bool) -> PooledConnection:
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.pool, conn.writer = self, writer
+        return conn
+
+    def acquire(self, write: bool = False) -> PooledConnection:
+        conn = self._acquire_writer() if write else self._acquire_reader()
+        tracked = _request_conns.get()
+        if tracked is not None:
+            tracked.append(conn)
+        return conn
+
+    def _acquire_reader(self) -> PooledConnection:
+        with self._cond:
+            if self._idle:
+                self.stats["hits"] += 1
+                return self._idle.pop()
+            if self._opened < self.size:
+                self._opened += 1
+                self.stats["misses"] += 1
+            else:
+                self.stats["waits"] += 1
+                t0 = time.perf_counter()
+                if not self._cond.wait_for(lambda: self._idle, timeout=self.timeout):
+                    raise sqlite3.OperationalError("timed out waiting for a database connection")
+                self.stats["wait_seconds"] += time.perf_counter() - t0
+                return self._idle.pop()
+        try:
+            return self._connect(writer=False)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+            raise
+
+    def _acquire_writer(self) -> PooledConnection:
+        t0 = time.perf_counter()
+        waited = not self._writer_lock.acquire(blocking=False)
+        if waited and not self._writer_lock.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("timed out waiting for the database writer")
+        self.stats["writer_acquires"] += 1
+        if waited:
+            self.stats["writer_waits"] += 1
+            self.stats["writer_wait_seconds"] += time.perf_counter() - t0
+        if self._writer is None:
+            try:
+                self._writer = self._connect(writer=True)
+            except Exception:
+                self._writer_lock.release()
+                raise
+        return self._writer
+
+    def release(self, conn: PooledConnection):
+        tracked = _request_conns.get()
+        if tracked is not None and conn in tracked:
+            tracked.remove(conn)
+        if conn.in_transaction:
+            conn.rollback()                   # never hand out a connection mid-transaction
+        if conn.writer:
+            self._writer_lock.release()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {**self.stats, "size": self.size, "open": self._opened, "idle": len(self._idle),
+                    "writer_busy": self._writer_lock.locked()}
+
+db_pool = ConnectionPool(DB_PATH)
+
+def get_db(write: bool = False):
+    """Borrow a pooled connection; conn.close() returns it. Pass write=True for anything that writes."""
+    if not _db_ready:
+        ensure_db()
+    return db_pool.acquire(write=write)
+
+class ConnectionGuardMiddleware:
+    """Return connections a handler never closed (e.g. it raised mid-query) to the pool."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _request_conns.set([])
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            leaked = _request_conns.get()
+            _request_conns.reset(token)
+            for conn in leaked:
+                conn.pool.release(conn)
+
+# -------------- Async DB access --------------
+# async handlers must never touch sqlite3 on the event loop: they hand a function to a
+# dedicated thread pool via `await run_db(fn, ...)`. The number of queued + running calls
+# is bounded so a burst of slow writes applies backpressure instead of piling up threads.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE + 1)))  # readers + the writer
+DB_QUEUE_MAX = int(os.getenv("DB_QUEUE_MAX", "256"))              # queued + running calls
+DB_QUEUE_TIMEOUT = float(os.getenv("DB_QUEUE_TIMEOUT", "10"))     # seconds to wait for a queue slot
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25")) # event-loop lag sampling period
+
+class DBExecutor:
+    def __init__(self, workers: int = DB_EXECUTOR_WORKERS, queue_max: int = DB_QUEUE_MAX):
+        self.workers, self.queue_max = workers, queue_max
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(queue_max)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "rejected": 0, "in_flight": 0, "max_in_flight": 0,
+                      "queue_wait_seconds": 0.0, "run_seconds": 0.0}
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db")
+            return self._pool
+
+    async def _take_slot(self):
+        if self._slots.acquire(blocking=False):
+            return
+        # queue full: wait for a slot off the loop, give up after DB_QUEUE_TIMEOUT
+        ok = await asyncio.get_running_loop().run_in_executor(None, self._slots.acquire, True, DB_QUEUE_TIMEOUT)
+        if not ok:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Database busy, try again")
+
+    def _run(self, fn, args, kwargs, write, queued_at):
+        t0 = time.perf_counter()
+        conn = get_db(write=write)
+        try:
+            result = fn(conn, *args, **kwargs)
+            if write:
+                conn.commit()
+            return result
+        finally:
+            conn.close()                      # rolls back anything left uncommitted
+            with self._lock:
+                self.stats["queue_wait_seconds"] += t0 - queued_at
+                self.stats["run_seconds"] += time.perf_counter() - t0
+
+    async def run(self, fn, *args, write: bool = False, **kwargs):
+        await self._take_slot()
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+        try:
+            ctx = copy_context()              # keep request-scoped context (connection guard)
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor(), ctx.run, self._run, fn, args, kwargs, write, time.perf_counter())
+        finally:
+            with self._lock:
+                self.stats["in_flight"] -= 1
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "workers": self.workers, "queue_max": self.queue_max}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True)
+
+db_executor = DBExecutor()
+
+async def run_db(fn, *args, write: bool = False, **kwargs):
+    """
+    Run fn(conn, *args, **kwargs) on the DB executor and return its result. The connection is
+    borrowed and returned around the call; with write=True it is the writer and is committed
+    when fn returns (rolled back if it raises).
+    """
+    return await db_executor.run(fn, *args, write=write, **kwargs)
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up from a fixed sleep; any lag is time the loop was blocked."""
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, window: int = 1200):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.total_samples = 0
+        self._task = None
+
+    async def _watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - t0 - self.interval)
+            self.samples.append(lag)
+            self.total_samples += 1
+            self.max_lag = max(self.max_lag, lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        recent = sorted(self.samples)
+        pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))] * 1000, 3) if recent else None
+        return {"running": self._task is not None, "interval_ms": self.interval * 1000,
+                "samples": self.total_samples, "window": len(recent),
+                "lag_ms_p50": pick(0.50), "lag_ms_p99": pick(0.99),
+                "lag_ms_last": round(self.samples[-1] * 1000, 3) if recent else None,
+                "lag_ms_max": round(self.max_lag * 1000, 3)}
+
+loop_monitor = LoopLagMonitor()
+
+# -------------- Conditional GET --------------
+# app_meta.data_version is bumped by triggers on every write to the inventory tables, so what a
+# cacheable GET returns can only change when that number, the deployed code (build_id) or one of
+# the few other render inputs (render_state) does.
+# Those responses get ETag = build + render state + data version + URL: a matching If-None-Match is answered
+# 304 after a single-row read, and recent 200 bodies are served from a small LRU keyed the same way.
+DATA_TABLES = ("nodes", "containers", "items", "item_field_values", "item_types", "item_fields")
+
+def _data_version_trigger(tbl: str, op: str, on: str | None = None) -> str:
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS data_version_{tbl}_{op.lower()[:3]} AFTER {on or op} ON {tbl} BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'data_version';
+    END
+    """
+
+DATA_VERSION_SCHEMA = ["INSERT OR IGNORE INTO app_meta(key, value) VALUES ('data_version', 0)"]
+DATA_VERSION_SCHEMA += [_data_version_trigger(t, op) for t in DATA_TABLES for op in ("INSERT", "UPDATE", "DELETE")]
+
+ETAG_EXACT_PATHS = {"/", "/types", "/api/item-types", "/api/move-targets", "/api/sync"}
+ETAG_PATH_PREFIXES = ("/node/", "/container/", "/types/", "/api/items/", "/api/item-types/", "/api/containers/",
+                      "/api/scan/")
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+def _build_id() -> str:
+    """Fingerprint of the code, templates and static files (mtime + size), so a deploy changes every ETag."""
+    h = hashlib.sha1()
+    for name in ("app.py", "templates", "static"):
+        p = Path(BASE_DIR, name)
+        for f in sorted(p.rglob("*")) if p.is_dir() else [p]:
+            if f.is_file() and "dist" not in f.relative_to(BASE_DIR).parts:
+                st = f.stat()
+                h.update(f"{f.relative_to(BASE_DIR)}:{st.st_mtime_ns}:{st.st_size}".encode())
+    return h.hexdigest()[:12]
+
+_build_id_value = os.getenv("BUILD_ID")
+
+def build_id() -> str:
+    """BUILD_ID from the environment, else the code fingerprint (computed once, at startup or first use)."""
+    global _build_id_value
+    if _build_id_value is None:
+        _build_id_value = _build_id()
+    return _build_id_value
+
+def render_state() -> str:
+    """
+    Inputs of the cacheable pages that live outside the database and can change while the process
+    runs: whether the mkcert root has been exported (a background task after startup) and whether
+    the built asset manifest is in use yet. Part of every ETag.
+    """
+    return f"{int(has_mkcert_root())}{int(bool(_asset_manifest))}"
+
+def data_version(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM app_meta WHERE key='data_version'")
+    return cur.fetchone()[0]
+
+def etag_eligible(path: str) -> bool:
+    return (path in ETAG_EXACT_PATHS or path.startswith(ETAG_PATH_PREFIXES)) and not path.endswith(".png")
+
+class ResponseCache:
+    """Byte-bounded LRU of rendered 200 responses: url -> (etag, headers, body)."""
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+    def get(self, url: str, etag: str):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None or entry[0] != etag:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(url)
+            self.stats["hits"] += 1
+            return entry
+
+    def put(self, url: str, etag: str, headers: list, body: bytes):
+        if len(body) > self.max_bytes // 8:
+            return
+        with self._lock:
+            old = self._entries.pop(url, None)
+            if old is not None:
+                self._bytes -= len(old[2])
+            self._entries[url] = (etag, headers, body)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+response_cache = ResponseCache()
+
+class ConditionalGetMiddleware:
+    """ETag / If-None-Match for data-driven GETs (see etag_eligible), plus the rendered-response LRU."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] not in ("GET", "HEAD")
+                or not etag_eligible(scope["path"])):
+            return await self.app(scope, receive, send)
+
+        qs = scope.get("query_string", b"").decode("latin-1")
+        url = scope["path"] + (f"?{qs}" if qs else "")
+        version = await run_db(data_version)
+        etag = f'W/"{build_id()}-{render_state()}-{version}-{zlib.crc32(url.encode()):08x}"'
+        extra = [(b"etag", etag.encode()), (b"cache-control", b"no-cache")]
+
+        if etag_matches(Request(scope), etag):
+            response_cache.stats["not_modified"] += 1
+            await send({"type": "http.response.start", "status": 304, "headers": extra})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        is_get = scope["method"] == "GET"
+        hit = response_cache.get(url, etag) if is_get else None
+        if hit is not None:
+            await send({"type": "http.response.start", "status": 200, "headers": hit[1]})
+            await send({"type": "http.response.body", "body": hit[2]})
+            return
+
+        start, streamed = {}, False
+        async def send_wrapper(message):
+            nonlocal streamed
+            if message["type"] == "http.response.start":
+                if message["status"] == 200:
+                    headers = [(k, v) for k, v in message.get("headers", []) if k.lower() not in (b"etag", b"cache-control")]
+                    message = {**message, "headers": headers + extra}
+                start.update(message)
+            elif message["type"] == "http.response.body" and is_get and start.get("status") == 200:
+                if message.get("more_body"):
+                    streamed = True           # streamed responses pass through uncached
+                elif not streamed:
+                    response_cache.put(url, etag, start["headers"], message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# -------------- Change feed --------------
+# Triggers journal every write to the inventory into change_log: one compact row per change
+# with the '/'-joined ids of everything it sits under (for moves, the old place too), so a
+# subscriber watching any node or container can be matched with a substring test even after
+# the rows are gone. Types and bulk imports log global events (path NULL). One poller per process
+# reads new rows and fans them out to the SSE streams on /api/changes/stream.
+CHANGE_FEED_POLL = float(os.getenv("CHANGE_FEED_POLL", "0.5"))            # seconds between polls
+CHANGE_FEED_PING = 15                                                     # keep-alive comment interval
+CHANGE_FEED_BATCH = 500
+CHANGE_FEED_BACKLOG = 1000                # more missed events than this: the client is told to reload
+CHANGE_FEED_QUEUE = 1000
+CHANGE_LOG_RETENTION_DAYS = float(os.getenv("CHANGE_LOG_RETENTION_DAYS", "7"))
+CHANGE_LOG_PRUNE_INTERVAL = 600
+
+def _under_node(parent: str) -> str:
+    return (f"COALESCE((SELECT '/' || group_concat(ancestor_id, '/') FROM hierarchy "
+            f"WHERE kind='node' AND descendant_id={parent}), '')")
+
+def _under_container(cid: str) -> str:
+    return (f"COALESCE((SELECT '/' || group_concat(ancestor_id, '/') FROM hierarchy "
+            f"WHERE kind='container' AND descendant_id={cid}), '') || '/' || {cid} || '/'")
+
+_CHANGE_ROWS = {
+    # table: (kind, parent column, path of row r, data of row r)
+    "nodes": ("node", "parent_id", lambda r: f"{_under_node(f'{r}.parent_id')} || '/' || {r}.id || '/'",
+              lambda r: f"json_object('name', {r}.name, 'type', {r}.type, 'parent_id', {r}.parent_id, 'note', {r}.note)"),
+    "containers": ("container", "parent_id", lambda r: f"{_under_node(f'{r}.parent_id')} || '/' || {r}.id || '/'",
+                   lambda r: f"json_object('name', {r}.name, 'type', {r}.type, 'parent_id', {r}.parent_id, 'note', {r}.note)"),
+    "items": ("item", "container_id", lambda r: _under_container(f"{r}.container_id"),
+              lambda r: (f"json_object('name', {r}.name, 'qty', {r}.qty, 'note', {r}.note, "
+                         f"'container_id', {r}.container_id, 'type_id', {r}.type_id)")),
+}
+# item inserts and values written by the bulk importer are logged once per chunk instead, and the
+# items/values removed by cascade_delete are covered by their container's delete event
+_BULK_GUARD = "WHEN NOT EXISTS (SELECT 1 FROM search_deferred)"
+
+CHANGE_LOG_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS change_log(
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        kind TEXT NOT NULL,        -- node | container | item | type | inventory
+        op TEXT NOT NULL,          -- insert | update | move | delete | fields | bulk
+        ref_id TEXT,
+        path TEXT,                 -- '/A/B/C/' ids the row sits under; NULL = concerns every page
+        data TEXT                  -- compact JSON of the new row (NULL for deletes)
+    )
+    """,
+]
+
+def _change_log_update_trigger(tbl: str, on: str = "UPDATE") -> str:
+    kind, parent, path, data = _CHANGE_ROWS[tbl]
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_{tbl}_au AFTER {on} ON {tbl} BEGIN
+        INSERT INTO change_log(kind, op, ref_id, path, data) VALUES (
+            '{kind}', CASE WHEN new.{parent} IS NOT old.{parent} THEN 'move' ELSE 'update' END, new.id,
+            {path('new')} || CASE WHEN new.{parent} IS NOT old.{parent} THEN {path('old')} ELSE '' END,
+            {data('new')});
+    END
+    """
+
+# values removed along with their item (the foreign-key cascade of an item delete) are covered by
+# the item's own event; journaled alone they would find no container, i.e. a NULL path
+_VALUE_DELETE_GUARD = f"{_BULK_GUARD} AND EXISTS (SELECT 1 FROM items WHERE id = old.item_id)"
+
+def _change_log_values_trigger(op: str, guard: str = _BULK_GUARD, on: str | None = None) -> str:
+    ref = "old" if op == "DELETE" else "new"
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_values_{op.lower()[:3]} AFTER {on or op} ON item_field_values {guard} BEGIN
+        INSERT INTO change_log(kind, op, ref_id, path) VALUES ('item', 'fields', {ref}.item_id,
+            {_under_container(f"(SELECT container_id FROM items WHERE id={ref}.item_id)")});
+    END
+    """
+
+for _tbl, (_kind, _parent, _path, _data) in _CHANGE_ROWS.items():
+    _guard = _BULK_GUARD if _tbl == "items" else ""
+    CHANGE_LOG_SCHEMA += [f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_{_tbl}_ai AFTER INSERT ON {_tbl} {_guard} BEGIN
+        INSERT INTO change_log(kind, op, ref_id, path, data) VALUES ('{_kind}', 'insert', new.id, {_path('new')}, {_data('new')});
+    END
+    """, _change_log_update_trigger(_tbl), f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_{_tbl}_ad AFTER DELETE ON {_tbl} {_guard} BEGIN
+        INSERT INTO change_log(kind, op, ref_id, path) VALUES ('{_kind}', 'delete', old.id, {_path('old')});
+    END
+    """]
+for _op, _ref in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+    CHANGE_LOG_SCHEMA.append(_change_log_values_trigger(_op, _VALUE_DELETE_GUARD if _op == "DELETE" else _BULK_GUARD))
+    CHANGE_LOG_SCHEMA.append(f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_item_types_{_op.lower()[:3]} AFTER {_op} ON item_types BEGIN
+        INSERT INTO change_log(kind, op, ref_id) VALUES ('type', '{_op.lower()}', {_ref}.id);
+    END
+    """)
+    CHANGE_LOG_SCHEMA.append(f"""
+    CREATE TRIGGER IF NOT EXISTS change_log_item_fields_{_op.lower()[:3]} AFTER {_op} ON item_fields BEGIN
+        INSERT INTO change_log(kind, op, ref_id) VALUES ('type', 'update', {_ref}.type_id);
+    END
+    """)
+
+def log_bulk_change(conn):
+    """Journal one global event for a bulk write that paused the per-row triggers."""
+    conn.cursor().execute("INSERT INTO change_log(kind, op) VALUES ('inventory', 'bulk')")
+
+def latest_change_seq(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT seq FROM sqlite_sequence WHERE name='change_log'")
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def read_changes(conn, after: int, limit: int = CHANGE_FEED_BATCH, scope: str | None = None) -> list[dict]:
+    """Changes with seq > after, oldest first; with scope, only those under that node/container (plus global ones)."""
+    cur = conn.cursor()
+    where, params = "seq > ?", [after]
+    if scope:
+        where += " AND (path IS NULL OR instr(path, ?) > 0)"
+        params.append(f"/{scope}/")
+    cur.execute(f"SELECT seq, at, kind, op, ref_id, path, data FROM change_log WHERE {where} ORDER BY seq LIMIT ?",
+                (*params, limit))
+    return [{"seq": r["seq"], "at": r["at"], "kind": r["kind"], "op": r["op"], "id": r["ref_id"],
+             "path": r["path"], "data": json.loads(r["data"]) if r["data"] else None} for r in cur.fetchall()]
+
+def oldest_change_seq(conn) -> int | None:
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(seq) FROM change_log")
+    return cur.fetchone()[0]
+
+def prune_change_log(conn, retention_days: float = CHANGE_LOG_RETENTION_DAYS) -> int:
+    """Drop journal rows older than the retention period (seq and at grow together). Returns the count."""
+    cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM change_log WHERE seq < COALESCE(
+            (SELECT seq FROM change_log WHERE at >= ? ORDER BY seq LIMIT 1),
+            (SELECT MAX(seq) + 1 FROM change_log))
+    """, (int(time.time() - retention_days * 86400),))
+    return cur.rowcount
+
+class ChangeSubscriber:
+    def __init__(self, scope: str | None, seq: int):
+        self.needle = f"/{scope}/" if scope else None
+        self.seq = seq                        # last seq delivered (or covered by the page)
+        self.queue = asyncio.Queue(CHANGE_FEED_QUEUE)
+        self.overflowed = False
+
+    def wants(self, ev: dict) -> bool:
+        return self.needle is None or ev["path"] is None or self.needle in ev["path"]
+
+    def offer(self, ev: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(ev)
+        except asyncio.QueueFull:
+            self.overflowed = True            # too slow a reader: tell it to reload instead
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+class ChangeFeed:
+    """Polls change_log while anyone is subscribed and prunes it periodically."""
+    def __init__(self, interval: float = CHANGE_FEED_POLL):
+        self.interval = interval
+        self.subscribers = set()
+        self.last = None                      # newest seq fanned out
+        self._task = None
+        self._pruned_at = 0.0
+        self.stats = {"polls": 0, "events": 0, "pruned": 0, "errors": 0}
+
+    async def subscribe(self, scope: str | None) -> ChangeSubscriber:
+        if self.last is None:
+            self.last = await run_db(latest_change_seq)
+        sub = ChangeSubscriber(scope, self.last)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: ChangeSubscriber):
+        self.subscribers.discard(sub)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if time.monotonic() - self._pruned_at > CHANGE_LOG_PRUNE_INTERVAL:
+                    self._pruned_at = time.monotonic()
+                    self.stats["pruned"] += await run_db(prune_change_log, write=True)
+                    await run_db(prune_tombstones, write=True)
+                if not self.subscribers:
+                    self.last = None          # re-read on the next subscribe
+                    continue
+                self.stats["polls"] += 1
+                while True:
+                    events = await run_db(read_changes, self.last)
+                    for ev in events:
+                        self.last = ev["seq"]
+                        for sub in list(self.subscribers):
+                            if sub.wants(ev):
+                                sub.offer(ev)
+                    self.stats["events"] += len(events)
+                    if len(events) < CHANGE_FEED_BATCH:
+                        break
+            except sqlite3.OperationalError:
+                pass                          # e.g. database busy: try again next tick
+            except Exception:
+                self.stats["errors"] += 1
+                log.exception("change feed poll failed")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "subscribers": len(self.subscribers), "last_seq": self.last}
+
+change_feed = ChangeFeed()
+
+def _sse(ev: dict) -> str:
+    payload = {k: ev[k] for k in ("seq", "at", "kind", "op", "id", "data")}
+    return f"id: {ev['seq']}\nevent: change\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+# -------------- Delta sync --------------
+# Offline clients keep a replica and ask GET /api/sync?since=<cursor> for what changed. Every row
+# of nodes, containers, items and item_field_values carries a row_version, stamped by triggers from
+# one monotonic counter (app_meta.row_version) in the writing transaction; deletes leave a tombstone
+# under a fresh version. Bulk writers that pause the per-row triggers (importer, cascade_delete)
+# claim a block of versions and stamp the rows set-based instead.
+SYNC_PAGE_ROWS = 5000
+SYNC_MAX_PAGE_ROWS = 20000
+SYNC_TOMBSTONE_RETENTION_DAYS = float(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "30"))
+# The data columns of the synced tables. Update triggers on these tables are declared UPDATE OF
+# them (migration 12 recreates the older plain AFTER UPDATE ones), so stamping row_version is not
+# itself seen as a change.
+DATA_COLUMNS = {
+    "nodes": ("id", "type", "name", "parent_id", "note"),
+    "containers": ("id", "type", "name", "parent_id", "note"),
+    "items": ("id", "container_id", "name", "qty", "note", "type_id"),
+    "item_field_values": ("item_id", "field_id", "value"),
+}
+SYNC_TABLES = {
+    # table: (tombstone kind, key in the response)
+    "nodes": ("node", "nodes"),
+    "containers": ("container", "containers"),
+    "items": ("item", "items"),
+    "item_field_values": ("value", "values"),
+}
+_ROW_VERSION = "(SELECT value FROM app_meta WHERE key = 'row_version')"
+
+def _on_update(tbl: str) -> str:
+    return f"UPDATE OF {', '.join(DATA_COLUMNS[tbl])}"
+_NEXT_ROW_VERSION = "UPDATE app_meta SET value = value + 1 WHERE key = 'row_version';"
+
+ROW_VERSION_SCHEMA = [
+    "INSERT OR IGNORE INTO app_meta(key, value) VALUES ('row_version', 0)",
+    "INSERT OR IGNORE INTO app_meta(key, value) VALUES ('sync_floor', 0)",   # newest pruned tombstone
+    """
+    CREATE TABLE IF NOT EXISTS sync_tombstones(
+        row_version INTEGER PRIMARY KEY,
+        at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        kind TEXT NOT NULL,        -- node | container | item | value
+        ref_id TEXT NOT NULL,      -- for values: the item id
+        field_id TEXT              -- values only
+    )
+    """,
+]
+for _tbl, (_kind, _) in SYNC_TABLES.items():
+    _ins_guard = _BULK_GUARD if _tbl in ("items", "item_field_values") else ""
+    # cascade_delete buries its items in bulk; values deleted along with their item need no tombstone
+    _del_guard = {"items": _BULK_GUARD,
+                  "item_field_values": f"{_BULK_GUARD} AND EXISTS (SELECT 1 FROM items WHERE id = old.item_id)"}.get(_tbl, "")
+    _ref, _field = ("old.item_id", "old.field_id") if _tbl == "item_field_values" else ("old.id", "NULL")
+    ROW_VERSION_SCHEMA += [
+        f"CREATE INDEX IF NOT EXISTS idx_{_tbl}_row_version ON {_tbl}(row_version)",
+        f"""
+    CREATE TRIGGER IF NOT EXISTS row_version_{_tbl}_ai AFTER INSERT ON {_tbl} {_ins_guard} BEGIN
+        {_NEXT_ROW_VERSION}
+        UPDATE {_tbl} SET row_version = {_ROW_VERSION} WHERE rowid = new.rowid;
+    END
+    """, f"""
+    CREATE TRIGGER IF NOT EXISTS row_version_{_tbl}_au AFTER {_on_update(_tbl)} ON {_tbl} BEGIN
+        {_NEXT_ROW_VERSION}
+        UPDATE {_tbl} SET row_version = {_ROW_VERSION} WHERE rowid = new.rowid;
+    END
+    """, f"""
+    CREATE TRIGGER IF NOT EXISTS row_version_{_tbl}_ad AFTER DELETE ON {_tbl} {_del_guard} BEGIN
+        {_NEXT_ROW_VERSION}
+        INSERT INTO sync_tombstones(row_version, kind, ref_id, field_id) VALUES ({_ROW_VERSION}, '{_kind}', {_ref}, {_field});
+    END
+    """]
+
+def _claim_row_versions(cur, n: int):
+    """Advance the counter past n versions already handed out as row_version = counter + 1 .. counter + n."""
+    if n:
+        cur.execute("UPDATE app_meta SET value = value + ? WHERE key = 'row_version'", (n,))
+
+def stamp_item_versions(conn, first_id: int, last_id: int):
+    """Version items first_id..last_id and their values (for writers that paused the item triggers)."""
+    cur = conn.cursor()
+    cur.execute(f"UPDATE items SET row_version = {_ROW_VERSION} + id - ? + 1 WHERE id BETWEEN ? AND ?",
+                (first_id, first_id, last_id))
+    _claim_row_versions(cur, last_id - first_id + 1)
+    cur.execute("SELECT MIN(rowid), MAX(rowid) FROM item_field_values WHERE item_id BETWEEN ? AND ?", (first_id, last_id))
+    lo, hi = cur.fetchone()
+    if lo is not None:
+        cur.execute(f"UPDATE item_field_values SET row_version = {_ROW_VERSION} + rowid - ? + 1 WHERE item_id BETWEEN ? AND ?",
+                    (lo, first_id, last_id))
+        _claim_row_versions(cur, hi - lo + 1)
+
+def bury_items(conn, containers_sql: str):
+    """Tombstone every item in the containers selected by containers_sql, in one statement (before deleting them)."""
+    cur = conn.cursor()
+    cur.execute(f"""
+        INSERT INTO sync_tombstones(row_version, kind, ref_id)
+        SELECT {_ROW_VERSION} + row_number() OVER (ORDER BY id), 'item', id
+        FROM items WHERE container_id IN ({containers_sql})
+    """)
+    _claim_row_versions(cur, cur.rowcount)
+
+def prune_tombstones(conn, retention_days: float = SYNC_TOMBSTONE_RETENTION_DAYS) -> int:
+    """Drop tombstones older than the retention period; replicas synced before them must start over."""
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(row_version) FROM sync_tombstones WHERE at < ?", (int(time.time() - retention_days * 86400),))
+    floor = cur.fetchone()[0]
+    if floor is None:
+        return 0
+    cur.execute("DELETE FROM sync_tombstones WHERE row_version <= ?", (floor,))
+    pruned = cur.rowcount
+    cur.execute("UPDATE app_meta SET value = MAX(value, ?) WHERE key = 'sync_floor'", (floor,))
+    return pruned
+
+def parse_sync_cursor(cursor: str) -> tuple[int, int | None]:
+    """(version, floor) from a `next` cursor; floor is only set inside a full sync (ValueError if malformed)."""
+    version, sep, floor = str(cursor).partition(":")
+    return int(version), int(floor) if sep else None
+
+def read_sync(conn, cursor: str, limit: int = SYNC_PAGE_ROWS) -> dict:
+    """
+    One page of changes after the version in `cursor`, oldest first, read from a single snapshot:
+    the upserted rows per table (as arrays in "columns" order) and the deleted keys per kind. `next`
+    is the cursor for the following call; `reset` means the replica must be dropped and this is a
+    full sync (cursor 0, or tombstones it would need have been pruned). The cursors inside a full
+    sync also carry the prune floor it started under: their versions may lie below the floor, and
+    they stay valid as long as no tombstones were pruned since.
+    """
+    since, started = parse_sync_cursor(cursor)
+    cur = conn.cursor()
+    cur.execute("BEGIN")                  # rows, tombstones and head from the same snapshot
+    try:
+        cur.execute("SELECT key, value FROM app_meta WHERE key IN ('row_version', 'sync_floor', 'types_version')")
+        meta = {r[0]: r[1] for r in cur.fetchall()}
+        head, floor = meta.get("row_version", 0), meta.get("sync_floor", 0)
+        reset = since <= 0 or since > head or (since < floor and started != floor)
+        if reset:
+            since = 0
+        # up to limit + 1 rows per source: the merged page is the first `limit` of them by version
+        page = []
+        for tbl, (_, key) in SYNC_TABLES.items():
+            cur.execute(f"""
+                SELECT row_version, {', '.join(DATA_COLUMNS[tbl])} FROM {tbl}
+                WHERE row_version > ? ORDER BY row_version LIMIT ?
+            """, (since, limit + 1))
+            page += [(r[0], key, list(r)[1:]) for r in cur.fetchall()]
+        if not reset:
+            cur.execute("""
+                SELECT row_version, kind, ref_id, field_id FROM sync_tombstones
+                WHERE row_version > ? ORDER BY row_version LIMIT ?
+            """, (since, limit + 1))
+            page += [(r[0], "deleted", (r[1], r[2], r[3])) for r in cur.fetchall()]
+    finally:
+        conn.rollback()
+    page.sort(key=lambda e: e[0])
+    more = len(page) > limit
+    page = page[:limit]
+
+    if not more:
+        nxt = str(head)
+    elif reset or started is not None:
+        nxt = f"{page[-1][0]}:{floor if reset else started}"
+    else:
+        nxt = str(page[-1][0])
+    out = {"since": since, "next": nxt, "more": more, "reset": reset,
+           "types_version": meta.get("types_version", 0),
+           "columns": {key: list(DATA_COLUMNS[tbl]) for tbl, (_, key) in SYNC_TABLES.items()},
+           **{key: [] for _, key in SYNC_TABLES.values()},
+           "deleted": {kind: [] for kind, _ in SYNC_TABLES.values()}}
+    for _, key, row in page:
+        if key != "deleted":
+            out[key].append(row)
+            continue
+        kind, ref, field = row
+        out["deleted"][kind].append(int(ref) if kind == "item" else [int(ref), field] if kind == "value" else ref)
+    return out
+
+# -------------- Search index --------------
+# One FTS5 document per node, container and item (item body = note + dynamic values).
+# search_docs maps FTS rowids back to entities; triggers keep both in sync on every write.
+SEARCH_SCHEMA = [                         # migration 3
+    """
+    CREATE TABLE IF NOT EXISTS search_docs(
+        doc_id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,        -- node | container | item
+        ref_id NOT NULL,           -- nodes.id | containers.id | items.id
+        cont_id TEXT,              -- owning container (items only)
+        UNIQUE(kind, ref_id)
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+        name, body, tokenize="unicode61 remove_diacritics 2", prefix='2 3'
+    )
+    """,
+    # nodes: name only
+    """
+    CREATE TRIGGER IF NOT EXISTS search_nodes_ai AFTER INSERT ON nodes BEGIN
+        INSERT INTO search_docs(kind, ref_id) VALUES ('node', new.id);
+        INSERT INTO search_fts(rowid, name, body)
+        VALUES ((SELECT doc_id FROM search_docs WHERE kind='node' AND ref_id=new.id), new.name, '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_nodes_au AFTER UPDATE OF name ON nodes BEGIN
+        UPDATE search_fts SET name=new.name
+         WHERE rowid=(SELECT doc_id FROM search_docs WHERE kind='node' AND ref_id=new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_nodes_ad AFTER DELETE ON nodes BEGIN
+        DELETE FROM search_fts WHERE rowid=(SELECT doc_id FROM search_docs WHERE kind='node' AND ref_id=old.id);
+        DELETE FROM search_docs WHERE kind='node' AND ref_id=old.id;
+    END
+    """,
+    # containers: name + type
+    """
+    CREATE TRIGGER IF NOT EXISTS search_containers_ai AFTER INSERT ON containers BEGIN
+        INSERT INTO search_docs(kind, ref_id) VALUES ('container', new.id);
+        INSERT INTO search_fts(rowid, name, body)
+        VALUES ((SELECT doc_id FROM search_docs WHERE kind='container' AND ref_id=new.id), new.name, new.type);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_containers_au AFTER UPDATE OF name, type ON containers BEGIN
+        UPDATE search_fts SET name=new.name, body=new.type
+         WHERE rowid=(SELECT doc_id FROM search_docs WHERE kind='container' AND ref_id=new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_containers_ad AFTER DELETE ON containers BEGIN
+        DELETE FROM search_fts WHERE rowid=(SELECT doc_id FROM search_docs WHERE kind='container' AND ref_id=old.id);
+        DELETE FROM search_docs WHERE kind='container' AND ref_id=old.id;
+    END
+    """,
+    # items: name, note + dynamic field values
+    """
+    CREATE TRIGGER IF NOT EXISTS search_items_ai AFTER INSERT ON items BEGIN
+        INSERT INTO search_docs(kind, ref_id, cont_id) VALUES ('item', new.id, new.container_id);
+        INSERT INTO search_fts(rowid, name, body)
+        VALUES ((SELECT doc_id FROM search_docs WHERE kind='item' AND ref_id=new.id), new.name,
+                COALESCE(new.note, '') || ' ' ||
+                COALESCE((SELECT group_concat(value, ' ') FROM item_field_values WHERE item_id=new.id), ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_items_au AFTER UPDATE OF name, note, container_id ON items BEGIN
+        UPDATE search_docs SET cont_id=new.container_id WHERE kind='item' AND ref_id=new.id;
+        UPDATE search_fts
+           SET name=new.name,
+               body=COALESCE(new.note, '') || ' ' ||
+                    COALESCE((SELECT group_concat(value, ' ') FROM item_field_values WHERE item_id=new.id), '')
+         WHERE rowid=(SELECT doc_id FROM search_docs WHERE kind='item' AND ref_id=new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_items_ad AFTER DELETE ON items BEGIN
+        DELETE FROM search_fts WHERE rowid=(SELECT doc_id FROM search_docs WHERE kind='item' AND ref_id=old.id);
+        DELETE FROM search_docs WHERE kind='item' AND ref_id=old.id;
+    END
+    """,
+]
+
+def _search_values_trigger(op: str, guard: str = "", on: str | None = None) -> str:
+    """item_field_values: refresh the owning item's body on any change."""
+    ref = "old" if op == "DELETE" else "new"
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS search_values_{op.lower()[:3]} AFTER {on or op} ON item_field_values {guard} BEGIN
+        UPDATE search_fts
+           SET body=(SELECT COALESCE(i.note, '') || ' ' ||
+                            COALESCE((SELECT group_concat(value, ' ') FROM item_field_values WHERE item_id=i.id), '')
+                       FROM items i WHERE i.id={ref}.item_id)
+         WHERE rowid=(SELECT doc_id FROM search_docs WHERE kind='item' AND ref_id={ref}.item_id);
+    END
+    """
+
+SEARCH_SCHEMA += [_search_values_trigger(op) for op in ("INSERT", "UPDATE", "DELETE")]
+
+# migration 7: a row in search_deferred (only ever inside a bulk-write transaction) pauses the
+# per-row item triggers; the writer then indexes its rows set-based with search_index_items()
+_SEARCH_GUARD = "WHEN NOT EXISTS (SELECT 1 FROM search_deferred)"
+SEARCH_BULK_GUARD_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS search_deferred(flag INTEGER)",
+    f"""
+    CREATE TRIGGER IF NOT EXISTS search_items_ai AFTER INSERT ON items
+    {_SEARCH_GUARD} BEGIN
+        INSERT INTO search_docs(kind, ref_id, cont_id) VALUES ('item', new.id, new.container_id);
+        INSERT INTO search_fts(rowid, name, body)
+        VALUES ((SELECT doc_id FROM search_docs WHERE kind='item' AND ref_id=new.id), new.name,
+                COALESCE(new.note, '') || ' ' ||
+                COALESCE((SELECT group_concat(value, ' ') FROM item_field_values WHERE item_id=new.id), ''));
+    END
+    """,
+] + [_search_values_trigger(op, _SEARCH_GUARD) for op in ("INSERT", "UPDATE", "DELETE")]
+
+# migration 9: name/note edits rewrite the FTS row, a move only re-points the document
+SEARCH_ITEM_MOVES_SCHEMA = [
+    """
+    CREATE TRIGGER IF NOT EXISTS search_items_au AFTER UPDATE OF name, note ON items
+    WHEN new.name IS NOT old.name OR new.note IS NOT old.note BEGIN
+        UPDATE search_fts
+           SET name=new.name,
+               body=COALESCE(new.note, '') || ' ' ||
+                    COALESCE((SELECT group_concat(value, ' ') FROM item_field_values WHERE item_id=new.id), '')
+         WHERE rowid=(SELECT doc_id FROM search_docs WHERE kind='item' AND ref_id=new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_items_move AFTER UPDATE OF container_id ON items
+    WHEN new.container_id IS NOT old.container_id BEGIN
+        UPDATE search_docs SET cont_id=new.container_id WHERE kind='item' AND ref_id=new.id;
+    END
+    """,
+]
+
+SEARCH_MAX_HITS = 500
+
+def rebuild_search_index(conn) -> int:
+    """Re-index every node, container and item from scratch. Returns the number of documents."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM search_fts")
+    cur.execute("DELETE FROM search_docs")
+    cur.execute("INSERT INTO search_docs(kind, ref_id) SELECT 'node', id FROM nodes")
+    cur.execute("INSERT INTO search_docs(kind, ref_id) SELECT 'container', id FROM containers")
+    cur.execute("INSERT INTO search_docs(kind, ref_id, cont_id) SELECT 'item', id, container_id FROM items")
+    cur.execute("""
+        INSERT INTO search_fts(rowid, name, body)
+        SELECT d.doc_id, n.name, '' FROM search_docs d JOIN nodes n ON n.id=d.ref_id WHERE d.kind='node'
+    """)
+    cur.execute("""
+        INSERT INTO search_fts(rowid, name, body)
+        SELECT d.doc_id, c.name, c.type FROM search_docs d JOIN containers c ON c.id=d.ref_id WHERE d.kind='container'
+    """)
+    cur.execute("""
+        INSERT INTO search_fts(rowid, name, body)
+        SELECT d.doc_id, i.name, COALESCE(i.note, '') || ' ' || COALESCE(v.vals, '')
+        FROM search_docs d
+        JOIN items i ON i.id=d.ref_id
+        LEFT JOIN (SELECT item_id, group_concat(value, ' ') AS vals
+                   FROM item_field_values GROUP BY item_id) v ON v.item_id=i.id
+        WHERE d.kind='item'
+    """)
+    cur.execute("INSERT INTO search_fts(search_fts) VALUES ('optimize')")
+    cur.execute("SELECT COUNT(*) FROM search_docs")
+    return cur.fetchone()[0]
+
+def search_index_items(conn, first_id: int, last_id: int):
+    """Index items first_id..last_id in two statements (for writers that paused the item triggers)."""
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO search_docs(kind, ref_id, cont_id)
+        SELECT 'item', id, container_id FROM items WHERE id BETWEEN ? AND ?
+    """, (first_id, last_id))
+    cur.execute("""
+        INSERT INTO search_fts(rowid, name, body)
+        SELECT d.doc_id, i.name,
+               COALESCE(i.note, '') || ' ' ||
+               COALESCE((SELECT group_concat(value, ' ') FROM item_field_values WHERE item_id=i.id), '')
+        FROM search_docs d JOIN items i ON i.id=d.ref_id
+        WHERE d.kind='item' AND d.ref_id BETWEEN ? AND ?
+    """, (first_id, last_id))
+
+def fts_query(q: str) -> str:
+    """Turn free text into an FTS5 query: every word must match as a prefix."""
+    terms = re.findall(r"\w+", q or "")
+    return " ".join(f'"{t}"*' for t in terms)
+
+def search_inventory(conn, q: str, limit: int = SEARCH_MAX_HITS):
+    """
+    Ranked global search. Returns (containers, matched_items):
+      - containers: rows of c.* + parent/top names, best match first
+      - matched_items: {container_id: [item rows]} for item hits
+    """
+    match = fts_query(q)
+    if not match:
+        return [], {}
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT d.kind, d.ref_id, d.cont_id, h.rank
+        FROM (SELECT rowid, rank FROM search_fts WHERE search_fts MATCH ? ORDER BY rank LIMIT ?) h
+        JOIN search_docs d ON d.doc_id = h.rowid
+        ORDER BY h.rank
+    """, (match, limit))
+
+    score, item_ids, node_score = {}, [], {}
+    for h in cur.fetchall():
+        if h["kind"] == "node":
+            node_score[h["ref_id"]] = h["rank"]
+            continue
+        cid = h["ref_id"] if h["kind"] == "container" else h["cont_id"]
+        if h["kind"] == "item":
+            item_ids.append(h["ref_id"])
+        score.setdefault(cid, h["rank"])   # hits arrive best-first
+
+    # a node hit matches every container below it, at any depth
+    if node_score:
+        ph = ",".join("?" * len(node_score))
+        cur.execute(f"""
+            SELECT descendant_id AS id, ancestor_id AS nid FROM hierarchy
+            WHERE ancestor_id IN ({ph}) AND kind='container'
+        """, list(node_score))
+        for r in cur.fetchall():
+            s = node_score[r["nid"]]
+            score[r["id"]] = min(score.get(r["id"], s), s)
+
+    if not score:
+        return [], {}
+    ph = ",".join("?" * len(score))
+    cur.execute(f"""
+        SELECT c.*, p.name AS parent_name, p.type AS parent_type, t.name AS top_name, t.id AS top_id
+        FROM containers c
+        JOIN nodes p ON p.id=c.parent_id
+        LEFT JOIN hierarchy h ON h.kind='container' AND h.descendant_id=c.id AND h.depth > 1
+        LEFT JOIN nodes t ON t.id=h.ancestor_id
+        WHERE c.id IN ({ph}) AND (h.ancestor_id IS NULL OR t.parent_id IS NULL)
+    """, list(score))
+    results = sorted(cur.fetchall(),
+                     key=lambda r: (score[r["id"]], r["top_name"] or "", r["parent_name"], r["name"]))
+
+    matched_items = {}
+    if item_ids:
+        ph = ",".join("?" * len(item_ids))
+        cur.execute(f"""
+            SELECT id AS item_id, name, qty, note, container_id AS cont_id
+            FROM items WHERE id IN ({ph})
+            ORDER BY id DESC
+        """, item_ids)
+        for row in cur.fetchall():
+            matched_items.setdefault(row["cont_id"], []).append(row)
+    return results, matched_items
+
+
+# -------------- Hierarchy (closure table) --------------
+# One row per (ancestor node, descendant) pair at any depth, including a depth-0 self row for
+# every node. Containers appear only as descendants. Kept in sync by triggers, so ancestors,
+# subtrees and subtree counts are single indexed lookups whatever the depth of the tree.
+HIERARCHY_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS hierarchy(
+        ancestor_id TEXT NOT NULL,     -- nodes.id
+        descendant_id TEXT NOT NULL,   -- nodes.id | containers.id
+        kind TEXT NOT NULL,            -- node | container
+        depth INTEGER NOT NULL,
+        PRIMARY KEY (ancestor_id, kind, descendant_id)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_hierarchy_descendant ON hierarchy(kind, descendant_id, depth)",
+    """
+    CREATE TRIGGER IF NOT EXISTS hierarchy_nodes_ai AFTER INSERT ON nodes BEGIN
+        INSERT INTO hierarchy(ancestor_id, descendant_id, kind, depth) VALUES (new.id, new.id, 'node', 0);
+        INSERT INTO hierarchy(ancestor_id, descendant_id, kind, depth)
+        SELECT ancestor_id, new.id, 'node', depth + 1
+        FROM hierarchy WHERE kind='node' AND descendant_id=new.parent_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS hierarchy_nodes_ad AFTER DELETE ON nodes BEGIN
+        DELETE FROM hierarchy WHERE kind='node' AND descendant_id=old.id;
+        DELETE FROM hierarchy WHERE ancestor_id=old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS hierarchy_nodes_no_cycle BEFORE UPDATE OF parent_id ON nodes
+    WHEN new.parent_id IS NOT NULL AND EXISTS (
+        SELECT 1 FROM hierarchy WHERE ancestor_id=new.id AND kind='node' AND descendant_id=new.parent_id
+    ) BEGIN
+        SELECT RAISE(ABORT, 'a node cannot be moved below itself');
+    END
+    """,
+    # re-parenting a node moves its whole subtree: drop the links to the old ancestors,
+    # then link every subtree row to every ancestor of the new parent
+    """
+    CREATE TRIGGER IF NOT EXISTS hierarchy_nodes_move AFTER UPDATE OF parent_id ON nodes
+    WHEN new.parent_id IS NOT old.parent_id BEGIN
+        DELETE FROM hierarchy
+         WHERE (kind, descendant_id) IN (SELECT kind, descendant_id FROM hierarchy WHERE ancestor_id=new.id)
+           AND ancestor_id IN (SELECT ancestor_id FROM hierarchy
+                                WHERE kind='node' AND descendant_id=new.id AND depth > 0);
+        INSERT INTO hierarchy(ancestor_id, descendant_id, kind, depth)
+        SELECT a.ancestor_id, s.descendant_id, s.kind, a.depth + s.depth + 1
+        FROM hierarchy a, hierarchy s
+        WHERE a.kind='node' AND a.descendant_id=new.parent_id AND s.ancestor_id=new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS hierarchy_containers_ai AFTER INSERT ON containers BEGIN
+        INSERT INTO hierarchy(ancestor_id, descendant_id, kind, depth)
+        SELECT ancestor_id, new.id, 'container', depth + 1
+        FROM hierarchy WHERE kind='node' AND descendant_id=new.parent_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS hierarchy_containers_ad AFTER DELETE ON containers BEGIN
+        DELETE FROM hierarchy WHERE kind='container' AND descendant_id=old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS hierarchy_containers_move AFTER UPDATE OF parent_id ON containers
+    WHEN new.parent_id IS NOT old.parent_id BEGIN
+        DELETE FROM hierarchy WHERE kind='container' AND descendant_id=new.id;
+        INSERT INTO hierarchy(ancestor_id, descendant_id, kind, depth)
+        SELECT ancestor_id, new.id, 'container', depth + 1
+        FROM hierarchy WHERE kind='node' AND descendant_id=new.parent_id;
+    END
+    """,
+]
+
+def rebuild_hierarchy(conn) -> int:
+    """Recompute the closure table from nodes.parent_id / containers.parent_id. Returns the row count."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM hierarchy")
+    cur.execute("""
+        INSERT INTO hierarchy(ancestor_id, descendant_id, kind, depth)
+        WITH RECURSIVE up(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM nodes
+            UNION ALL
+            SELECT n.parent_id, up.descendant_id, up.depth + 1
+            FROM up JOIN nodes n ON n.id = up.ancestor_id
+            WHERE n.parent_id IS NOT NULL
+        )
+        SELECT ancestor_id, descendant_id, 'node', depth FROM up
+    """)
+    cur.execute("""
+        INSERT INTO hierarchy(ancestor_id, descendant_id, kind, depth)
+        SELECT h.ancestor_id, c.id, 'container', h.depth + 1
+        FROM containers c JOIN hierarchy h ON h.kind='node' AND h.descendant_id=c.parent_id
+    """)
+    cur.execute("SELECT COUNT(*) FROM hierarchy")
+    return cur.fetchone()[0]
+
+def ancestors_of(conn, kind: str, ref_id: str):
+    """Node rows above a node/container, root first (the node itself is not included)."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT n.* FROM hierarchy h JOIN nodes n ON n.id = h.ancestor_id
+        WHERE h.kind=? AND h.descendant_id=? AND h.depth > 0
+        ORDER BY h.depth DESC
+    """, (kind, ref_id))
+    return cur.fetchall()
+
+
+# -------------- Count aggregates --------------
+# node_counts holds subtree totals per node (child shelves/drawers, containers by type, items,
+# total qty); container_counts holds items/qty per container. Both are kept exact by triggers in
+# the writing transaction, so the map and node pages read them instead of aggregating.
+NODE_TYPE_COLS = {"Shelf": "shelves", "Drawer": "drawers"}
+CONTAINER_TYPE_COLS = {"Box": "boxes", "Organizator": "organizators", "InPlace": "inplace"}
+NODE_COUNT_COLS = [*NODE_TYPE_COLS.values(), *CONTAINER_TYPE_COLS.values(), "containers", "items", "qty"]
+
+def _bump_ancestors(kind: str, ref: str, deltas: dict, sign: str) -> str:
+    """Trigger statement adding/subtracting `deltas` on every node at or above `ref` (a node or container id)."""
+    sets = ", ".join(f"{col} = {col} {sign} ({expr})" for col, expr in deltas.items())
+    return (f"UPDATE node_counts SET {sets} WHERE node_id IN "
+            f"(SELECT ancestor_id FROM hierarchy WHERE kind='{kind}' AND descendant_id={ref});")
+
+def _node_deltas(r: str) -> dict:
+    # a node carries its own subtree plus itself (if it is a Shelf/Drawer)
+    deltas = {col: f"SELECT {col} FROM node_counts WHERE node_id={r}.id" for col in NODE_COUNT_COLS}
+    for typ, col in NODE_TYPE_COLS.items():
+        deltas[col] = f"({deltas[col]}) + ({r}.type = '{typ}')"
+    return deltas
+
+def _container_deltas(r: str) -> dict:
+    deltas = {col: f"{r}.type = '{typ}'" for typ, col in CONTAINER_TYPE_COLS.items()}
+    deltas["containers"] = "1"
+    deltas["items"] = f"SELECT items FROM container_counts WHERE container_id={r}.id"
+    deltas["qty"] = f"SELECT qty FROM container_counts WHERE container_id={r}.id"
+    return deltas
+
+def _item_deltas(r: str) -> dict:
+    return {"items": "1", "qty": f"COALESCE({r}.qty, 0)"}
+
+COUNTS_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS node_counts(
+        node_id TEXT PRIMARY KEY,
+        {", ".join(f"{col} INTEGER NOT NULL DEFAULT 0" for col in NODE_COUNT_COLS)}
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS container_counts(
+        container_id TEXT PRIMARY KEY,
+        items INTEGER NOT NULL DEFAULT 0,
+        qty INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_nodes_ai AFTER INSERT ON nodes BEGIN
+        INSERT INTO node_counts(node_id) VALUES (new.id);
+        {_bump_ancestors("node", "new.parent_id", _node_deltas("new"), "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_nodes_ad AFTER DELETE ON nodes BEGIN
+        {_bump_ancestors("node", "old.parent_id", _node_deltas("old"), "-")}
+        DELETE FROM node_counts WHERE node_id=old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_nodes_au AFTER UPDATE OF parent_id, type ON nodes BEGIN
+        {_bump_ancestors("node", "old.parent_id", _node_deltas("old"), "-")}
+        {_bump_ancestors("node", "new.parent_id", _node_deltas("new"), "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_containers_ai AFTER INSERT ON containers BEGIN
+        INSERT INTO container_counts(container_id) VALUES (new.id);
+        {_bump_ancestors("node", "new.parent_id", _container_deltas("new"), "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_containers_ad AFTER DELETE ON containers BEGIN
+        {_bump_ancestors("node", "old.parent_id", _container_deltas("old"), "-")}
+        DELETE FROM container_counts WHERE container_id=old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_containers_au AFTER UPDATE OF parent_id, type ON containers BEGIN
+        {_bump_ancestors("node", "old.parent_id", _container_deltas("old"), "-")}
+        {_bump_ancestors("node", "new.parent_id", _container_deltas("new"), "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_items_ai AFTER INSERT ON items BEGIN
+        UPDATE container_counts SET items = items + 1, qty = qty + COALESCE(new.qty, 0)
+         WHERE container_id=new.container_id;
+        {_bump_ancestors("container", "new.container_id", _item_deltas("new"), "+")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_items_ad AFTER DELETE ON items BEGIN
+        UPDATE container_counts SET items = items - 1, qty = qty - COALESCE(old.qty, 0)
+         WHERE container_id=old.container_id;
+        {_bump_ancestors("container", "old.container_id", _item_deltas("old"), "-")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS counts_items_au AFTER UPDATE OF container_id, qty ON items BEGIN
+        UPDATE container_counts SET items = items - 1, qty = qty - COALESCE(old.qty, 0)
+         WHERE container_id=old.container_id;
+        UPDATE container_counts SET items = items + 1, qty = qty + COALESCE(new.qty, 0)
+         WHERE container_id=new.container_id;
+        {_bump_ancestors("container", "old.container_id", _item_deltas("old"), "-")}
+        {_bump_ancestors("container", "new.container_id", _item_deltas("new"), "+")}
+    END
+    """,
+]
+
+# What the tables should contain, computed from scratch (used by rebuild and check)
+EXPECTED_CONTAINER_COUNTS = """
+    SELECT c.id AS container_id, COUNT(i.id) AS items, COALESCE(SUM(COALESCE(i.qty, 0)), 0) AS qty
+    FROM containers c LEFT JOIN items i ON i.container_id = c.id
+    GROUP BY c.id
+"""
+EXPECTED_NODE_COUNTS = f"""
+    WITH cc AS ({EXPECTED_CONTAINER_COUNTS}),
+    nd AS (
+        SELECT h.ancestor_id AS nid,
+               {", ".join(f"SUM(d.type = '{typ}') AS {col}" for typ, col in NODE_TYPE_COLS.items())}
+        FROM hierarchy h JOIN nodes d ON d.id = h.descendant_id
+        WHERE h.kind = 'node' AND h.depth > 0
+        GROUP BY h.ancestor_id
+    ),
+    cd AS (
+        SELECT h.ancestor_id AS nid,
+               {", ".join(f"SUM(c.type = '{typ}') AS {col}" for typ, col in CONTAINER_TYPE_COLS.items())},
+               COUNT(*) AS containers, SUM(cc.items) AS items, SUM(cc.qty) AS qty
+        FROM hierarchy h JOIN containers c ON c.id = h.descendant_id JOIN cc ON cc.container_id = c.id
+        WHERE h.kind = 'container'
+        GROUP BY h.ancestor_id
+    )
+    SELECT n.id AS node_id,
+           {", ".join(f"COALESCE({'nd' if col in NODE_TYPE_COLS.values() else 'cd'}.{col}, 0) AS {col}"
+                      for col in NODE_COUNT_COLS)}
+    FROM nodes n LEFT JOIN nd ON nd.nid = n.id LEFT JOIN cd ON cd.nid = n.id
+"""
+
+def rebuild_counts(conn):
+    """Recompute node_counts and container_counts from the inventory tables."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM container_counts")
+    cur.execute(f"INSERT INTO container_counts(container_id, items, qty) {EXPECTED_CONTAINER_COUNTS}")
+    cur.execute("DELETE FROM node_counts")
+    cur.execute(f"INSERT INTO node_counts(node_id, {', '.join(NODE_COUNT_COLS)}) {EXPECTED_NODE_COUNTS}")
+
+def check_counts(conn) -> list[str]:
+    """Ids of nodes/containers whose stored counts differ from a fresh computation (empty = consistent)."""
+    cur = conn.cursor()
+    bad = set()
+    for stored, expected, key in (("container_counts", EXPECTED_CONTAINER_COUNTS, "container_id"),
+                                  ("node_counts", EXPECTED_NODE_COUNTS, "node_id")):
+        cur.execute(f"""
+            SELECT {key} FROM (SELECT * FROM ({expected}) EXCEPT SELECT * FROM {stored})
+            UNION
+            SELECT {key} FROM (SELECT * FROM {stored} EXCEPT SELECT * FROM ({expected}))
+        """)
+        bad.update(r[0] for r in cur.fetchall())
+    return sorted(bad)
+
+
+# -------------- Item type schemas --------------
+# Item types and their fields change rarely but are read on every item write and on most pages.
+# They are compiled once (options parsed, fields indexed by id and key) and cached per process.
+# Triggers on item_types / item_fields bump app_meta.types_version in the writing transaction, so
+# any change (any route, worker process or the CLI) is picked up on the next read.
+TYPES_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS app_meta(key TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID",
+    "INSERT OR IGNORE INTO app_meta(key, value) VALUES ('types_version', 0)",
+]
+for _tbl in ("item_types", "item_fields"):
+    for _op in ("INSERT", "UPDATE", "DELETE"):
+        TYPES_SCHEMA.append(f"""
+    CREATE TRIGGER IF NOT EXISTS types_version_{_tbl}_{_op.lower()[:3]} AFTER {_op} ON {_tbl} BEGIN
+        UPDATE app_meta SET value = value + 1 WHERE key = 'types_version';
+    END
+    """)
+
+def _coerce_field_value(f: dict, value) -> str:
+    """Validate one dynamic value against its item_fields definition; returns the stored text."""
+    kind = f["kind"]
+    if kind == "checkbox":
+        return "1" if str(value).strip().lower() in ("1", "true", "on", "yes") else "0"
+    text = str(value).strip()
+    if kind == "number":
+        try:
+            float(text)
+        except ValueError:
+            raise ValueError(f"{f['name']}: '{text}' is not a number")
+    elif kind == "date":
+        try:
+            time.strptime(text, "%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"{f['name']}: '{text}' is not a YYYY-MM-DD date")
+    elif kind == "select" and text not in f["options"]:
+        raise ValueError(f"{f['name']}: '{text}' is not one of {f['options']}")
+    return text
+
+class TypeSchema:
+    """An item type compiled for reuse: fields in display order, indexed by field id and key."""
+    __slots__ = ("id", "name", "fields", "by_id", "by_key")
+
+    def __init__(self, type_id: str, name: str):
+        self.id, self.name = type_id, name
+        self.fields, self.by_id, self.by_key = [], {}, {}
+
+    def add_field(self, f: dict):
+        self.fields.append(f)
+        self.by_id[f["id"]] = f
+        self.by_key[f["name"]] = f
+
+    def validate(self, key: str, value) -> str:
+        return _coerce_field_value(self.by_key[key], value)
+
+    def form_values(self, form) -> list[tuple[str, str]]:
+        """[(field_id, value)] for this type's `field_<id>` inputs present in a submitted form."""
+        return [(f["id"], str(form[f"field_{f['id']}"]).strip()) for f in self.fields if f"field_{f['id']}" in form]
+
+class TypeSchemaCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._types, self._by_name = {}, {}
+        self.stats = {"hits": 0, "loads": 0}
+
+    def _current(self, conn):
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM app_meta WHERE key='types_version'")
+        version = cur.fetchone()[0]
+        with self._lock:
+            if version == self._version:
+                self.stats["hits"] += 1
+                return self._types, self._by_name
+        # version is read before the load: a change in between only causes another reload
+        types, by_name = self._load(cur)
+        if conn.in_transaction:
+            # uncommitted rows: a rollback could reuse this version number for other data
+            return types, by_name
+        with self._lock:
+            self._version, self._types, self._by_name = version, types, by_name
+            self.stats["loads"] += 1
+        return types, by_name
+
+    @staticmethod
+    def _load(cur):
+        cur.execute("""
+            SELECT t.id AS type_id, t.name AS type_name, f.id, f.name, f.label, f.kind, f.required, f.options, f.ord
+            FROM item_types t LEFT JOIN item_fields f ON f.type_id = t.id
+            ORDER BY t.name, f.ord, f.label
+        """)
+        types = {}
+        for r in cur.fetchall():
+            t = types.get(r["type_id"])
+            if t is None:
+                t = types[r["type_id"]] = TypeSchema(r["type_id"], r["type_name"])
+            if r["id"] is not None:
+                f = {k: r[k] for k in ("id", "name", "label", "kind", "required", "options", "ord")}
+                try:
+                    f["options"] = json.loads(f["options"] or "[]")
+                except Exception:
+                    f["options"] = []
+                t.add_field(f)
+        return types, {t.name: t for t in types.values()}
+
+    def get(self, conn, type_id: str) -> TypeSchema | None:
+        return self._current(conn)[0].get(type_id)
+
+    def all(self, conn) -> list[TypeSchema]:
+        """Every item type, ordered by name."""
+        return list(self._current(conn)[0].values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "version": self._version, "types": len(self._types)}
+
+type_schemas = TypeSchemaCache()
+
+
+# -------------- Schema migrations --------------
+# Ordered, idempotent steps keyed on PRAGMA user_version; step N brings the DB to version N.
+# Append new steps at the end, never reorder or edit released ones. The same goes for the
+# *_SCHEMA lists a step runs: a later step that changes a trigger drops it and creates its own.
+
+def _m_base_tables(conn):
+    cur = conn.cursor()
     # Structure nodes: Cabinet, Wardrobe, Shelf, Drawer
     cur.execute("""
         CREATE TABLE IF NOT EXISTS nodes(
@@ -125,8 +2066,6 @@ def init_db():
         );
     """)
 
-
-
     # Item types & dynamic fields
     cur.execute("""
         CREATE TABLE IF NOT EXISTS item_types(
@@ -164,20 +2103,344 @@ def init_db():
     if "type_id" not in cols:
         cur.execute("ALTER TABLE items ADD COLUMN type_id TEXT")
 
+def _m_hot_path_indexes(conn):
+    cur = conn.cursor()
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_nodes_parent ON nodes(parent_id, type, name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_containers_parent ON containers(parent_id, type, name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_items_container ON items(container_id, name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_item_fields_type ON item_fields(type_id, ord)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_item_field_values_field ON item_field_values(field_id)")
+    cur.execute("ANALYZE")
+
+def _m_search_index(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='search_docs'")
+    search_is_new = cur.fetchone() is None
+    for stmt in SEARCH_SCHEMA:
+        cur.execute(stmt)
+    if search_is_new:
+        rebuild_search_index(conn)
+
+def _m_hierarchy(conn):
+    cur = conn.cursor()
+    for stmt in HIERARCHY_SCHEMA:
+        cur.execute(stmt)
+    rebuild_hierarchy(conn)
 
+def _m_move_target_indexes(conn):
+    cur = conn.cursor()
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_containers_name ON containers(name COLLATE NOCASE, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_nodes_name ON nodes(name COLLATE NOCASE, id)")
+    cur.execute("ANALYZE")
 
-    conn.commit(); conn.close()
+def _m_counts(conn):
+    cur = conn.cursor()
+    for stmt in COUNTS_SCHEMA:
+        cur.execute(stmt)
+    rebuild_counts(conn)
+
+def _m_search_bulk_guard(conn):
+    cur = conn.cursor()
+    for name in ("search_items_ai", "search_values_ins", "search_values_upd", "search_values_del"):
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+    for stmt in SEARCH_BULK_GUARD_SCHEMA:
+        cur.execute(stmt)
+
+def _m_type_schema_version(conn):
+    cur = conn.cursor()
+    for stmt in TYPES_SCHEMA:
+        cur.execute(stmt)
+
+def _m_search_item_moves(conn):
+    cur = conn.cursor()
+    cur.execute("DROP TRIGGER IF EXISTS search_items_au")
+    for stmt in SEARCH_ITEM_MOVES_SCHEMA:
+        cur.execute(stmt)
+
+def _m_data_version(conn):
+    cur = conn.cursor()
+    for stmt in DATA_VERSION_SCHEMA:
+        cur.execute(stmt)
+
+def _m_change_log(conn):
+    cur = conn.cursor()
+    for stmt in CHANGE_LOG_SCHEMA:
+        cur.execute(stmt)
+
+def _m_row_versions(conn):
+    cur = conn.cursor()
+    for tbl in SYNC_TABLES:
+        cur.execute(f"PRAGMA table_info({tbl})")
+        if "row_version" not in [r[1] for r in cur.fetchall()]:
+            cur.execute(f"ALTER TABLE {tbl} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+    # plain AFTER UPDATE triggers would fire again on every row_version stamp: recreate them as UPDATE OF
+    values_on = _on_update("item_field_values")
+    replaced = {f"data_version_{tbl}_upd": _data_version_trigger(tbl, "UPDATE", _on_update(tbl)) for tbl in DATA_COLUMNS}
+    replaced.update({f"change_log_{tbl}_au": _change_log_update_trigger(tbl, _on_update(tbl)) for tbl in _CHANGE_ROWS})
+    replaced["change_log_values_upd"] = _change_log_values_trigger("UPDATE", on=values_on)
+    replaced["search_values_upd"] = _search_values_trigger("UPDATE", _SEARCH_GUARD, values_on)
+    for name, stmt in replaced.items():
+        cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(stmt)
+    for stmt in ROW_VERSION_SCHEMA:
+        cur.execute(stmt)
+    # existing rows get distinct versions, table after table
+    cur.execute("SELECT value FROM app_meta WHERE key='row_version'")
+    base = cur.fetchone()[0]
+    for tbl in SYNC_TABLES:
+        cur.execute(f"UPDATE {tbl} SET row_version = rowid + ? WHERE row_version = 0", (base,))
+        cur.execute(f"SELECT COALESCE(MAX(row_version), ?) FROM {tbl}", (base,))
+        base = max(base, cur.fetchone()[0])
+    cur.execute("UPDATE app_meta SET value = ? WHERE key='row_version'", (base,))
+
+MIGRATIONS = [
+    ("base tables", _m_base_tables),
+    ("hot-path indexes", _m_hot_path_indexes),
+    ("full-text search index", _m_search_index),
+    ("hierarchy closure table", _m_hierarchy),
+    ("move-target name indexes", _m_move_target_indexes),
+    ("count aggregates", _m_counts),
+    ("bulk-write search guard", _m_search_bulk_guard),
+    ("item type schema version", _m_type_schema_version),
+    ("cheap search update on item moves", _m_search_item_moves),
+    ("data version counter", _m_data_version),
+    ("change journal", _m_change_log),
+    ("row versions for delta sync", _m_row_versions),
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def migrate(conn) -> list[str]:
+    """Apply pending migrations in a single transaction. Returns the names of the applied steps."""
+    cur = conn.cursor()
+    cur.execute("PRAGMA user_version")
+    if cur.fetchone()[0] >= SCHEMA_VERSION:
+        return []
+
+    cur.execute("BEGIN IMMEDIATE")        # take the write lock first, then re-check
+    try:
+        cur.execute("PRAGMA user_version")
+        current = cur.fetchone()[0]
+        applied = []
+        for version, (name, step) in enumerate(MIGRATIONS, start=1):
+            if version > current:
+                step(conn)
+                applied.append(name)
+        cur.execute(f"PRAGMA user_version={max(current, SCHEMA_VERSION)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return applied
+
+_db_ready = False
+_db_ready_lock = threading.Lock()
+
+def ensure_db() -> list[str]:
+    """
+    Bring the schema up to date, once per process, on first use (or at startup). Only the first
+    worker on a database applies anything; the others just read PRAGMA user_version.
+    Returns the names of the applied steps.
+    """
+    global _db_ready
+    with _db_ready_lock:
+        if _db_ready:
+            return []
+        conn = db_pool.acquire(write=True)
+        try:
+            applied = migrate(conn)
+        finally:
+            conn.close()
+        _db_ready = True
+        return applied
+
+# -------------- Static assets --------------
+# static/ holds the sources. build_assets() writes content-hashed copies to static/dist/
+# (name.<hash>.ext, plus .gz and .br when the brotli package is installed) and a manifest;
+# templates link through asset(), so those URLs are cached as immutable and a changed file just
+# gets a new name. It runs at startup (only new hashes are written) and as `build-assets`, which
+# can also vendor jsQR so scanning works without internet access.
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+ASSET_DIST = "dist"
+ASSET_COMPRESS = {".css", ".js", ".svg", ".json", ".txt", ".html"}   # images are already compressed
+JSQR_VERSION = "1.4.0"
+JSQR_CDN_URL = f"https://cdn.jsdelivr.net/npm/jsqr@{JSQR_VERSION}/dist/jsQR.js"
+JSQR_VENDOR_PATH = "vendor/jsQR.js"
+
+try:
+    import brotli                      # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+ASSET_ENCODINGS = [("br", ".br")] if brotli else []
+ASSET_ENCODINGS.append(("gzip", ".gz"))
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+def fetch_vendor_assets(timeout: float = 30) -> bool:
+    """Download jsQR into static/vendor/ (once). Returns True if it was fetched."""
+    dest = os.path.join(STATIC_DIR, JSQR_VENDOR_PATH)
+    if os.path.exists(dest):
+        return False
+    import urllib.request
+    with urllib.request.urlopen(JSQR_CDN_URL, timeout=timeout) as resp:
+        _write_atomic(dest, resp.read())
+    return True
+
+def build_assets() -> dict:
+    """Write hashed (and precompressed) copies of every static file; returns the manifest {source: hashed}."""
+    dist = os.path.join(STATIC_DIR, ASSET_DIST)
+    manifest = {}
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist)
+        for name in sorted(files):
+            if name.endswith(".tmp"):
+                continue
+            src = os.path.join(root, name)
+            rel = os.path.relpath(src, STATIC_DIR).replace(os.sep, "/")
+            with open(src, "rb") as fh:
+                data = fh.read()
+            stem, ext = os.path.splitext(rel)
+            hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+            out = os.path.join(dist, hashed)
+            if not os.path.exists(out):
+                if ext.lower() in ASSET_COMPRESS:
+                    _write_atomic(out + ".gz", gzip.compress(data, 9, mtime=0))
+                    if brotli:
+                        _write_atomic(out + ".br", brotli.compress(data))
+                _write_atomic(out, data)      # written last: its presence marks a complete set
+            manifest[rel] = hashed
+    _write_atomic(os.path.join(dist, "manifest.json"), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    return manifest
+
+def load_asset_manifest() -> dict:
+    try:
+        return build_assets()
+    except OSError as e:               # e.g. read-only deployment: fall back to plain /static URLs
+        log.warning("Static assets not built (%s); serving /static sources", e)
+        return {}
+
+_asset_manifest = None
+
+def asset_manifest() -> dict:
+    global _asset_manifest
+    if _asset_manifest is None:
+        _asset_manifest = load_asset_manifest()
+    return _asset_manifest
+
+def asset(path: str, fallback: str | None = None) -> str:
+    """URL for a static file: its hashed dist/ copy when built, else `fallback` or the plain /static path."""
+    hashed = asset_manifest().get(path)
+    if hashed:
+        return f"/static/{ASSET_DIST}/{hashed}"
+    return fallback or f"/static/{path}"
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles for /static: hashed dist/ files are served with a year-long immutable
+    Cache-Control and, when the client accepts it, their precompressed .br/.gz variant.
+    Everything else is served as-is and revalidated (ETag/Last-Modified) on each use.
+    """
+    async def get_response(self, path: str, scope) -> Response:
+        hashed = path.startswith(ASSET_DIST + os.sep)
+        response = None
+        if hashed and scope["method"] in ("GET", "HEAD"):
+            accept = Headers(scope=scope).get("accept-encoding", "")
+            for enc, suffix in ASSET_ENCODINGS:
+                if enc not in accept:
+                    continue
+                full_path, st = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+                if st is not None and stat.S_ISREG(st.st_mode):
+                    response = self.file_response(full_path, st, scope)
+                    media = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                    if media.startswith("text/") or media.endswith("javascript"):
+                        media += "; charset=utf-8"
+                    response.headers["content-type"] = media
+                    response.headers["content-encoding"] = enc
+                    break
+        if response is None:
+            response = await super().get_response(path, scope)
+        if hashed:
+            response.headers["cache-control"] = "public, max-age=31536000, immutable"
+            response.headers["vary"] = "Accept-Encoding"
+        else:
+            response.headers["cache-control"] = "no-cache"
+        return response
+
+def asgi_request(method: str, path: str, body: bytes = b"", headers=()):
+    """
+    Awaitable in-process request against the app (no server or HTTP client), for benchmarks and
+    startup checks. Resolves to (status, response headers, body).
+    """
+    async def call():
+        status, resp_headers, chunks = 0, [], []
+        sent = False
+        async def receive():
+            nonlocal sent
+            if sent:                          # the client stays connected until the response is done
+                await asyncio.get_running_loop().create_future()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        async def send(message):
+            nonlocal status, resp_headers
+            if message["type"] == "http.response.start":
+                status, resp_headers = message["status"], message.get("headers", [])
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+        path_only, _, qs = path.partition("?")
+        await app({"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+                   "scheme": "http", "path": path_only, "raw_path": path_only.encode(), "query_string": qs.encode(),
+                   "root_path": "", "headers": [(b"host", b"localhost"), *headers],
+                   "client": ("127.0.0.1", 0), "server": ("localhost", 80)}, receive, send)
+        return status, resp_headers, b"".join(chunks)
+    return call()
+
+def asgi_get(path: str):
+    """In-process GET; resolves to (status, body)."""
+    async def call():
+        status, _, body = await asgi_request("GET", path)
+        return status, body
+    return call()
 
-init_db()
-HAS_MKCERT_CA = export_mkcert_root_only()
 # FastAPI app & static
-app = FastAPI(title=APP_TITLE)
-app.mount("/static", StaticFiles(directory=os.path.join(BASE_DIR, "static")), name="static")
+@asynccontextmanager
+async def lifespan(app):
+    # importing this module does no I/O; a worker's one-time work happens here, off the event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, ensure_db)
+    await loop.run_in_executor(None, asset_manifest)
+    await loop.run_in_executor(None, build_id)
+    loop.run_in_executor(None, export_mkcert_root_only)   # fire and forget: only /install-certificate needs it
+    loop_monitor.start()
+    change_feed.start()
+    try:
+        yield
+    finally:
+        await change_feed.stop()
+        await loop_monitor.stop()
+        db_executor.shutdown()
+
+app = FastAPI(title=APP_TITLE, lifespan=lifespan)
+app.add_middleware(ConnectionGuardMiddleware)
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(MetricsMiddleware)            # outermost: also times 304s and cached responses
+app.mount("/static", AssetFiles(directory=STATIC_DIR), name="static")
 app.mount("/qrcodes", StaticFiles(directory=QRCODES_DIR), name="qrcodes")
 
 # Templates
 env = Environment(loader=FileSystemLoader(os.path.join(BASE_DIR, "templates")), autoescape=select_autoescape(['html','xml']))
-def render(tpl, **kwargs): return HTMLResponse(env.get_template(tpl).render(**kwargs))
+env.globals.update(asset=asset, jsqr_cdn_url=JSQR_CDN_URL)
+def render(tpl, **kwargs):
+    t0 = time.perf_counter()
+    html = env.get_template(tpl).render(**kwargs)
+    dt = time.perf_counter() - t0
+    render_seconds.observe(("template", tpl), dt)
+    account("template", dt)
+    return HTMLResponse(html)
 
 # Rules
 ALLOWED_NODE_CHILDREN = {
@@ -219,29 +2482,24 @@ def ensure_unique_field_key(conn, type_id: str, base_key: str, exclude_field_id:
 
 
 def list_item_types(conn):
-    cur = conn.cursor()
-    cur.execute("SELECT id, name FROM item_types ORDER BY name")
-    return cur.fetchall()
+    return [{"id": t.id, "name": t.name} for t in type_schemas.all(conn)]
 
 def fields_for_type(conn, type_id: str):
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT id, name, label, kind, required, options, ord
-        FROM item_fields
-        WHERE type_id=?
-        ORDER BY ord, label
-    """, (type_id,))
-    rows = cur.fetchall()
-    # parse options JSON
-    out = []
-    for r in rows:
-        o = dict(r)
-        try:
-            o["options"] = json.loads(o["options"] or "[]")
-        except Exception:
-            o["options"] = []
-        out.append(o)
-    return out
+    """Field dicts of a type in display order, options parsed (cached; treat as read-only)."""
+    t = type_schemas.get(conn, type_id)
+    return t.fields if t else []
+
+def reorder_type_fields(conn, type_id: str, order: list[str]) -> int:
+    """Renumber a type's fields 1..n following `order` in one UPDATE (ids of other types are ignored)."""
+    t = type_schemas.get(conn, type_id)
+    order = [fid for fid in dict.fromkeys(order) if t and fid in t.by_id]
+    if not order:
+        return 0
+    cases = " ".join("WHEN ? THEN ?" for _ in order)
+    params = [x for pos, fid in enumerate(order, start=1) for x in (fid, pos)]
+    conn.execute(f"UPDATE item_fields SET ord = CASE id {cases} END WHERE type_id=? AND id IN ({','.join('?' * len(order))})",
+                 [*params, type_id, *order])
+    return len(order)
 
 def values_for_items(conn, item_ids):
     """Return {item_id: [{label, value, field_id}], ...}"""
@@ -268,52 +2526,112 @@ def values_for_items(conn, item_ids):
 
 
 
-def delete_node_recursive(conn, node_id: str):
-    """Delete a node and everything under it (child nodes, containers, items, QR pngs)."""
+def cascade_delete(conn, node_ids=(), container_ids=()) -> list[str]:
+    """
+    Set-based cascade delete: every node below node_ids (closure table), their containers and the
+    given container_ids, with all items and dynamic values. Runs a handful of statements regardless
+    of subtree size and touches no files; returns the deleted container ids so the caller can
+    remove their QR pngs after commit (see remove_qr_files).
+    """
     cur = conn.cursor()
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS del_nodes(id TEXT PRIMARY KEY)")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS del_containers(id TEXT PRIMARY KEY)")
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS del_docs(doc_id INTEGER PRIMARY KEY)")
+    cur.execute("DELETE FROM temp.del_nodes")
+    cur.execute("DELETE FROM temp.del_containers")
+
+    if node_ids:
+        roots = json.dumps(list(node_ids))
+        cur.execute("""
+            INSERT OR IGNORE INTO temp.del_nodes(id)
+            SELECT descendant_id FROM hierarchy
+            WHERE ancestor_id IN (SELECT value FROM json_each(?)) AND kind='node'
+        """, (roots,))
+        cur.execute("""
+            INSERT OR IGNORE INTO temp.del_containers(id)
+            SELECT descendant_id FROM hierarchy
+            WHERE ancestor_id IN (SELECT value FROM json_each(?)) AND kind='container'
+        """, (roots,))
+    if container_ids:
+        cur.execute("""
+            INSERT OR IGNORE INTO temp.del_containers(id)
+            SELECT id FROM containers WHERE id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(list(container_ids)),))
 
-    # 1) Delete containers directly under this node (safety; shelves/drawers hold them)
-    cur.execute("SELECT id FROM containers WHERE parent_id=?", (node_id,))
-    for (cid,) in cur.fetchall():
-        # delete items
-        cur.execute("DELETE FROM items WHERE container_id=?", (cid,))
-        # delete container
-        cur.execute("DELETE FROM containers WHERE id=?", (cid,))
-        # delete QR file if present
+    cur.execute("SELECT id FROM temp.del_containers")
+    removed = [r[0] for r in cur.fetchall()]
+
+    # Drop search documents in bulk first: the per-row search triggers then find nothing to do,
+    # instead of flushing FTS5 once per deleted item/value.
+    cur.execute("DELETE FROM temp.del_docs")
+    cur.execute("""
+        INSERT INTO temp.del_docs(doc_id)
+        SELECT doc_id FROM search_docs WHERE kind='item' AND cont_id IN (SELECT id FROM temp.del_containers)
+        UNION ALL
+        SELECT doc_id FROM search_docs WHERE kind='container' AND ref_id IN (SELECT id FROM temp.del_containers)
+        UNION ALL
+        SELECT doc_id FROM search_docs WHERE kind='node' AND ref_id IN (SELECT id FROM temp.del_nodes)
+    """)
+    cur.execute("DELETE FROM search_fts WHERE rowid IN (SELECT doc_id FROM temp.del_docs)")
+    cur.execute("DELETE FROM search_docs WHERE doc_id IN (SELECT doc_id FROM temp.del_docs)")
+
+    cur.execute("INSERT INTO search_deferred(flag) VALUES (1)")      # no per-item change events either
+    bury_items(conn, "SELECT id FROM temp.del_containers")
+    cur.execute("""
+        DELETE FROM item_field_values WHERE item_id IN (
+            SELECT id FROM items WHERE container_id IN (SELECT id FROM temp.del_containers))
+    """)
+    cur.execute("DELETE FROM items WHERE container_id IN (SELECT id FROM temp.del_containers)")
+    cur.execute("DELETE FROM search_deferred")
+    cur.execute("DELETE FROM containers WHERE id IN (SELECT id FROM temp.del_containers)")
+    cur.execute("DELETE FROM nodes WHERE id IN (SELECT id FROM temp.del_nodes)")
+    return removed
+
+def delete_node_recursive(conn, node_id: str) -> list[str]:
+    """Delete a node and everything under it (child nodes, containers, items, values). Returns container ids."""
+    return cascade_delete(conn, node_ids=[node_id])
+
+def remove_qr_files(container_ids):
+    """Post-commit cleanup: drop cached labels and QR pngs of deleted containers (runs as a background task)."""
+    qr_cache.invalidate(*(qr_payload_for_container(cid) for cid in container_ids))
+    for cid in container_ids:
         try:
-            png = os.path.join(QRCODES_DIR, f"{cid}.png")
-            if os.path.exists(png):
-                os.remove(png)
-        except Exception:
+            os.remove(os.path.join(QRCODES_DIR, f"{cid}.png"))
+        except OSError:
             pass
 
-    # 2) Recurse into child nodes (shelves/drawers)
-    cur.execute("SELECT id FROM nodes WHERE parent_id=?", (node_id,))
-    for (child_id,) in cur.fetchall():
-        delete_node_recursive(conn, child_id)
 
-    # 3) Finally delete node
-    cur.execute("DELETE FROM nodes WHERE id=?", (node_id,))
+# -------------- QR labels --------------
+QR_BOX_SIZE, QR_BORDER = 10, 4
+QR_CACHE_MAX_BYTES = int(os.getenv("QR_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", "")       # set to spill evicted labels to disk
+QR_RENDER_REV = 1                                   # bump when the label layout changes
 
+@lru_cache(maxsize=16)
+def label_font(size: int):
+    from PIL import ImageFont           # imaging stack is imported on first render, not at startup
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except Exception:
+        try:
+            return ImageFont.truetype("DejaVuSans.ttf", size)
+        except Exception:
+            return ImageFont.load_default()
 
+@timed("image")
 def build_qr_with_label_bytes(payload: str, label: str) -> bytes:
+    import qrcode
+    from PIL import Image, ImageDraw
     qr = qrcode.QRCode(version=None,
                        error_correction=qrcode.constants.ERROR_CORRECT_M,
-                       box_size=10, border=4)
+                       box_size=QR_BOX_SIZE, border=QR_BORDER)
     qr.add_data(payload)              # <— ID only
     qr.make(fit=True)
     qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
 
-    # Pick a font
-    try:
-        font = ImageFont.truetype("arial.ttf", max(24, qr_img.width // 8))
-    except Exception:
-        try:
-            font = ImageFont.truetype("DejaVuSans.ttf", max(24, qr_img.width // 8))
-        except Exception:
-            font = ImageFont.load_default()
-
+    font = label_font(max(24, qr_img.width // 8))
     label = (label or "").strip()
+    dtmp = ImageDraw.Draw(Image.new("RGB", (10, 10), "white"))
 
     # Optional: wrap long names to max width ~1.3x QR width
     max_text_width = int(qr_img.width * 1.3)
@@ -321,7 +2639,6 @@ def build_qr_with_label_bytes(payload: str, label: str) -> bytes:
     if label:
         words = label.split()
         line = ""
-        dtmp = ImageDraw.Draw(Image.new("RGB", (10, 10), "white"))
         for w in words:
             test = (line + " " + w).strip()
             tw, th = dtmp.textbbox((0,0), test, font=font)[2:]
@@ -336,7 +2653,6 @@ def build_qr_with_label_bytes(payload: str, label: str) -> bytes:
         lines = [""]
 
     # Measure total text block
-    dtmp = ImageDraw.Draw(Image.new("RGB", (10, 10), "white"))
     line_sizes = [dtmp.textbbox((0,0), ln, font=font) for ln in lines]
     line_ws = [b[2]-b[0] for b in line_sizes]
     line_hs = [b[3]-b[1] for b in line_sizes]
@@ -344,18 +2660,6 @@ def build_qr_with_label_bytes(payload: str, label: str) -> bytes:
     line_height = max(line_hs) if line_hs else 0
     text_h = line_height * len(lines) + max(0, (len(lines)-1) * 6)
 
-    # Canvas
-    pad, gap = 24, 12
-    out_w = max(qr_img.width + 2*pad, text_w + 2*pad)
-    out_h = pad + qr_img.height + gap + text_h + pad
-    canvas = Image.new("RGB", (out_w, out_h), "white")
-    d = ImageDraw.Draw(canvas)
-
-    # Paste QR
-    x_qr = (out_w - qr_img.width) // 2
-    y_qr = pad
-    canvas.paste(qr_img, (x_qr, y_qr))
-
     # -- padding & layout --
     pad_top = 24
     pad_bottom = 48
@@ -385,8 +2689,116 @@ def build_qr_with_label_bytes(payload: str, label: str) -> bytes:
     return buf.getvalue()
 
 
+class QRCache:
+    """
+    Bounded LRU (by total bytes) of rendered label PNGs, keyed on payload + label + render params.
+    With a spill directory, evicted entries are written to disk and promoted back on the next hit.
+    """
+    def __init__(self, max_bytes: int = QR_CACHE_MAX_BYTES, spill_dir: str = QR_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or None
+        if self.spill_dir:
+            Path(self.spill_dir).mkdir(parents=True, exist_ok=True)
+        self._entries = OrderedDict()          # key -> (payload, png)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(payload: str, label: str) -> str:
+        params = [payload, (label or "").strip(), QR_BOX_SIZE, QR_BORDER, "M", QR_RENDER_REV]
+        return hashlib.sha256(json.dumps(params).encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def _payload_tag(payload: str) -> str:
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    def _spill_path(self, payload: str, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{self._payload_tag(payload)}_{key}.png")
+
+    def get(self, payload: str, key: str) -> bytes | None:
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return hit[1]
+        if self.spill_dir:
+            try:
+                with open(self._spill_path(payload, key), "rb") as f:
+                    png = f.read()
+            except OSError:
+                png = None
+            if png is not None:
+                self.stats["disk_hits"] += 1
+                self.put(payload, key, png)
+                return png
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, payload: str, key: str, png: bytes):
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (payload, png)
+            self._bytes += len(png)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                k, (p, data) = self._entries.popitem(last=False)
+                self._bytes -= len(data)
+                self.stats["evictions"] += 1
+                evicted.append((k, p, data))
+        if self.spill_dir:
+            for k, p, data in evicted:
+                try:
+                    with open(self._spill_path(p, k), "wb") as f:
+                        f.write(data)
+                except OSError:
+                    pass
+
+    def invalidate(self, *payloads: str):
+        """Drop every cached rendering of the given payloads (e.g. after a container rename)."""
+        targets = set(payloads)
+        if not targets:
+            return
+        with self._lock:
+            for k in [k for k, (p, _) in self._entries.items() if p in targets]:
+                self._bytes -= len(self._entries.pop(k)[1])
+        if self.spill_dir:
+            tags = {self._payload_tag(p) for p in targets}
+            for fn in os.listdir(self.spill_dir):
+                if fn.split("_", 1)[0] in tags:
+                    try:
+                        os.remove(os.path.join(self.spill_dir, fn))
+                    except OSError:
+                        pass
+
+qr_cache = QRCache()
+
+def render_qr_label(payload: str, label: str) -> tuple[str, bytes]:
+    """Cached build_qr_with_label_bytes. Returns (cache key, png); the key doubles as a strong ETag."""
+    key = qr_cache.key(payload, label)
+    png = qr_cache.get(payload, key)
+    if png is None:
+        png = build_qr_with_label_bytes(payload, label)
+        qr_cache.put(payload, key, png)
+    return key, png
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match covers `etag`."""
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    tags = [t.strip() for t in inm.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
 
+
+
+@timed("image")
 def save_qr_with_label(cid: str, label: str):
+    import qrcode
+    from PIL import Image, ImageDraw
     payload = qr_payload_for_container(cid)
     qr = qrcode.QRCode(version=None,
                        error_correction=qrcode.constants.ERROR_CORRECT_M,
@@ -395,14 +2807,7 @@ def save_qr_with_label(cid: str, label: str):
     qr.make(fit=True)
     qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
 
-    # Font
-    try:
-        font = ImageFont.truetype("arial.ttf", 24)
-    except Exception:
-        try:
-            font = ImageFont.truetype("DejaVuSans.ttf", 24)
-        except Exception:
-            font = ImageFont.load_default()
+    font = label_font(24)
 
     label = (label or "").strip()
     # Measure text
@@ -433,6 +2838,870 @@ def save_qr_with_label(cid: str, label: str):
 
 
 
+# -------------- Label sheets --------------
+# Multi-page printable sheets: labels are rendered in a process pool one page ahead of the
+# page being composed, and pages are streamed out as they are finished.
+LABEL_WORKERS = int(os.getenv("LABEL_WORKERS", "0")) or None     # default: one per CPU
+LABEL_SHEET_DPI = 150
+LABEL_SHEET_MARGIN_MM = 10
+PAPER_SIZES_MM = {"a4": (210.0, 297.0), "letter": (215.9, 279.4)}
+
+_label_pool = None
+_label_pool_lock = threading.Lock()
+
+def label_pool() -> ProcessPoolExecutor:
+    global _label_pool
+    with _label_pool_lock:
+        if _label_pool is None:
+            _label_pool = ProcessPoolExecutor(max_workers=LABEL_WORKERS,
+                                              mp_context=multiprocessing.get_context("spawn"))
+        return _label_pool
+
+def containers_for_labels(conn, node_id: str | None = None, ids: list[str] | None = None):
+    """(id, name) of the containers to print: everything below node_id, or the given ids in order."""
+    cur = conn.cursor()
+    if node_id:
+        cur.execute("""
+            SELECT c.id, c.name
+            FROM hierarchy h
+            JOIN containers c ON c.id = h.descendant_id
+            JOIN nodes p ON p.id = c.parent_id
+            WHERE h.ancestor_id = ? AND h.kind = 'container'
+            ORDER BY p.name, c.name
+        """, (node_id,))
+        return [(r["id"], r["name"]) for r in cur.fetchall()]
+    if not ids:
+        return []
+    ph = ",".join("?" * len(ids))
+    cur.execute(f"SELECT id, name FROM containers WHERE id IN ({ph})", ids)
+    names = {r["id"]: r["name"] for r in cur.fetchall()}
+    return [(cid, names[cid]) for cid in ids if cid in names]
+
+def _reset_label_pool():
+    global _label_pool
+    with _label_pool_lock:
+        pool, _label_pool = _label_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _submit_labels(labels):
+    """Cached PNG bytes where available, otherwise a future from the label pool."""
+    out = []
+    for cid, name in labels:
+        payload = qr_payload_for_container(cid)
+        key = qr_cache.key(payload, name)
+        png = qr_cache.get(payload, key)
+        if png is None:
+            png = label_pool().submit(build_qr_with_label_bytes, payload, name)
+        out.append((payload, name, key, png))
+    return out
+
+@timed("image")
+def _compose_page(rendered, paper: str, cols: int, rows: int) -> "Image.Image":
+    from PIL import Image
+    w_mm, h_mm = PAPER_SIZES_MM[paper]
+    px = lambda mm: int(round(mm / 25.4 * LABEL_SHEET_DPI))
+    page = Image.new("L", (px(w_mm), px(h_mm)), 255)
+    margin = px(LABEL_SHEET_MARGIN_MM)
+    cell_w = (page.width - 2 * margin) // cols
+    cell_h = (page.height - 2 * margin) // rows
+    for i, (payload, name, key, png) in enumerate(rendered):
+        if not isinstance(png, bytes):
+            try:
+                png = png.result()
+            except BrokenProcessPool:            # a worker died: start a fresh pool next time
+                _reset_label_pool()
+                png = build_qr_with_label_bytes(payload, name)
+            qr_cache.put(payload, key, png)
+        label = Image.open(io.BytesIO(png)).convert("L")
+        label.thumbnail((cell_w - 8, cell_h - 8))
+        x = margin + (i % cols) * cell_w + (cell_w - label.width) // 2
+        y = margin + (i // cols) * cell_h + (cell_h - label.height) // 2
+        page.paste(label, (x, y))
+    return page
+
+def iter_label_pages(labels, paper: str = "a4", cols: int = 3, rows: int = 4):
+    """Yield composed sheet pages (PIL images) one at a time."""
+    per_page = cols * rows
+    chunks = (labels[i:i + per_page] for i in range(0, len(labels), per_page))
+    pending = upcoming = []
+    try:
+        pending = _submit_labels(next(chunks, []))
+        while pending:
+            upcoming = _submit_labels(next(chunks, []))     # render the next page while this one is composed
+            yield _compose_page(pending, paper, cols, rows)
+            pending, upcoming = upcoming, []
+    finally:
+        # an aborted download must not leave its remaining pages queued in the pool
+        for *_, png in pending + upcoming:
+            if not isinstance(png, bytes):
+                png.cancel()
+
+def iter_label_sheet_pdf(labels, paper: str = "a4", cols: int = 3, rows: int = 4):
+    """
+    Stream a PDF, one page (image XObject + content + page object) at a time.
+    Objects: 1 catalog, 2 page tree (written last, once the kids are known), 3.. pages.
+    """
+    w_pt, h_pt = (round(mm / 25.4 * 72, 2) for mm in PAPER_SIZES_MM[paper])
+    offsets, pos, kids = {}, 0, []
+
+    def emit(num, body: bytes, stream: bytes | None = None) -> bytes:
+        nonlocal pos
+        offsets[num] = pos
+        chunk = f"{num} 0 obj\n".encode() + body
+        if stream is not None:
+            chunk += b"\nstream\n" + stream + b"\nendstream"
+        chunk += b"\nendobj\n"
+        pos += len(chunk)
+        return chunk
+
+    head = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    pos += len(head)
+    yield head
+
+    num = 3
+    pages = iter_label_pages(labels, paper, cols, rows)
+    try:
+        for page in pages:
+            img_num, content_num, page_num = num, num + 1, num + 2
+            num += 3
+            data = zlib.compress(page.tobytes(), 6)
+            out = emit(img_num, (f"<< /Type /XObject /Subtype /Image /Width {page.width} /Height {page.height} "
+                                 f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+                                 f"/Length {len(data)} >>").encode(), data)
+            content = f"q {w_pt} 0 0 {h_pt} 0 0 cm /Im0 Do Q".encode()
+            out += emit(content_num, f"<< /Length {len(content)} >>".encode(), content)
+            out += emit(page_num, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w_pt} {h_pt}] "
+                                   f"/Resources << /XObject << /Im0 {img_num} 0 R >> >> "
+                                   f"/Contents {content_num} 0 R >>").encode())
+            kids.append(page_num)
+            yield out
+    finally:
+        pages.close()                     # client gone: cancel the renders still queued
+
+    tail = emit(2, f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>".encode())
+    tail += emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    xref = f"xref\n0 {num}\n0000000000 65535 f \n"
+    xref += "".join(f"{offsets[i]:010d} 00000 n \n" for i in range(1, num))
+    xref += f"trailer\n<< /Size {num} /Root 1 0 R >>\nstartxref\n{pos}\n%%EOF\n"
+    yield tail + xref.encode()
+
+@app.get("/labels/sheet")
+def label_sheet(node_id: str | None = None, ids: str | None = None,
+                paper: str = "a4", cols: int = 3, rows: int = 4,
+                format: str = "pdf", page: int = 1):
+    """
+    Printable label sheet for a whole node subtree (?node_id=) or a list of containers (?ids=A,B,C).
+    format=pdf streams every page; format=png returns the single page ?page=N (X-Page-Count tells how many).
+    """
+    if paper not in PAPER_SIZES_MM:
+        raise HTTPException(status_code=400, detail="paper must be a4 or letter")
+    if not (1 <= cols <= 6 and 1 <= rows <= 10):
+        raise HTTPException(status_code=400, detail="cols must be 1-6 and rows 1-10")
+    if format not in ("pdf", "png"):
+        raise HTTPException(status_code=400, detail="format must be pdf or png")
+
+    id_list = [x.strip().upper() for x in (ids or "").split(",") if x.strip()]
+    conn = get_db()
+    labels = containers_for_labels(conn, node_id=node_id, ids=id_list)
+    conn.close()
+    if not labels:
+        raise HTTPException(status_code=404, detail="No containers to print")
+
+    per_page = cols * rows
+    pages = (len(labels) + per_page - 1) // per_page
+    if format == "png":
+        if not 1 <= page <= pages:
+            raise HTTPException(status_code=404, detail="Page out of range")
+        chunk = labels[(page - 1) * per_page:page * per_page]
+        img = next(iter_label_pages(chunk, paper, cols, rows))
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", optimize=True)
+        return Response(content=buf.getvalue(), media_type="image/png",
+                        headers={"X-Page-Count": str(pages)})
+
+    return StreamingResponse(iter_label_sheet_pdf(labels, paper, cols, rows), media_type="application/pdf",
+                             headers={"Content-Disposition": 'inline; filename="labels.pdf"',
+                                      "X-Page-Count": str(pages)})
+
+
+# -------------- Bulk import --------------
+# Rows are plain dicts: container_id, name, qty, note, type (id or name) and dynamic values,
+# either as a `fields` JSON object or as `field.<key>` columns (key = item_fields.name).
+# Everything is validated up front; valid rows are written with executemany in chunks of
+# IMPORT_CHUNK_ROWS, one transaction each, and bad rows are reported without stopping the batch.
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "2000"))
+IMPORT_MAX_ERRORS = 1000          # per-row errors kept in the report
+
+def iter_import_rows(stream, fmt: str):
+    """Yield (line_no, row dict | error str) from a text stream in csv or jsonl format."""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for n, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield n, f"invalid JSON: {e}"
+                continue
+            yield n, row if isinstance(row, dict) else "expected a JSON object"
+    else:
+        raise ValueError(f"unsupported import format: {fmt}")
+
+def _load_type_schemas(conn) -> dict:
+    """{type id or name: TypeSchema} for every item type (served from the schema cache)."""
+    types = type_schemas.all(conn)
+    return {**{t.name: t for t in types}, **{t.id: t for t in types}}
+
+def _prepare_import_row(row: dict, schemas: dict):
+    """Validate a raw row; returns (container_id, name, qty, note, type_id, [(field_id, value)])."""
+    cid = str(row.get("container_id") or "").strip()
+    if not cid:
+        raise ValueError("container_id is required")
+    name = str(row.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is required")
+    qty = row.get("qty")
+    try:
+        qty = 1 if qty in (None, "") else int(qty)
+    except (TypeError, ValueError):
+        raise ValueError(f"qty: '{qty}' is not an integer")
+    note = str(row.get("note") or "").strip()
+
+    raw = row.get("fields") or {}
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raise ValueError("fields: invalid JSON")
+    if not isinstance(raw, dict):
+        raise ValueError("fields: expected an object")
+    raw = dict(raw)
+    for k, v in row.items():
+        if k and k.startswith("field.") and v not in (None, ""):
+            raw[k[len("field."):]] = v
+
+    type_ref = str(row.get("type") or row.get("type_id") or "").strip()
+    if not type_ref:
+        if raw:
+            raise ValueError("fields given but no type")
+        return cid, name, qty, note, None, []
+    if type_ref not in schemas:
+        raise ValueError(f"unknown type '{type_ref}'")
+    schema = schemas[type_ref]
+
+    unknown = set(raw) - set(schema.by_key)
+    if unknown:
+        raise ValueError(f"unknown field(s) for this type: {', '.join(sorted(unknown))}")
+    values = []
+    for key, f in schema.by_key.items():
+        v = raw.get(key)
+        if v is None or (str(v).strip() == "" and f["kind"] != "checkbox"):
+            if f["required"]:
+                raise ValueError(f"{key} is required")
+            continue
+        values.append((f["id"], _coerce_field_value(f, v)))
+    return cid, name, qty, note, schema.id, values
+
+def _write_import_chunk(chunk) -> list[tuple[int, str]]:
+    """Insert prepared rows [(line, prepared)] in one transaction. Returns [(line, error)] for rows that failed."""
+    conn = get_db(write=True)
+    try:
+        cur = conn.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        # item ids are assigned here (under the writer lock) so values can go in with executemany too
+        cur.execute("""
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name='items'), 0),
+                       COALESCE((SELECT MAX(id) FROM items), 0))
+        """)
+        next_id = cur.fetchone()[0] + 1
+        items, values = [], []
+        for offset, (_, (cid, name, qty, note, type_id, vals)) in enumerate(chunk):
+            iid = next_id + offset
+            items.append((iid, cid, name, qty, note, type_id))
+            values.extend((iid, fid, v) for fid, v in vals)
+        try:
+            # per-row search triggers are paused; the chunk is indexed in one pass instead
+            cur.execute("INSERT INTO search_deferred(flag) VALUES (1)")
+            cur.executemany("INSERT INTO items(id, container_id, name, qty, note, type_id) VALUES (?, ?, ?, ?, ?, ?)", items)
+            cur.executemany("INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, ?, ?)", values)
+            search_index_items(conn, next_id, next_id + len(items) - 1)
+            stamp_item_versions(conn, next_id, next_id + len(items) - 1)
+            log_bulk_change(conn)
+            cur.execute("DELETE FROM search_deferred")
+            conn.commit()
+            return []
+        except sqlite3.DatabaseError:
+            conn.rollback()
+        if len(chunk) == 1:
+            return [(chunk[0][0], "rejected by the database")]
+    finally:
+        conn.close()
+    # a constraint failed somewhere in the chunk: bisect to isolate the bad rows
+    mid = len(chunk) // 2
+    return _write_import_chunk(chunk[:mid]) + _write_import_chunk(chunk[mid:])
+
+def import_items(rows, chunk_size: int = IMPORT_CHUNK_ROWS) -> dict:
+    """
+    Import items from an iterable of (line_no, row dict | error str), e.g. iter_import_rows().
+    Containers and item types are resolved once, dynamic values are validated against
+    item_fields. Returns {"rows", "imported", "failed", "errors": [{"line", "error"}]}.
+    """
+    conn = get_db()
+    try:
+        schemas = _load_type_schemas(conn)
+    finally:
+        conn.close()
+    known_containers, missing_containers = set(), set()
+    report = {"rows": 0, "imported": 0, "failed": 0, "errors": []}
+
+    def fail(line, msg):
+        report["failed"] += 1
+        if len(report["errors"]) < IMPORT_MAX_ERRORS:
+            report["errors"].append({"line": line, "error": msg})
+
+    def flush(pending):
+        # resolve the containers this chunk mentions that we have not seen yet, in one query
+        new = {p[1][0] for p in pending} - known_containers - missing_containers
+        if new:
+            conn = get_db()
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT id FROM containers WHERE id IN (SELECT value FROM json_each(?))",
+                            (json.dumps(sorted(new)),))
+                found = {r["id"] for r in cur.fetchall()}
+            finally:
+                conn.close()
+            known_containers.update(found)
+            missing_containers.update(new - found)
+        ok = []
+        for line, prepared in pending:
+            if prepared[0] in known_containers:
+                ok.append((line, prepared))
+            else:
+                fail(line, f"container '{prepared[0]}' not found")
+        if ok:
+            errors = _write_import_chunk(ok)
+            for line, msg in errors:
+                fail(line, msg)
+            report["imported"] += len(ok) - len(errors)
+
+    pending = []
+    for line, row in rows:
+        if isinstance(row, dict) and row.get("kind", "item") != "item":
+            continue                      # node/container records of a JSONL export
+        report["rows"] += 1
+        if isinstance(row, str):
+            fail(line, row)
+            continue
+        try:
+            pending.append((line, _prepare_import_row(row, schemas)))
+        except ValueError as e:
+            fail(line, str(e))
+        if len(pending) >= chunk_size:
+            flush(pending)
+            pending = []
+    if pending:
+        flush(pending)
+    report["errors"].sort(key=lambda e: e["line"])
+    return report
+
+@app.post("/api/import")
+def api_import(file: UploadFile = File(...), format: str | None = None):
+    """Bulk-import items from an uploaded CSV or JSONL file (format defaults to the file extension)."""
+    fmt = (format or os.path.splitext(file.filename or "")[1].lstrip(".") or "csv").lower()
+    if fmt not in ("csv", "jsonl"):
+        raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        report = import_items(iter_import_rows(stream, fmt))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="file is not UTF-8 text")
+    finally:
+        stream.detach()
+    return JSONResponse(report)
+
+
+# -------------- Export --------------
+# Streams the inventory without materializing it: one cursor over items and one over their
+# dynamic values, both in item-id order, merged as they are read. CSV rows are items only and
+# can be fed back to import-items; JSONL also carries the node and container records.
+EXPORT_FETCH_ROWS = 500
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_CSV_COLUMNS = ["id", "container_id", "container", "location", "name", "qty", "note", "type", "fields"]
+_export_json = json.JSONEncoder(ensure_ascii=False).encode
+
+def _export_filters(node_id: str | None, type_id: str | None, alias: str = "i"):
+    """JOIN/WHERE clauses restricting items to a subtree and/or a type, without changing scan order."""
+    join, where, params = "", [], []
+    if node_id:
+        # CROSS JOIN keeps items as the outer loop, so rows stream in id order with no sort
+        join = f"CROSS JOIN hierarchy h ON h.ancestor_id = ? AND h.kind = 'container' AND h.descendant_id = {alias}.container_id"
+        params.append(node_id)
+    if type_id:
+        where.append(f"{alias}.type_id = ?")
+        params.append(type_id)
+    return join, ("WHERE " + " AND ".join(where)) if where else "", params
+
+def _fetch_iter(cur):
+    while True:
+        rows = cur.fetchmany(EXPORT_FETCH_ROWS)
+        if not rows:
+            return
+        yield from rows
+
+def iter_export_items(conn, node_id: str | None = None, type_id: str | None = None):
+    """Yield one dict per item (with its dynamic values as `fields`), in id order, in constant memory."""
+    join, where, params = _export_filters(node_id, type_id)
+    items = conn.cursor()
+    items.execute(f"""
+        SELECT i.id, i.container_id, c.name AS container, i.name, i.qty, i.note, t.name AS type
+        FROM items i {join}
+        JOIN containers c ON c.id = i.container_id
+        LEFT JOIN item_types t ON t.id = i.type_id
+        {where}
+        ORDER BY i.id
+    """, params)
+    values = conn.cursor()
+    values.execute(f"""
+        SELECT v.item_id, f.name, v.value
+        FROM item_field_values v
+        JOIN items i ON i.id = v.item_id {join}
+        JOIN item_fields f ON f.id = v.field_id
+        {where}
+        ORDER BY v.item_id
+    """, params)
+
+    @lru_cache(maxsize=4096)
+    def location(cid):
+        return " › ".join(a["name"] for a in ancestors_of(conn, "container", cid))
+
+    vals = _fetch_iter(values)
+    pending = next(vals, None)
+    for it in _fetch_iter(items):
+        fields = {}
+        while pending is not None and pending["item_id"] <= it["id"]:
+            if pending["item_id"] == it["id"]:
+                fields[pending["name"]] = pending["value"]
+            pending = next(vals, None)
+        yield {"id": it["id"], "container_id": it["container_id"], "container": it["container"],
+               "location": location(it["container_id"]), "name": it["name"], "qty": it["qty"],
+               "note": it["note"] or "", "type": it["type"] or "", "fields": fields}
+
+def iter_export_structure(conn, node_id: str | None = None):
+    """Yield node and container records (parents before children) for the whole tree or one subtree."""
+    cur = conn.cursor()
+    if node_id:
+        cur.execute("""
+            SELECT n.id, n.type, n.name, n.parent_id, n.note
+            FROM hierarchy h JOIN nodes n ON n.id = h.descendant_id
+            WHERE h.ancestor_id = ? AND h.kind = 'node'
+            ORDER BY h.depth, n.name
+        """, (node_id,))
+    else:
+        cur.execute("""
+            SELECT n.id, n.type, n.name, n.parent_id, n.note
+            FROM nodes n
+            ORDER BY (SELECT MAX(depth) FROM hierarchy h WHERE h.kind = 'node' AND h.descendant_id = n.id), n.name
+        """)
+    for r in _fetch_iter(cur):
+        yield {"kind": "node", **dict(r)}
+    join = ("JOIN hierarchy h ON h.descendant_id = c.id AND h.kind = 'container' AND h.ancestor_id = ?"
+            if node_id else "")
+    cur.execute(f"SELECT c.id, c.type, c.name, c.parent_id, c.note FROM containers c {join} ORDER BY c.id",
+                (node_id,) if node_id else ())
+    for r in _fetch_iter(cur):
+        yield {"kind": "container", **dict(r)}
+
+def iter_export(fmt: str, node_id: str | None = None, type_id: str | None = None):
+    """Yield the export as text chunks of about EXPORT_CHUNK_BYTES; owns its own pooled connection."""
+    conn = get_db()
+    try:
+        buf = io.StringIO()
+        if fmt == "csv":
+            writer = csv.DictWriter(buf, fieldnames=EXPORT_CSV_COLUMNS, lineterminator="\n")
+            writer.writeheader()
+            for it in iter_export_items(conn, node_id, type_id):
+                writer.writerow({**it, "fields": _export_json(it["fields"]) if it["fields"] else ""})
+                if buf.tell() >= EXPORT_CHUNK_BYTES:
+                    yield buf.getvalue()
+                    buf.seek(0); buf.truncate()
+        else:
+            records = iter_export_items(conn, node_id, type_id)
+            if not type_id:
+                records = itertools.chain(iter_export_structure(conn, node_id),
+                                          ({"kind": "item", **it} for it in records))
+            for rec in records:
+                buf.write(_export_json(rec))
+                buf.write("\n")
+                if buf.tell() >= EXPORT_CHUNK_BYTES:
+                    yield buf.getvalue()
+                    buf.seek(0); buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+    finally:
+        conn.close()
+
+@app.get("/api/export")
+def api_export(format: str = "jsonl", node_id: str | None = None, type_id: str | None = None):
+    """Stream the inventory (or one subtree / item type) as JSONL or CSV."""
+    if format not in ("jsonl", "csv"):
+        raise HTTPException(status_code=400, detail="format must be jsonl or csv")
+    conn = get_db(); cur = conn.cursor()
+    if node_id:
+        cur.execute("SELECT 1 FROM nodes WHERE id=?", (node_id,))
+        if not cur.fetchone():
+            conn.close(); raise HTTPException(status_code=404, detail="Node not found")
+    if type_id:
+        cur.execute("SELECT 1 FROM item_types WHERE id=?", (type_id,))
+        if not cur.fetchone():
+            conn.close(); raise HTTPException(status_code=404, detail="Item type not found")
+    conn.close()
+
+    filename = f"inventory-{time.strftime('%Y%m%d')}.{format}"
+    media = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(iter_export(format, node_id, type_id), media_type=f"{media}; charset=utf-8",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+# -------------- Batch operations --------------
+# POST /api/batch runs a list of operations in one write transaction. The list is validated first
+# against an in-memory copy of the rows it touches (three queries, whatever its length), replaying
+# each op so later ones see the effect of earlier ones; then every run of consecutive ops of the
+# same kind is applied with one set-based statement.
+BATCH_MAX_OPS = int(os.getenv("BATCH_MAX_OPS", "5000"))
+BATCH_OPS = {                     # op -> required keys
+    "move_item": ("item_id", "dest_container_id"),
+    "move_container": ("container_id", "dest_parent_id"),
+    "move_node": ("node_id",),    # dest_parent_id null/absent = top level
+    "delete_item": ("item_id",),
+    "delete_container": ("container_id",),
+    "update_item": ("item_id",),  # any of name, qty, note, fields {key: value}
+    "reorder_fields": ("type_id", "order"),
+}
+
+def _parse_batch_op(op) -> dict:
+    if not isinstance(op, dict) or op.get("op") not in BATCH_OPS:
+        raise ValueError(f"op must be one of {', '.join(BATCH_OPS)}")
+    missing = [k for k in BATCH_OPS[op["op"]] if op.get(k) in (None, "")]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+    op = dict(op)
+    if "item_id" in op:
+        try:
+            op["item_id"] = int(op["item_id"])
+        except (TypeError, ValueError):
+            raise ValueError("item_id must be an integer")
+    if op["op"] == "update_item":
+        if "name" in op:
+            op["name"] = str(op["name"] or "").strip()
+            if not op["name"]:
+                raise ValueError("name cannot be empty")
+        if "note" in op:
+            op["note"] = str(op["note"] or "").strip()
+        if "qty" in op:
+            try:
+                op["qty"] = int(op["qty"])
+            except (TypeError, ValueError):
+                raise ValueError("qty must be an integer")
+        if not isinstance(op.get("fields", {}), dict):
+            raise ValueError("fields must be an object")
+    if op["op"] == "reorder_fields" and not (isinstance(op["order"], list) and all(isinstance(x, str) for x in op["order"])):
+        raise ValueError("order must be a list of field ids")
+    return op
+
+def _rows_by_id(cur, sql: str, ids) -> dict:
+    if not ids:
+        return {}
+    cur.execute(f"{sql} WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(ids)),))
+    return {r["id"]: dict(r) for r in cur.fetchall()}
+
+def validate_batch(conn, ops: list) -> list:
+    """Check ops in order against the current rows; returns one normalized op dict or error str per op."""
+    parsed = []
+    for op in ops:
+        try:
+            parsed.append(_parse_batch_op(op))
+        except ValueError as e:
+            parsed.append(str(e))
+    ok = [op for op in parsed if isinstance(op, dict)]
+    cur = conn.cursor()
+    items = _rows_by_id(cur, "SELECT id, container_id, type_id FROM items", {op["item_id"] for op in ok if "item_id" in op})
+    containers = _rows_by_id(cur, "SELECT id, type, parent_id FROM containers",
+                             {op[k] for op in ok for k in ("container_id", "dest_container_id") if op.get(k)})
+    nodes = _rows_by_id(cur, "SELECT id, type, parent_id FROM nodes",
+                        {op[k] for op in ok for k in ("node_id", "dest_parent_id") if op.get(k)})
+    deleted = set()               # containers removed earlier in the batch
+
+    def live_container(cid, what="container"):
+        c = containers.get(cid)
+        if c is None or cid in deleted:
+            raise ValueError(f"{what} {cid} not found")
+        return c
+
+    out = []
+    for op in parsed:
+        if isinstance(op, str):
+            out.append(op)
+            continue
+        kind = op["op"]
+        try:
+            it = None
+            if "item_id" in op:
+                it = items.get(op["item_id"])
+                if it is None or it["container_id"] in deleted:
+                    raise ValueError(f"item {op['item_id']} not found")
+            if kind == "move_item":
+                it["container_id"] = live_container(op["dest_container_id"], "destination container")["id"]
+            elif kind == "move_container":
+                c = live_container(op["container_id"])
+                dest = nodes.get(op["dest_parent_id"])
+                if dest is None:
+                    raise ValueError(f"destination node {op['dest_parent_id']} not found")
+                if c["type"] not in ALLOWED_CONTAINER_BY_PARENT.get(dest["type"], set()):
+                    raise ValueError(f"{c['type']} not allowed under {dest['type']}")
+                c["parent_id"] = dest["id"]
+            elif kind == "move_node":
+                n = nodes.get(op["node_id"])
+                if n is None:
+                    raise ValueError(f"node {op['node_id']} not found")
+                parent_type = "ROOT"
+                if op.get("dest_parent_id"):
+                    dest = nodes.get(op["dest_parent_id"])
+                    if dest is None:
+                        raise ValueError(f"destination node {op['dest_parent_id']} not found")
+                    parent_type = dest["type"]
+                # each node type lives at a fixed depth under these rules, so a valid move cannot form a cycle
+                if n["type"] not in ALLOWED_NODE_CHILDREN.get(parent_type, set()):
+                    raise ValueError(f"{n['type']} not allowed under {parent_type}")
+                op["dest_parent_id"] = n["parent_id"] = op.get("dest_parent_id") or None
+            elif kind == "delete_item":
+                del items[op["item_id"]]
+            elif kind == "delete_container":
+                deleted.add(live_container(op["container_id"])["id"])
+            elif kind == "update_item" and op.get("fields"):
+                schema = type_schemas.get(conn, it["type_id"]) if it["type_id"] else None
+                if schema is None:
+                    raise ValueError("fields given but the item has no type")
+                unknown = set(op["fields"]) - set(schema.by_key)
+                if unknown:
+                    raise ValueError(f"unknown field(s) for this type: {', '.join(sorted(unknown))}")
+                op["values"] = [(schema.by_key[k]["id"], schema.validate(k, v)) for k, v in op["fields"].items()]
+            elif kind == "reorder_fields" and type_schemas.get(conn, op["type_id"]) is None:
+                raise ValueError(f"item type {op['type_id']} not found")
+        except ValueError as e:
+            out.append(str(e))
+            continue
+        out.append(op)
+    return out
+
+def _bulk_set_parent(cur, table: str, col: str, moves: dict):
+    """UPDATE table SET col = moves[id] for every id in moves, as one statement."""
+    cur.execute(f"""
+        UPDATE {table} SET {col} = m.dest
+        FROM (SELECT json_extract(value, '$[0]') AS id, json_extract(value, '$[1]') AS dest FROM json_each(?)) AS m
+        WHERE {table}.id = m.id
+    """, (json.dumps(list(moves.items())),))
+
+def apply_batch(conn, ops: list) -> list[str]:
+    """Apply validated ops in order, one statement per run of same-kind ops. Returns deleted container ids."""
+    cur = conn.cursor()
+    removed = []
+    for kind, run in itertools.groupby(ops, key=lambda op: op["op"]):
+        run = list(run)
+        if kind == "move_item":
+            _bulk_set_parent(cur, "items", "container_id", {op["item_id"]: op["dest_container_id"] for op in run})
+        elif kind == "move_container":
+            _bulk_set_parent(cur, "containers", "parent_id", {op["container_id"]: op["dest_parent_id"] for op in run})
+        elif kind == "move_node":
+            _bulk_set_parent(cur, "nodes", "parent_id", {op["node_id"]: op["dest_parent_id"] for op in run})
+        elif kind == "delete_item":
+            ids = json.dumps([op["item_id"] for op in run])
+            # drop the search documents in bulk so the per-row delete triggers have nothing to flush
+            cur.execute("""
+                DELETE FROM search_fts WHERE rowid IN (
+                    SELECT doc_id FROM search_docs WHERE kind='item' AND ref_id IN (SELECT value FROM json_each(?)))
+            """, (ids,))
+            cur.execute("DELETE FROM search_docs WHERE kind='item' AND ref_id IN (SELECT value FROM json_each(?))", (ids,))
+            cur.execute("DELETE FROM item_field_values WHERE item_id IN (SELECT value FROM json_each(?))", (ids,))
+            cur.execute("DELETE FROM items WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+        elif kind == "delete_container":
+            removed += cascade_delete(conn, container_ids=[op["container_id"] for op in run])
+        elif kind == "update_item":
+            cols = [op for op in run if {"name", "qty", "note"} & set(op)]
+            cur.executemany("UPDATE items SET name=COALESCE(?, name), qty=COALESCE(?, qty), note=COALESCE(?, note) WHERE id=?",
+                            [(op.get("name"), op.get("qty"), op.get("note"), op["item_id"]) for op in cols])
+            cur.executemany("""
+                INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, ?, ?)
+                ON CONFLICT(item_id, field_id) DO UPDATE SET value=excluded.value WHERE value IS NOT excluded.value
+            """, [(op["item_id"], fid, v) for op in run for fid, v in op.get("values", ())])
+        elif kind == "reorder_fields":
+            for op in run:
+                reorder_type_fields(conn, op["type_id"], op["order"])
+    return removed
+
+@app.post("/api/batch")
+def api_batch(background_tasks: BackgroundTasks, payload: dict = Body(...)):
+    """
+    Apply {"ops": [{"op": ..., ...}], "atomic": true} in one transaction. With atomic (the
+    default) nothing is applied if any op is invalid (400); otherwise invalid ops are skipped.
+    Returns {"ok", "applied", "results": [{"index", "op", "ok", "error"?}]}, where a result's
+    "ok" says whether that op passed validation.
+    """
+    ops = payload.get("ops")
+    if not isinstance(ops, list) or not ops:
+        raise HTTPException(status_code=400, detail="ops must be a non-empty list")
+    if len(ops) > BATCH_MAX_OPS:
+        raise HTTPException(status_code=413, detail=f"at most {BATCH_MAX_OPS} ops per batch")
+    atomic = bool(payload.get("atomic", True))
+
+    conn = get_db(write=True)
+    try:
+        conn.execute("BEGIN IMMEDIATE")   # validate and apply against the same snapshot
+        checked = validate_batch(conn, ops)
+        results = [{"index": i, "op": op.get("op") if isinstance(op, dict) else None, "ok": isinstance(r, dict)}
+                   for i, (op, r) in enumerate(zip(ops, checked))]
+        for res, r in zip(results, checked):
+            if isinstance(r, str):
+                res["error"] = r
+        valid = [r for r in checked if isinstance(r, dict)]
+        if atomic and len(valid) < len(ops):
+            conn.rollback()
+            return JSONResponse({"ok": False, "applied": 0, "results": results}, status_code=400)
+        try:
+            removed = apply_batch(conn, valid)
+            conn.commit()
+        except sqlite3.DatabaseError as e:
+            conn.rollback()
+            raise HTTPException(status_code=409, detail=f"batch rolled back: {e}")
+    finally:
+        conn.close()
+    if removed:
+        background_tasks.add_task(remove_qr_files, removed)
+    return JSONResponse({"ok": len(valid) == len(ops), "applied": len(valid), "results": results})
+
+
+# -------------- Scan resolution --------------
+# What the scanner shows right after decoding a label: a small card (breadcrumb, counts, first few
+# items or children) instead of a full page load. A code is resolved with one primary-key lookup
+# across containers and nodes (items use an "item:<id>" code); cards are kept in memory until the
+# next write bumps data_version, so a repeat scan costs a single-row read.
+SCAN_PREVIEW = 8
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", "4096"))
+_SCAN_ITEM = re.compile(r"ITEM[:\-]?(\d+)")
+_SCAN_UNKNOWN = object()
+
+def normalize_scan_code(code: str) -> str:
+    """Upper-cased ID; full URLs (older labels) are reduced to their last path segment."""
+    return code.strip().rstrip("/").rsplit("/", 1)[-1].upper()
+
+def _scan_path(conn, kind: str, ref_id: str) -> list[dict]:
+    return [{"id": a["id"], "type": a["type"], "name": a["name"]} for a in ancestors_of(conn, kind, ref_id)]
+
+def build_scan_payload(conn, code: str) -> dict | None:
+    cur = conn.cursor()
+    m = _SCAN_ITEM.fullmatch(code)
+    if m:
+        cur.execute("""
+            SELECT i.id, i.name, i.qty, i.note, i.container_id, c.name AS container, c.type AS container_type, t.name AS type
+            FROM items i JOIN containers c ON c.id = i.container_id LEFT JOIN item_types t ON t.id = i.type_id
+            WHERE i.id = ?
+        """, (int(m.group(1)),))
+        it = cur.fetchone()
+        if not it:
+            return None
+        path = _scan_path(conn, "container", it["container_id"])
+        path.append({"id": it["container_id"], "type": it["container_type"], "name": it["container"]})
+        return {"kind": "item", "id": it["id"], "name": it["name"], "type": it["type"], "qty": it["qty"],
+                "note": it["note"] or "", "parent_id": it["container_id"], "url": f"/container/{it['container_id']}",
+                "path": path, "counts": {}, "preview": [], "more": False}
+
+    cur.execute("""
+        SELECT 'container' AS kind, c.id, c.name, c.type, c.parent_id, NULL AS containers, cc.items, cc.qty
+        FROM containers c LEFT JOIN container_counts cc ON cc.container_id = c.id WHERE c.id = ?
+        UNION ALL
+        SELECT 'node', n.id, n.name, n.type, n.parent_id, nc.containers, nc.items, nc.qty
+        FROM nodes n LEFT JOIN node_counts nc ON nc.node_id = n.id WHERE n.id = ?
+        LIMIT 1
+    """, (code, code))
+    r = cur.fetchone()
+    if not r:
+        return None
+    kind = r["kind"]
+    counts = {"items": r["items"] or 0, "qty": r["qty"] or 0}
+    if kind == "container":
+        cur.execute("SELECT id, name, qty FROM items WHERE container_id=? ORDER BY name LIMIT ?",
+                    (r["id"], SCAN_PREVIEW + 1))
+        preview = [dict(x) for x in cur.fetchall()]
+    else:
+        counts["containers"] = r["containers"] or 0
+        cur.execute("""
+            SELECT * FROM (
+                SELECT 'node' AS kind, id, type, name FROM nodes WHERE parent_id = ?
+                UNION ALL
+                SELECT 'container', id, type, name FROM containers WHERE parent_id = ?
+            ) ORDER BY name LIMIT ?
+        """, (r["id"], r["id"], SCAN_PREVIEW + 1))
+        preview = [dict(x) for x in cur.fetchall()]
+    return {"kind": kind, "id": r["id"], "name": r["name"], "type": r["type"], "parent_id": r["parent_id"],
+            "url": f"/{kind}/{r['id']}", "path": _scan_path(conn, kind, r["id"]), "counts": counts,
+            "preview": preview[:SCAN_PREVIEW], "more": len(preview) > SCAN_PREVIEW}
+
+class ScanCache:
+    """Scan cards (and unknown codes) by normalized code, valid for one data_version."""
+    def __init__(self, size: int = SCAN_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._version = None
+        self._cards = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "resets": 0}
+
+    def get(self, conn, code: str) -> dict | None:
+        version = data_version(conn)
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                if self._cards:
+                    self._cards.clear()
+                    self.stats["resets"] += 1
+            card = self._cards.get(code)
+            if card is not None:
+                self._cards.move_to_end(code)
+                self.stats["hits"] += 1
+                return None if card is _SCAN_UNKNOWN else card
+            self.stats["misses"] += 1
+        # built after the version read: a write in between only means the next get() clears it
+        card = build_scan_payload(conn, code)
+        with self._lock:
+            if version == self._version:
+                self._cards[code] = _SCAN_UNKNOWN if card is None else card
+                while len(self._cards) > self.size:
+                    self._cards.popitem(last=False)
+        return card
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "version": self._version, "entries": len(self._cards)}
+
+scan_cache = ScanCache()
+
+@app.get("/api/scan/{code:path}")
+def api_scan(code: str):
+    """Resolve a scanned code (container or node id, or item:<id>) to its scan card."""
+    conn = get_db()
+    try:
+        card = scan_cache.get(conn, normalize_scan_code(code))
+    finally:
+        conn.close()
+    if card is None:
+        raise HTTPException(status_code=404, detail="Unknown code")
+    return JSONResponse(card)
+
+
 # -------------- Home = Map --------------
 @app.get("/", response_class=HTMLResponse)
 def map_view(request: Request, q: str | None = None):
@@ -443,81 +3712,31 @@ def map_view(request: Request, q: str | None = None):
       - show matched items under each matching container
     """
     conn = get_db(); cur = conn.cursor()
+    change_seq = latest_change_seq(conn)       # read first: anything later reaches the page's change feed
 
-    # Top-level nodes
-    cur.execute("SELECT * FROM nodes WHERE parent_id IS NULL ORDER BY type, name")
+    # Top-level nodes with their (trigger-maintained) subtree counts
+    cur.execute("""
+        SELECT n.*, nc.shelves, nc.drawers, nc.containers
+        FROM nodes n LEFT JOIN node_counts nc ON nc.node_id = n.id
+        WHERE n.parent_id IS NULL
+        ORDER BY n.type, n.name
+    """)
     top = cur.fetchall()
-    top_ids = [t["id"] for t in top]
-
-    # Children per top
-    children = {}
-    for n in top:
-        cur.execute("SELECT * FROM nodes WHERE parent_id=? ORDER BY type, name", (n["id"],))
-        subs = cur.fetchall()
-        shelves = [s for s in subs if s["type"] == "Shelf"]
-        drawers = [d for d in subs if d["type"] == "Drawer"]
-        children[n["id"]] = {"shelves": shelves, "drawers": drawers}
-
-    # Counts for the top-level tiles
-    shelves_count, drawers_count, containers_count = {}, {}, {}
-    if top_ids:
-        placeholders = ",".join("?" * len(top_ids))
-        cur.execute(f"""
-            SELECT parent_id, type, COUNT(*) AS cnt
-            FROM nodes
-            WHERE parent_id IN ({placeholders}) AND type IN ('Shelf','Drawer')
-            GROUP BY parent_id, type
-        """, top_ids)
-        for r in cur.fetchall():
-            (shelves_count if r["type"]=="Shelf" else drawers_count)[r["parent_id"]] = r["cnt"]
-
-        cur.execute(f"""
-            SELECT t.id AS top_id, COUNT(*) AS cnt
-            FROM containers c
-            JOIN nodes p ON p.id = c.parent_id
-            JOIN nodes t ON t.id = p.parent_id
-            WHERE t.id IN ({placeholders})
-            GROUP BY t.id
-        """, top_ids)
-        for r in cur.fetchall():
-            containers_count[r["top_id"]] = r["cnt"]
+    shelves_count = {t["id"]: t["shelves"] or 0 for t in top}
+    drawers_count = {t["id"]: t["drawers"] or 0 for t in top}
+    containers_count = {t["id"]: t["containers"] or 0 for t in top}
 
-    # Global search results (containers)
-    results = []
-    matched_items = {}
+    # Global search results (containers, ranked) + matched items per container
+    results, matched_items = [], {}
     if q:
-        like = f"%{q}%"
-        cur.execute("""
-            SELECT DISTINCT c.*, p.name AS parent_name, p.type AS parent_type, t.name AS top_name, t.id AS top_id
-            FROM containers c
-            JOIN nodes p ON p.id=c.parent_id
-            LEFT JOIN nodes t ON t.id=p.parent_id
-            LEFT JOIN items it ON it.container_id=c.id
-            WHERE c.name LIKE ? OR c.type LIKE ? OR p.name LIKE ? OR t.name LIKE ? OR it.name LIKE ? OR it.note LIKE ?
-            ORDER BY t.name, p.name, c.name
-        """, (like, like, like, like, like, like))
-        results = cur.fetchall()
-
-        # collect matched items for the containers shown above
-        cont_ids = [r["id"] for r in results]
-        if cont_ids:
-            placeholders = ",".join("?" * len(cont_ids))
-            cur.execute(f"""
-                SELECT it.id AS item_id, it.name, it.qty, it.note, c.id AS cont_id
-                FROM items it
-                JOIN containers c ON c.id = it.container_id
-                WHERE c.id IN ({placeholders}) AND (it.name LIKE ? OR it.note LIKE ?)
-                ORDER BY it.id DESC
-            """, cont_ids + [like, like])
-            for row in cur.fetchall():
-                matched_items.setdefault(row["cont_id"], []).append(row)
+        results, matched_items = search_inventory(conn, q)
 
     conn.close()
     return render(
         "map.html",
         request=request,
+        change_seq=change_seq,
         top=top,
-        children=children,
         shelves_count=shelves_count,
         drawers_count=drawers_count,
         containers_count=containers_count,
@@ -533,7 +3752,7 @@ def map_view(request: Request, q: str | None = None):
 # -------------- Nodes --------------
 @app.post("/nodes")
 def create_node(name: str = Form(...), type: str = Form(...), parent_id: str | None = Form(None), note: str = Form("")):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
 
     parent_type = None
     if parent_id:
@@ -556,82 +3775,57 @@ def create_node(name: str = Form(...), type: str = Form(...), parent_id: str | N
 @app.get("/node/{node_id}", response_class=HTMLResponse)
 def view_node(request: Request, node_id: str):
     conn = get_db(); cur = conn.cursor()
+    change_seq = latest_change_seq(conn)
     cur.execute("SELECT * FROM nodes WHERE id=?", (node_id,))
     node = cur.fetchone()
     if not node:
         conn.close(); raise HTTPException(status_code=404, detail="Node not found")
 
-    # NEW: parent (for Shelf/Drawer)
-    parent = None
-    if node["parent_id"]:
-        cur.execute("SELECT id, name, type, note FROM nodes WHERE id=?", (node["parent_id"],))
-        parent = cur.fetchone()
-
-    # child nodes
-    cur.execute("SELECT * FROM nodes WHERE parent_id=? ORDER BY type, name", (node_id,))
-    subs = cur.fetchall()
+    # breadcrumb: every node above this one, root first
+    ancestors = ancestors_of(conn, "node", node_id)
+    parent = ancestors[-1] if ancestors else None
 
-    # containers under this node
-    cur.execute("SELECT * FROM containers WHERE parent_id=? ORDER BY type, name", (node_id,))
-    containers = cur.fetchall()
-
-    # NEW: items count per container (to show "Items: N" or "No items")
-    # Items count per container (LEFT JOIN by current node)
-    items_count = {}
-    cur.execute("""
-        SELECT c.id AS cid, COUNT(i.id) AS cnt
-        FROM containers c
-        LEFT JOIN items i ON i.container_id = c.id
-        WHERE c.parent_id = ?
-        GROUP BY c.id
+    # child nodes + their subtree counts; the container name is shown when there is exactly one
+    cur.execute(f"""
+        SELECT n.*, {", ".join(f"nc.{col}" for col in CONTAINER_TYPE_COLS.values())}, nc.containers,
+               CASE WHEN nc.containers = 1 THEN (
+                   SELECT c.name FROM hierarchy h JOIN containers c ON c.id = h.descendant_id
+                   WHERE h.ancestor_id = n.id AND h.kind = 'container') END AS single_name
+        FROM nodes n LEFT JOIN node_counts nc ON nc.node_id = n.id
+        WHERE n.parent_id=?
+        ORDER BY n.type, n.name
     """, (node_id,))
-    for r in cur.fetchall():
-        # sqlite3.Row: access by key; if tuple, use r[0], r[1]
-        cid = r["cid"] if isinstance(r, dict) or hasattr(r, "keys") else r[0]
-        cnt = r["cnt"] if isinstance(r, dict) or hasattr(r, "keys") else r[1]
-        items_count[cid] = cnt
+    subs = cur.fetchall()
 
-    # --- counts of containers under each child shelf/drawer
     counts = {}          # total per child
     bytype = {}          # per child -> { 'Box':n, 'Organizator':m, 'InPlace':k }
     single_names = {}    # per child -> container name if exactly 1
-
-    child_ids = [s["id"] for s in subs]
-    if child_ids:
-        placeholders = ",".join("?" * len(child_ids))
-
-        # per-type counts
-        cur.execute(f"""
-            SELECT parent_id, type, COUNT(*) AS cnt
-            FROM containers
-            WHERE parent_id IN ({placeholders})
-            GROUP BY parent_id, type
-        """, child_ids)
-        for r in cur.fetchall():
-            pid, typ, cnt = r["parent_id"], r["type"], r["cnt"]
-            bytype.setdefault(pid, {})[typ] = cnt
-            counts[pid] = counts.get(pid, 0) + cnt
-
-        # collect names to show the single one if only one exists
-        cur.execute(f"""
-            SELECT parent_id, name
-            FROM containers
-            WHERE parent_id IN ({placeholders})
-            ORDER BY name
-        """, child_ids)
-        names_map = {}
-        for r in cur.fetchall():
-            names_map.setdefault(r["parent_id"], []).append(r["name"])
-        for pid, names in names_map.items():
-            if len(names) == 1:
-                single_names[pid] = names[0]
+    for s in subs:
+        if not s["containers"]:
+            continue
+        counts[s["id"]] = s["containers"]
+        bytype[s["id"]] = {typ: s[col] for typ, col in CONTAINER_TYPE_COLS.items() if s[col]}
+        if s["single_name"] is not None:
+            single_names[s["id"]] = s["single_name"]
+
+    # containers under this node, with their item counts
+    cur.execute("""
+        SELECT c.*, COALESCE(cc.items, 0) AS item_count
+        FROM containers c LEFT JOIN container_counts cc ON cc.container_id = c.id
+        WHERE c.parent_id=?
+        ORDER BY c.type, c.name
+    """, (node_id,))
+    containers = cur.fetchall()
+    items_count = {c["id"]: c["item_count"] for c in containers}
 
     conn.close()
     return render(
         "node.html",
         request=request,
+        change_seq=change_seq,
         node=node,
         parent=parent,
+        ancestors=ancestors,
         subs=subs,
         containers=containers,
         counts=counts,
@@ -643,28 +3837,28 @@ def view_node(request: Request, node_id: str):
 
 
 @app.post("/node/{node_id}/delete")
-def delete_node(node_id: str):
-    conn = get_db()
+def delete_node(node_id: str, background_tasks: BackgroundTasks):
+    conn = get_db(write=True)
     try:
         cur = conn.cursor()
         cur.execute("SELECT id, parent_id FROM nodes WHERE id=?", (node_id,))
         row = cur.fetchone()
         if not row:
-            conn.close()
             raise HTTPException(status_code=404, detail="Node not found")
         parent_id = row["parent_id"]
 
-        delete_node_recursive(conn, node_id)
+        removed = delete_node_recursive(conn, node_id)
         conn.commit()
     finally:
         conn.close()
+    background_tasks.add_task(remove_qr_files, removed)
 
     # redirect home for top-level, or back to parent if Shelf/Drawer
     return RedirectResponse(url=f"/node/{parent_id}" if parent_id else "/", status_code=303)
 
 @app.post("/node/{node_id}/update")
 def update_node(node_id: str, name: str = Form(...), note: str = Form("")):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     cur.execute("UPDATE nodes SET name=?, note=? WHERE id=?", (name.strip(), note.strip(), node_id))
     if cur.rowcount == 0:
         conn.close()
@@ -676,7 +3870,7 @@ def update_node(node_id: str, name: str = Form(...), note: str = Form("")):
 # -------------- Containers --------------
 @app.post("/containers")
 def create_container(name: str = Form(...), type: str = Form(...), parent_id: str = Form(...), note: str = Form("")):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     cur.execute("SELECT type FROM nodes WHERE id=?", (parent_id,))
     p = cur.fetchone()
     if not p:
@@ -701,6 +3895,7 @@ def create_container(name: str = Form(...), type: str = Form(...), parent_id: st
 @app.get("/container/{cont_id}", response_class=HTMLResponse)
 def view_container(request: Request, cont_id: str):
     conn = get_db(); cur = conn.cursor()
+    change_seq = latest_change_seq(conn)
 
     # this container
     cur.execute("SELECT * FROM containers WHERE id=?", (cont_id,))
@@ -708,17 +3903,10 @@ def view_container(request: Request, cont_id: str):
     if not cont:
         conn.close(); raise HTTPException(status_code=404, detail="Container not found")
 
-    # parent node (Shelf/Drawer)
-    parent = None
-    top = None
-    if cont["parent_id"]:
-        cur.execute("SELECT id, name, type, note, parent_id FROM nodes WHERE id=?", (cont["parent_id"],))
-        parent = cur.fetchone()
-
-        # top-level (Cabinet/Wardrobe)
-        if parent and parent["parent_id"]:
-            cur.execute("SELECT id, name, type, note FROM nodes WHERE id=?", (parent["parent_id"],))
-            top = cur.fetchone()
+    # breadcrumb: root (Cabinet/Wardrobe) ... parent (Shelf/Drawer)
+    ancestors = ancestors_of(conn, "container", cont_id)
+    parent = ancestors[-1] if ancestors else None
+    top = ancestors[0] if len(ancestors) > 1 else None
 
     cur.execute("SELECT * FROM items WHERE container_id=? ORDER BY name", (cont_id,))
     items = cur.fetchall()
@@ -730,54 +3918,18 @@ def view_container(request: Request, cont_id: str):
     item_ids = [it["id"] for it in items]
     item_dyn = values_for_items(conn, item_ids)
 
-
-
-
-
-    # --- move targets for THIS container (Shelves/Drawers that allow this type) ---
-    allowed_parent_types = [ptype for ptype, allowed in ALLOWED_CONTAINER_BY_PARENT.items() if cont["type"] in allowed]
-    move_nodes = []
-    if allowed_parent_types:
-        placeholders = ",".join("?" * len(allowed_parent_types))
-        cur.execute(f"""
-            SELECT
-                n.id, n.name, n.type, n.note AS note,                 -- target shelf/drawer + its note
-                p.name AS parent_name, p.type AS parent_type, p.note AS parent_note  -- its cabinet/wardrobe + note
-            FROM nodes n
-            LEFT JOIN nodes p ON p.id = n.parent_id
-            WHERE n.type IN ({placeholders})
-            ORDER BY COALESCE(p.name,''), n.name
-        """, allowed_parent_types)
-        move_nodes = cur.fetchall()
-
-    # --- move targets for ITEMS (all other containers) ---
-    cur.execute("""
-        SELECT
-            c.id, c.name, c.type, c.note AS note,                      -- dest container + note
-            p.name AS parent_name, p.type AS parent_type, p.note AS parent_note,  -- shelf/drawer + note
-            t.name AS top_name,  t.type AS top_type,  t.note AS top_note          -- cabinet/wardrobe + note (nullable)
-        FROM containers c
-        JOIN nodes p ON p.id = c.parent_id
-        LEFT JOIN nodes t ON t.id = p.parent_id
-        WHERE c.id != ?
-        ORDER BY COALESCE(t.name,''), COALESCE(p.name,''), c.name
-    """, (cont_id,))
-    move_containers = cur.fetchall()
-
-
-
     conn.close()
     return render(
         "container.html",
         request=request,
+        change_seq=change_seq,
         cont=cont,
         items=items,
         parent=parent,
         top=top,
+        ancestors=ancestors,
         item_types=item_types,
         item_dyn=item_dyn,
-        move_nodes=move_nodes,
-        move_containers=move_containers,
         title=f"{APP_TITLE} · {cont['name']}"
     )
 
@@ -789,34 +3941,32 @@ async def add_item(cont_id: str,
                    qty: int = Form(1),
                    note: str = Form(""),
                    type_id: str | None = Form(None)):
-    conn = get_db(); cur = conn.cursor()
-    cur.execute("SELECT id FROM containers WHERE id=?", (cont_id,))
-    if not cur.fetchone():
-        conn.close(); raise HTTPException(status_code=404, detail="Container not found")
-
-    # create item
-    cur.execute("INSERT INTO items(container_id, name, qty, note, type_id) VALUES (?, ?, ?, ?, ?)",
-                (cont_id, name.strip(), qty, note.strip(), type_id))
-    item_id = cur.lastrowid
-
-    # dynamic fields (if any)
     form = await request.form()
-    if type_id:
-        fields = fields_for_type(conn, type_id)
-        for f in fields:
-            key = f"field_{f['id']}"
-            if key in form:
-                val = str(form[key]).strip()
-                cur.execute("INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, ?, ?)",
-                            (item_id, f["id"], val))
 
-    conn.commit(); conn.close()
+    def write(conn):
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM containers WHERE id=?", (cont_id,))
+        if not cur.fetchone():
+            raise HTTPException(status_code=404, detail="Container not found")
+
+        # create item
+        cur.execute("INSERT INTO items(container_id, name, qty, note, type_id) VALUES (?, ?, ?, ?, ?)",
+                    (cont_id, name.strip(), qty, note.strip(), type_id))
+        item_id = cur.lastrowid
+
+        # dynamic fields (if any)
+        schema = type_schemas.get(conn, type_id) if type_id else None
+        if schema:
+            cur.executemany("INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, ?, ?)",
+                            [(item_id, fid, val) for fid, val in schema.form_values(form)])
+
+    await run_db(write, write=True)
     return RedirectResponse(url=f"/container/{cont_id}", status_code=303)
 
 
 @app.post("/container/{cont_id}/items/{item_id}/delete")
 def delete_item(cont_id: str, item_id: int):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     cur.execute("DELETE FROM items WHERE id=? AND container_id=?", (item_id, cont_id))
     conn.commit(); conn.close()
     return RedirectResponse(url=f"/container/{cont_id}", status_code=303)
@@ -830,12 +3980,13 @@ def refresh_qr_container(cont_id: str):
     if not row:
         raise HTTPException(status_code=404, detail="Container not found")
 
+    qr_cache.invalidate(qr_payload_for_container(cont_id))
     save_qr_with_label(cont_id, row["name"])
     # Add a timestamp query param so the browser fetches the new file
     return RedirectResponse(url=f"/container/{cont_id}?ts={int(time.time())}", status_code=303)
 
 @app.get("/container/{cont_id}/qr.png")
-def container_qr_png(cont_id: str):
+def container_qr_png(cont_id: str, request: Request):
     conn = get_db(); cur = conn.cursor()
     cur.execute("SELECT name FROM containers WHERE id=?", (cont_id,))
     row = cur.fetchone()
@@ -843,15 +3994,20 @@ def container_qr_png(cont_id: str):
     if not row:
         raise HTTPException(status_code=404, detail="Container not found")
 
+    # ETag = render key (payload + label + params): a rename changes it, so revalidation stays cheap
     payload = qr_payload_for_container(cont_id)
-    png = build_qr_with_label_bytes(payload, row["name"])
-    return Response(content=png, media_type="image/png",
-                    headers={"Cache-Control": "no-store, max-age=0"})
+    etag = f'"{qr_cache.key(payload, row["name"])}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    _, png = render_qr_label(payload, row["name"])
+    return Response(content=png, media_type="image/png", headers=headers)
 
 
 @app.post("/container/{cont_id}/delete")
-def delete_container(cont_id: str):
-    conn = get_db(); cur = conn.cursor()
+def delete_container(cont_id: str, background_tasks: BackgroundTasks):
+    conn = get_db(write=True); cur = conn.cursor()
 
     # Find container & parent
     cur.execute("SELECT id, parent_id FROM containers WHERE id=?", (cont_id,))
@@ -861,32 +4017,20 @@ def delete_container(cont_id: str):
         raise HTTPException(status_code=404, detail="Container not found")
     parent_id = row["parent_id"]
 
-    # Delete items
-    cur.execute("DELETE FROM items WHERE container_id=?", (cont_id,))
-    # Delete the container
-    cur.execute("DELETE FROM containers WHERE id=?", (cont_id,))
-
-    # Remove QR png if exists
-    try:
-        png = os.path.join(QRCODES_DIR, f"{cont_id}.png")
-        if os.path.exists(png):
-            os.remove(png)
-    except Exception:
-        pass
-
+    # Delete container, items and their values; QR png goes after commit
+    removed = cascade_delete(conn, container_ids=[cont_id])
     conn.commit()
     conn.close()
+    background_tasks.add_task(remove_qr_files, removed)
 
     # Go back to the parent Shelf/Drawer page
     return RedirectResponse(url=f"/node/{parent_id}", status_code=303)
 
 
-from fastapi import FastAPI, Request, Form, HTTPException
-
 @app.post("/container/{cont_id}/move")
 def move_container(cont_id: str, dest_parent_id: str = Form(...)):
     """Move a container (Box/Organizator/InPlace) to another Shelf/Drawer."""
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
 
     # Check container
     cur.execute("SELECT id, type FROM containers WHERE id=?", (cont_id,))
@@ -917,7 +4061,7 @@ def move_container(cont_id: str, dest_parent_id: str = Form(...)):
 @app.post("/container/{cont_id}/items/move")
 def move_item(cont_id: str, item_id: int = Form(...), dest_container_id: str = Form(...)):
     """Move an item to another container."""
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
 
     # Verify item exists
     cur.execute("SELECT id FROM items WHERE id=?", (item_id,))
@@ -942,28 +4086,36 @@ async def update_item(cont_id: str, item_id: int, request: Request,
                       qty: int = Form(1),
                       note: str = Form(""),
                       type_id: str | None = Form(None)):
-    conn = get_db(); cur = conn.cursor()
-    # verify item
-    cur.execute("SELECT id FROM items WHERE id=? AND container_id=?", (item_id, cont_id))
-    if not cur.fetchone():
-        conn.close(); raise HTTPException(status_code=404, detail="Item not found")
-
-    cur.execute("UPDATE items SET name=?, qty=?, note=?, type_id=? WHERE id=?",
-                (name.strip(), qty, note.strip(), type_id, item_id))
-
-    # wipe previous dynamic values, re-insert from form
-    cur.execute("DELETE FROM item_field_values WHERE item_id=?", (item_id,))
     form = await request.form()
-    if type_id:
-        fields = fields_for_type(conn, type_id)
-        for f in fields:
-            key = f"field_{f['id']}"
-            if key in form:
-                val = str(form[key]).strip()
-                cur.execute("INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, ?, ?)",
-                            (item_id, f["id"], val))
 
-    conn.commit(); conn.close()
+    def write(conn):
+        cur = conn.cursor()
+        # verify item
+        cur.execute("SELECT name, qty, note, type_id FROM items WHERE id=? AND container_id=?", (item_id, cont_id))
+        it = cur.fetchone()
+        if not it:
+            raise HTTPException(status_code=404, detail="Item not found")
+
+        row = (name.strip(), qty, note.strip(), type_id)
+        if tuple(it) != row:
+            cur.execute("UPDATE items SET name=?, qty=?, note=?, type_id=? WHERE id=?", (*row, item_id))
+
+        # dynamic values: write only what differs from the stored ones
+        schema = type_schemas.get(conn, type_id) if type_id else None
+        wanted = dict(schema.form_values(form)) if schema else {}
+        cur.execute("SELECT field_id, value FROM item_field_values WHERE item_id=?", (item_id,))
+        stored = {r["field_id"]: r["value"] for r in cur.fetchall()}
+        gone = [(item_id, fid) for fid in stored if fid not in wanted]
+        changed = [(item_id, fid, v) for fid, v in wanted.items() if stored.get(fid, object()) != v]
+        if gone:
+            cur.executemany("DELETE FROM item_field_values WHERE item_id=? AND field_id=?", gone)
+        if changed:
+            cur.executemany("""
+                INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, ?, ?)
+                ON CONFLICT(item_id, field_id) DO UPDATE SET value=excluded.value
+            """, changed)
+
+    await run_db(write, write=True)
     return RedirectResponse(url=f"/container/{cont_id}", status_code=303)
 
 
@@ -978,9 +4130,80 @@ def api_container(cont_id: str):
     return JSONResponse({"id": row["id"], "parent_id": row["parent_id"], "type": row["type"], "name": row["name"]})
 
 
+MOVE_TARGETS_PAGE = 50
+
+def _encode_cursor(name: str, rid: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([name, rid]).encode()).decode()
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        name, rid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(name), str(rid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/move-targets")
+def api_move_targets(kind: str = "container", q: str = "", exclude: str | None = None,
+                     for_type: str | None = None, after: str | None = None, limit: int = MOVE_TARGETS_PAGE):
+    """
+    One page of move destinations, ordered by (name, id) case-insensitively:
+      - kind=container: containers to move an item into (optionally excluding one)
+      - kind=node: Shelves/Drawers that accept a container of `for_type`
+    `q` is a name prefix; pass the returned `next` back as `after` for the following page.
+    Every page is a single index range scan, however large the inventory.
+    """
+    if kind not in ("container", "node"):
+        raise HTTPException(status_code=400, detail="kind must be 'container' or 'node'")
+    limit = max(1, min(limit, 200))
+    table = "containers" if kind == "container" else "nodes"
+    where, params = [], []
+
+    q = (q or "").strip()
+    if q:
+        where.append("t.name COLLATE NOCASE >= ? AND t.name COLLATE NOCASE < ?")
+        params += [q, q + "\U0010ffff"]
+    if after:
+        where.append("(t.name COLLATE NOCASE, t.id) > (?, ?)")
+        params += list(_decode_cursor(after))
+    if kind == "container":
+        if exclude:
+            where.append("t.id != ?")
+            params.append(exclude)
+    else:
+        parent_types = [pt for pt, allowed in ALLOWED_CONTAINER_BY_PARENT.items()
+                        if for_type is None or for_type in allowed]
+        if not parent_types:
+            return JSONResponse({"items": [], "next": None})
+        where.append(f"t.type IN ({','.join('?' * len(parent_types))})")
+        params += parent_types
+
+    conn = get_db(); cur = conn.cursor()
+    cur.execute(f"""
+        SELECT t.id, t.type, t.name, t.note,
+               (SELECT group_concat(name, ' › ') FROM (
+                    SELECT n.name FROM hierarchy h JOIN nodes n ON n.id = h.ancestor_id
+                    WHERE h.kind = ? AND h.descendant_id = t.id AND h.depth > 0
+                    ORDER BY h.depth DESC)) AS path
+        FROM {table} t INDEXED BY idx_{table}_name
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY t.name COLLATE NOCASE, t.id
+        LIMIT ?
+    """, [kind] + params + [limit + 1])
+    rows = cur.fetchall()
+    conn.close()
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return JSONResponse({
+        "items": [{"id": r["id"], "type": r["type"], "name": r["name"], "note": r["note"] or "", "path": r["path"] or ""}
+                  for r in rows],
+        "next": _encode_cursor(rows[-1]["name"], rows[-1]["id"]) if more else None,
+    })
+
+
 @app.post("/container/{cont_id}/update")
 def update_container(cont_id: str, name: str = Form(...), note: str = Form("")):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     cur.execute("UPDATE containers SET name=?, note=? WHERE id=?", (name.strip(), note.strip(), cont_id))
     if cur.rowcount == 0:
         conn.close()
@@ -989,6 +4212,7 @@ def update_container(cont_id: str, name: str = Form(...), note: str = Form("")):
     conn.commit(); conn.close()
 
     # Regenerate QR label image with the new name
+    qr_cache.invalidate(qr_payload_for_container(cont_id))
     save_qr_with_label(cont_id, name.strip())
 
     # Cache-bust the image & page
@@ -1036,20 +4260,143 @@ def api_item_detail(item_id: int):
     conn.close()
     return JSONResponse({"item": dict(it), "fields": fields})
 
+@app.get("/api/db/stats")
+def api_db_stats(request: Request):
+    """Connection-pool counters: reader hits/misses/waits and writer contention, plus executor, schema, response and scan caches."""
+    require_admin(request)
+    return JSONResponse({**db_pool.snapshot(), "executor": db_executor.snapshot(),
+                         "type_schemas": type_schemas.snapshot(), "responses": response_cache.snapshot(),
+                         "scan": scan_cache.snapshot(), "changes": change_feed.snapshot()})
+
+@app.get("/metrics")
+def metrics(request: Request):
+    """Prometheus text exposition of request, SQL, render and pool metrics (this process only)."""
+    require_admin(request)
+    return Response(metrics_text(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/debug/slow-queries")
+def api_slow_queries(request: Request, limit: int = 20, order: str = "max_ms", reset: bool = False):
+    """Worst statement shapes seen over SLOW_QUERY_MS (by max_ms, total_ms or count) and the most recent entries."""
+    require_admin(request)
+    if order not in ("max_ms", "total_ms", "count"):
+        raise HTTPException(status_code=400, detail="order must be max_ms, total_ms or count")
+    snap = slow_log.snapshot(max(1, min(limit, SLOW_QUERY_RING)), order)
+    if reset:
+        slow_log.reset()
+    return JSONResponse(snap)
+
+@app.post("/api/debug/profile")
+async def api_profile(request: Request, seconds: float = 10, route: str | None = None, requests: int | None = None,
+                      format: str = "collapsed", interval_ms: float = PROFILE_INTERVAL_MS):
+    """
+    Sample stacks for `seconds` (max PROFILE_MAX_SECONDS) and return them as collapsed stacks or
+    speedscope JSON. With `route` (a template such as /container/{cont_id}, or any path it
+    matches) only that route's handlers are sampled; `requests` ends the session after that many.
+    """
+    require_admin(request)
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be collapsed or speedscope")
+    if requests is not None and not route:
+        raise HTTPException(status_code=400, detail="requests needs a route")
+    if route:
+        if not any(getattr(r, "path", None) == route for r in app.router.routes):
+            route = _route_for("GET", route)
+        if route == "<unmatched>" or not _handler_codes(route):
+            raise HTTPException(status_code=404, detail="No such route")
+    try:
+        prof = SamplingProfiler.start(min(max(seconds, 0.1), PROFILE_MAX_SECONDS),
+                                      min(max(interval_ms, 1), 100) / 1000, route, requests)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    while not prof.done.is_set():
+        await asyncio.sleep(0.05)
+    headers = {"X-Profile-Samples": str(prof.samples), "X-Profile-Requests": str(prof.completed)}
+    if format == "speedscope":
+        headers["Content-Disposition"] = 'attachment; filename="profile.speedscope.json"'
+        return JSONResponse(prof.speedscope(), headers=headers)
+    return Response(prof.collapsed(), media_type="text/plain; charset=utf-8", headers=headers)
+
+@app.get("/api/changes/stream")
+async def changes_stream(request: Request, scope: str | None = None, since: int | None = None):
+    """
+    Server-sent events for changes under `scope` (a node or container id; everything if omitted).
+    `since` (or the Last-Event-ID header on reconnect) replays what was missed after that seq;
+    when that is more than the journal can replay, a `reset` event tells the page to reload.
+    """
+    last_event = request.headers.get("last-event-id", "")
+    if last_event.isdigit():
+        since = int(last_event)
+    sub = await change_feed.subscribe(scope)
+    backlog, reset = [], False
+    if since is not None and since < sub.seq:
+        oldest = await run_db(oldest_change_seq)
+        if oldest is None or oldest > since + 1:
+            reset = True
+        else:
+            backlog = [ev for ev in await run_db(read_changes, since, CHANGE_FEED_BACKLOG + 1, scope) if ev["seq"] <= sub.seq]
+            reset = len(backlog) > CHANGE_FEED_BACKLOG
+    elif since is not None:
+        sub.seq = since                       # the page already reflects everything up to `since`
+
+    async def events():
+        try:
+            yield f"retry: 3000\n\n"
+            if reset:
+                yield f"id: {sub.seq}\nevent: reset\ndata: {{}}\n\n"
+            else:
+                for ev in backlog:
+                    yield _sse(ev)
+            while True:
+                try:
+                    ev = await asyncio.wait_for(sub.queue.get(), CHANGE_FEED_PING)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if ev is None:
+                    yield f"event: reset\ndata: {{}}\n\n"
+                    return
+                if ev["seq"] > sub.seq:
+                    sub.seq = ev["seq"]
+                    yield _sse(ev)
+        finally:
+            change_feed.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/sync")
+def api_sync(since: str = "0", limit: int = SYNC_PAGE_ROWS):
+    """Rows changed and deleted after the cursor `since` (see read_sync); call again with `next` while `more`."""
+    if not 1 <= limit <= SYNC_MAX_PAGE_ROWS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SYNC_MAX_PAGE_ROWS}")
+    try:
+        parse_sync_cursor(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="since must be a cursor returned as next")
+    conn = get_db()
+    try:
+        return JSONResponse(read_sync(conn, since, limit))
+    finally:
+        conn.close()
+
+@app.get("/api/stats/loop")
+def api_loop_stats(request: Request):
+    """Event-loop lag (how late the loop wakes from a timed sleep) and async DB executor load."""
+    require_admin(request)
+    return JSONResponse({"loop": loop_monitor.snapshot(), "db_executor": db_executor.snapshot()})
+
 @app.get("/types", response_class=HTMLResponse)
 def types_page(request: Request):
-    conn = get_db(); cur = conn.cursor()
-    types = list_item_types(conn)
-    # For each type, list fields
-    type_fields = {}
-    for t in types:
-        type_fields[t["id"]] = fields_for_type(conn, t["id"])
+    conn = get_db()
+    schemas = type_schemas.all(conn)
     conn.close()
+    types = [{"id": t.id, "name": t.name} for t in schemas]
+    type_fields = {t.id: t.fields for t in schemas}
     return render("types.html", request=request, types=types, type_fields=type_fields, title=f"{APP_TITLE} · Types")
 
 @app.post("/types")
 def create_type(name: str = Form(...)):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     tid = uuid4().hex[:8].upper()
     cur.execute("INSERT INTO item_types(id, name) VALUES (?, ?)", (tid, name.strip()))
     conn.commit(); conn.close()
@@ -1057,7 +4404,7 @@ def create_type(name: str = Form(...)):
 
 @app.post("/types/{type_id}/delete")
 def delete_type(type_id: str):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     cur.execute("DELETE FROM item_types WHERE id=?", (type_id,))
     conn.commit(); conn.close()
     return RedirectResponse(url="/types", status_code=303)
@@ -1072,7 +4419,7 @@ def create_field(type_id: str,
     if kind not in ("text","number","select","date","checkbox"):
         raise HTTPException(status_code=400, detail="Invalid kind")
 
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     fid = uuid4().hex[:8].upper()
     key_in = (name or "").strip()
     base_key = slugify_label(key_in or label)
@@ -1113,7 +4460,7 @@ def type_detail(request: Request, type_id: str):
 # Rename a type
 @app.post("/types/{type_id}/update")
 def update_type(type_id: str, name: str = Form(...)):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     cur.execute("UPDATE item_types SET name=? WHERE id=?", (name.strip(), type_id))
     conn.commit(); conn.close()
     return RedirectResponse(url=f"/types/{type_id}", status_code=303)
@@ -1131,7 +4478,7 @@ def update_field(field_id: str,
     if kind not in ("text","number","select","date","checkbox"):
         raise HTTPException(status_code=400, detail="Invalid kind")
 
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
 
     # compute key: if blank → from label; always slugify & ensure unique (excluding self)
     key_in = (name or "").strip()
@@ -1156,7 +4503,7 @@ def update_field(field_id: str,
 # Delete a field
 @app.post("/fields/{field_id}/delete")
 def delete_field(field_id: str, type_id: str = Form(...)):
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True); cur = conn.cursor()
     cur.execute("DELETE FROM item_fields WHERE id=?", (field_id,))
     conn.commit(); conn.close()
     return RedirectResponse(url=f"/types/{type_id}", status_code=303)
@@ -1167,20 +4514,9 @@ def reorder_fields(type_id: str, payload: dict = Body(...)):
     if not isinstance(order, list) or not all(isinstance(x, str) for x in order):
         raise HTTPException(status_code=400, detail="Invalid order payload")
 
-    conn = get_db(); cur = conn.cursor()
+    conn = get_db(write=True)
     # Only reorder fields that belong to this type (ignore stray ids)
-    qmarks = ",".join("?" * len(order)) if order else ""
-    valid = set()
-    if order:
-        cur.execute(f"SELECT id FROM item_fields WHERE type_id=? AND id IN ({qmarks})", [type_id, *order])
-        valid = {r["id"] for r in cur.fetchall()}
-
-    pos = 1
-    for fid in order:
-        if fid in valid:
-            cur.execute("UPDATE item_fields SET ord=? WHERE id=? AND type_id=?", (pos, fid, type_id))
-            pos += 1
-
+    reorder_type_fields(conn, type_id, order)
     conn.commit(); conn.close()
     return JSONResponse({"ok": True})
 
@@ -1192,6 +4528,119 @@ def install_certificate(request: Request):
     return render(
         "install_cert.html",
         request=request,
-        has_root=HAS_MKCERT_CA,
+        has_root=has_mkcert_root(),
         title=f"{APP_TITLE} · Install certificate"
     )
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=f"{APP_TITLE} maintenance commands")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("migrate", help="Apply pending schema migrations and print the schema version")
+    sub.add_parser("rebuild-search", help="Rebuild the full-text search index from the inventory tables")
+    sub.add_parser("rebuild-hierarchy", help="Recompute the node/container closure table from parent links")
+    p_import = sub.add_parser("import-items", help="Bulk-import items from a CSV or JSONL file")
+    p_import.add_argument("path")
+    p_import.add_argument("--format", choices=["csv", "jsonl"], help="defaults to the file extension")
+    p_assets = sub.add_parser("build-assets", help="Write hashed/precompressed static files to static/dist")
+    p_assets.add_argument("--fetch-vendor", action="store_true", help="also download jsQR into static/vendor (needs internet)")
+    p_export = sub.add_parser("export", help="Write the inventory as JSONL or CSV (stdout by default)")
+    p_export.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    p_export.add_argument("--node", help="only this node's subtree")
+    p_export.add_argument("--type", dest="type_id", help="only items of this type id")
+    p_export.add_argument("-o", "--output", help="file to write instead of stdout")
+    p_startup = sub.add_parser("bench-startup", help="Time a cold import, app startup and the first request")
+    p_startup.add_argument("--runs", type=int, default=5)
+    p_counts = sub.add_parser("check-counts", help="Verify the materialized map/node counts against the inventory")
+    p_counts.add_argument("--repair", action="store_true", help="Rebuild the counts if they are out of sync")
+    args = parser.parse_args()
+
+    if args.cmd == "migrate":
+        applied = ensure_db()
+        conn = get_db(write=True)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.close()
+        print(f"Schema version {version}" + (f" (applied: {', '.join(applied)})" if applied else " (up to date)"))
+
+    elif args.cmd == "rebuild-search":
+        conn = get_db(write=True)
+        n = rebuild_search_index(conn)
+        conn.commit(); conn.close()
+        print(f"Search index rebuilt: {n} documents")
+
+    elif args.cmd == "rebuild-hierarchy":
+        conn = get_db(write=True)
+        n = rebuild_hierarchy(conn)
+        conn.commit(); conn.close()
+        print(f"Hierarchy rebuilt: {n} rows")
+
+    elif args.cmd == "check-counts":
+        conn = get_db(write=True)
+        bad = check_counts(conn)
+        if not bad:
+            print("Counts OK")
+        else:
+            print(f"{len(bad)} nodes/containers out of sync: {', '.join(bad[:20])}{' ...' if len(bad) > 20 else ''}")
+            if args.repair:
+                rebuild_counts(conn)
+                conn.commit()
+                print("Counts rebuilt")
+        conn.close()
+        if bad and not args.repair:
+            sys.exit(1)
+
+    elif args.cmd == "import-items":
+        fmt = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+        with open(args.path, encoding="utf-8-sig", newline="") as fh:
+            report = import_items(iter_import_rows(fh, fmt))
+        for e in report["errors"]:
+            print(f"line {e['line']}: {e['error']}")
+        print(f"Imported {report['imported']} of {report['rows']} rows ({report['failed']} failed)")
+        if report["failed"]:
+            sys.exit(1)
+
+    elif args.cmd == "export":
+        out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+        try:
+            for chunk in iter_export(args.format, args.node, args.type_id):
+                out.write(chunk)
+        finally:
+            if args.output:
+                out.close()
+
+
+    elif args.cmd == "build-assets":
+        if args.fetch_vendor:
+            try:
+                print("jsQR vendored" if fetch_vendor_assets() else "jsQR already vendored")
+            except OSError as e:
+                print(f"Could not fetch jsQR ({e}); pages will load it from the CDN")
+        manifest = build_assets()
+        print(f"{len(manifest)} assets in static/{ASSET_DIST}" + (" (gzip + brotli)" if brotli else " (gzip)"))
+
+
+    elif args.cmd == "bench-startup":
+        # each run is a fresh interpreter: import, lifespan startup, then one GET / (all in-process)
+        child = """
+import time, asyncio, json
+t0 = time.perf_counter()
+import app as A
+t1 = time.perf_counter()
+async def main():
+    async with A.app.router.lifespan_context(A.app):
+        t2 = time.perf_counter()
+        status, _ = await A.asgi_get("/")
+        return t2, time.perf_counter(), status
+t2, t3, status = asyncio.run(main())
+print(json.dumps({"import": t1 - t0, "startup": t2 - t1, "first_request": t3 - t2, "status": status}))
+"""
+        runs = []
+        for _ in range(args.runs):
+            out = subprocess.run([sys.executable, "-c", child], cwd=BASE_DIR, capture_output=True, text=True, check=True)
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        for key in ("import", "startup", "first_request"):
+            vals = sorted(r[key] * 1000 for r in runs)
+            print(f"{key:>14}: median {vals[len(vals) // 2]:7.1f} ms   min {vals[0]:7.1f} ms   max {vals[-1]:7.1f} ms")
+        total = sorted(sum(r[k] for k in ("import", "startup", "first_request")) * 1000 for r in runs)
+        print(f"{'total':>14}: median {total[len(total) // 2]:7.1f} ms   ({args.runs} runs, GET / -> {runs[-1]['status']})")
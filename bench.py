@@ -0,0 +1,383 @@
+"""
+Synthetic inventories and route benchmarks for Home QR Inventory.
+
+    python bench.py generate --db bench.sqlite3 --scale medium --seed 1
+    python bench.py run --db bench.sqlite3 --out results.json [--compare baseline.json]
+
+`generate` writes a seeded, reproducible inventory (cabinets/wardrobes -> shelves/drawers ->
+containers -> items, item types with fields and their values) straight into a fresh database.
+`run` drives the routes through the ASGI app in-process (no server, no HTTP client) and reports
+p50/p95/p99 latency, SQL statements per request and throughput per route, as JSON that two runs
+can be compared with.
+"""
+import os, sys, json, time, random, asyncio, argparse, platform, subprocess, sqlite3
+from contextvars import ContextVar
+from urllib.parse import urlencode
+
+SCALES = {
+    # cabinets, shelves + drawers per cabinet, containers per shelf/drawer, items per container (mean)
+    "small":  dict(cabinets=4,   shelves=4, drawers=2, containers=5,  items=20),
+    "medium": dict(cabinets=20,  shelves=5, drawers=3, containers=8,  items=40),
+    "large":  dict(cabinets=100, shelves=6, drawers=4, containers=10, items=100),
+}
+ADJECTIVES = ["red", "blue", "old", "spare", "winter", "summer", "small", "large", "wool", "cotton",
+              "steel", "wooden", "kids", "travel", "kitchen", "garden", "usb", "paper", "leather", "silver"]
+NOUNS = ["gloves", "scarf", "cable", "charger", "hammer", "screws", "batteries", "socks", "tape", "candles",
+         "jar", "notebook", "lamp", "adapter", "brush", "towel", "mug", "box", "bulbs", "keys", "sweater", "drill"]
+FIELD_KINDS = ["text", "number", "select", "date", "checkbox"]
+ITEM_CHUNK = 10000
+
+
+# -------------- Generator --------------
+def _ids(rng, seen):
+    while True:
+        i = f"{rng.getrandbits(32):08X}"
+        if i not in seen:
+            seen.add(i)
+            return i
+
+def _field_value(rng, kind, options):
+    if kind == "number":
+        return str(rng.randint(1, 500))
+    if kind == "select":
+        return rng.choice(options)
+    if kind == "date":
+        return f"20{rng.randint(15, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+    if kind == "checkbox":
+        return rng.choice(("0", "1"))
+    return f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+
+def generate(A, seed: int, cabinets: int, shelves: int, drawers: int, containers: int, items: int,
+             types: int = 8, fields: int = 5, typed: float = 0.7, fill: float = 0.8) -> dict:
+    """Fill an empty, migrated database; returns row counts."""
+    rng, seen = random.Random(seed), set()
+    conn = A.get_db(write=True); cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM nodes")
+    if cur.fetchone()[0]:
+        conn.close()
+        raise SystemExit("database is not empty; pass a new --db path")
+
+    # item types and their fields
+    schema = []
+    for t in range(types):
+        tid = _ids(rng, seen)
+        cur.execute("INSERT INTO item_types(id, name) VALUES (?, ?)", (tid, f"{rng.choice(NOUNS).title()} {t + 1}"))
+        flds = []
+        for f in range(fields):
+            kind = FIELD_KINDS[f % len(FIELD_KINDS)]
+            options = [f"opt{n}" for n in range(rng.randint(2, 6))] if kind == "select" else []
+            fid = _ids(rng, seen)
+            cur.execute("""
+                INSERT INTO item_fields(id, type_id, name, label, kind, required, options, ord)
+                VALUES (?, ?, ?, ?, ?, 0, ?, ?)
+            """, (fid, tid, f"{kind}_{f}", f"{kind.title()} {f}", kind, json.dumps(options), f + 1))
+            flds.append((fid, kind, options))
+        schema.append((tid, flds))
+
+    # structure
+    nodes, parents = [], []
+    for c in range(cabinets):
+        cab = _ids(rng, seen)
+        nodes.append((cab, rng.choice(("Cabinet", "Wardrobe")), f"Cabinet {c + 1}", None))
+        for typ, n in (("Shelf", shelves), ("Drawer", drawers)):
+            for k in range(n):
+                nid = _ids(rng, seen)
+                nodes.append((nid, typ, f"{typ} {k + 1}", cab))
+                parents.append(nid)
+    cur.executemany("INSERT INTO nodes(id, type, name, parent_id) VALUES (?, ?, ?, ?)", nodes)
+    conts = []
+    for p in parents:
+        for k in range(containers):
+            typ = rng.choice(("Box", "Box", "Organizator", "InPlace"))
+            conts.append((_ids(rng, seen), typ, f"{rng.choice(ADJECTIVES).title()} {typ.lower()} {k + 1}", p))
+    cur.executemany("INSERT INTO containers(id, type, name, parent_id) VALUES (?, ?, ?, ?)", conts)
+    conn.commit()
+
+    # items + values in chunks, indexed for search set-based (as the bulk importer does)
+    n_items = n_values = 0
+    next_id = 1
+    batch, values = [], []
+
+    def flush():
+        nonlocal batch, values, n_values
+        if not batch:
+            return
+        cur.execute("INSERT INTO search_deferred(flag) VALUES (1)")
+        cur.executemany("INSERT INTO items(id, container_id, name, qty, note, type_id) VALUES (?, ?, ?, ?, ?, ?)", batch)
+        cur.executemany("INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, ?, ?)", values)
+        A.search_index_items(conn, batch[0][0], batch[-1][0])
+        A.stamp_item_versions(conn, batch[0][0], batch[-1][0])
+        cur.execute("DELETE FROM search_deferred")
+        conn.commit()
+        n_values += len(values)
+        batch, values = [], []
+
+    for cid, *_ in conts:
+        for _ in range(rng.randint(0, 2 * items)):
+            tid, flds = rng.choice(schema) if schema and rng.random() < typed else (None, [])
+            name = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}".capitalize()
+            note = f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}" if rng.random() < 0.3 else ""
+            batch.append((next_id, cid, name, rng.randint(1, 12), note, tid))
+            for fid, kind, options in flds:
+                if rng.random() < fill:
+                    values.append((next_id, fid, _field_value(rng, kind, options)))
+            next_id += 1
+            n_items += 1
+            if len(batch) >= ITEM_CHUNK:
+                flush()
+    flush()
+    conn.close()
+    return {"nodes": len(nodes), "containers": len(conts), "items": n_items, "values": n_values,
+            "item_types": types, "item_fields": types * fields}
+
+
+# -------------- Benchmark --------------
+# Every SQL statement run while serving a request is counted through a trace callback on the
+# pooled connections; the counter lives in a ContextVar, which the app's thread pools inherit.
+_queries: ContextVar[list | None] = ContextVar("_queries", default=None)
+
+def _count_statement(sql: str):
+    counter = _queries.get()
+    if counter is not None and not sql.startswith("--"):     # "-- TRIGGER ..." lines are not statements
+        counter[0] += 1
+
+def _install_query_counter(A):
+    connect = A.db_pool._connect
+    def traced(writer):
+        conn = connect(writer)
+        conn.set_trace_callback(_count_statement)
+        return conn
+    A.db_pool._connect = traced
+
+def _fixtures(A, rng) -> dict:
+    conn = A.get_db(); cur = conn.cursor()
+    fx = {}
+    cur.execute("SELECT id, type FROM nodes")
+    rows = cur.fetchall()
+    fx["tops"] = [r["id"] for r in rows if r["type"] in ("Cabinet", "Wardrobe")]
+    fx["leaves"] = [r["id"] for r in rows if r["type"] in ("Shelf", "Drawer")]
+    cur.execute("SELECT id FROM containers")
+    fx["containers"] = [r["id"] for r in cur.fetchall()]
+    cur.execute("SELECT id, container_id FROM items ORDER BY random() LIMIT 5000")
+    fx["items"] = [(r["id"], r["container_id"]) for r in cur.fetchall()]
+    cur.execute("SELECT id FROM item_types")
+    fx["types"] = [r["id"] for r in cur.fetchall()]
+    cur.execute("SELECT value FROM app_meta WHERE key='row_version'")
+    fx["row_version"] = cur.fetchone()[0]
+    conn.close()
+    rng.shuffle(fx["containers"]); rng.shuffle(fx["leaves"])
+    fx["words"] = ADJECTIVES + NOUNS
+    return fx
+
+def _form(**data):
+    return urlencode(data).encode(), [(b"content-type", b"application/x-www-form-urlencoded")]
+
+def _json(payload):
+    return json.dumps(payload).encode(), [(b"content-type", b"application/json")]
+
+def scenarios(rng, fx) -> dict:
+    """name -> callable returning (method, path, body, headers). Destructive ones come last."""
+    item = lambda: rng.choice(fx["items"])
+    cont = lambda: rng.choice(fx["containers"])
+
+    def add_item():
+        body, h = _form(name=f"bench {rng.choice(fx['words'])}", qty=rng.randint(1, 5), note="")
+        return "POST", f"/container/{cont()}/items", body, h
+
+    def update_item():
+        iid, cid = item()
+        body, h = _form(name=f"{rng.choice(fx['words'])} {rng.choice(fx['words'])}", qty=rng.randint(1, 9), note="edited")
+        return "POST", f"/container/{cid}/items/{iid}/update", body, h
+
+    def batch_move():
+        dest = cont()
+        body, h = _json({"ops": [{"op": "move_item", "item_id": iid, "dest_container_id": dest}
+                                 for iid, _ in rng.sample(fx["items"], min(50, len(fx["items"])))]})
+        return "POST", "/api/batch", body, h
+
+    def delete_container():
+        return "POST", f"/container/{fx['containers'].pop()}/delete", b"", []
+
+    def delete_leaf():
+        return "POST", f"/node/{fx['leaves'].pop()}/delete", b"", []
+
+    return {
+        "map": lambda: ("GET", "/", b"", []),
+        "map_search": lambda: ("GET", f"/?q={rng.choice(fx['words'])}", b"", []),
+        "node_top": lambda: ("GET", f"/node/{rng.choice(fx['tops'])}", b"", []),
+        "node_leaf": lambda: ("GET", f"/node/{rng.choice(fx['leaves'])}", b"", []),
+        "container": lambda: ("GET", f"/container/{cont()}", b"", []),
+        "container_qr": lambda: ("GET", f"/container/{cont()}/qr.png", b"", []),
+        "api_item": lambda: ("GET", f"/api/items/{item()[0]}", b"", []),
+        "api_container": lambda: ("GET", f"/api/containers/{cont()}", b"", []),
+        "api_item_types": lambda: ("GET", "/api/item-types", b"", []),
+        "types": lambda: ("GET", "/types", b"", []),
+        "type": lambda: ("GET", f"/types/{rng.choice(fx['types'])}", b"", []) if fx["types"] else ("GET", "/types", b"", []),
+        "move_targets": lambda: ("GET", f"/api/move-targets?kind=container&q={rng.choice(fx['words'])[:3]}", b"", []),
+        "move_targets_nodes": lambda: ("GET", "/api/move-targets?kind=node", b"", []),
+        "sync_full_page": lambda: ("GET", "/api/sync?since=0", b"", []),
+        "sync_delta": lambda: ("GET", f"/api/sync?since={max(1, fx['row_version'] - 200)}", b"", []),
+        "export_leaf_csv": lambda: ("GET", f"/api/export?format=csv&node_id={rng.choice(fx['leaves'])}", b"", []),
+        "add_item": add_item,
+        "update_item": update_item,
+        "batch_move_50": batch_move,
+        "delete_container": delete_container,
+        "delete_leaf_node": delete_leaf,
+    }
+
+def _pct(sorted_vals, q):
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+async def _one(A, make):
+    method, path, body, headers = make()
+    token = _queries.set([0])
+    try:
+        t0 = time.perf_counter()
+        status, _, _ = await A.asgi_request(method, path, body, headers)
+        elapsed = time.perf_counter() - t0
+        return status, elapsed, _queries.get()[0]
+    finally:
+        _queries.reset(token)
+
+async def run_scenario(A, make, iterations: int, warmup: int, concurrency: int) -> dict:
+    for _ in range(warmup):
+        await _one(A, make)
+    results = []
+    remaining = iterations
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            results.append(await _one(A, make))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    lat = sorted(r[1] * 1000 for r in results)
+    statuses = {}
+    for r in results:
+        statuses[str(r[0])] = statuses.get(str(r[0]), 0) + 1
+    return {"n": len(results), "p50_ms": round(_pct(lat, .50), 3), "p95_ms": round(_pct(lat, .95), 3),
+            "p99_ms": round(_pct(lat, .99), 3), "mean_ms": round(sum(lat) / len(lat), 3),
+            "max_ms": round(lat[-1], 3), "rps": round(len(results) / wall, 1),
+            "queries_per_request": round(sum(r[2] for r in results) / len(results), 2), "status": statuses}
+
+async def run_all(A, names, args, fx, rng) -> dict:
+    table = scenarios(rng, fx)
+    out = {}
+    async with A.app.router.lifespan_context(A.app):
+        for name in names:
+            n = args.iterations
+            if name == "delete_container":
+                n = min(n, len(fx["containers"]) // 4)
+            elif name == "delete_leaf_node":
+                n = min(n, len(fx["leaves"]) // 4)
+            if n <= 0:
+                continue
+            warmup = 0 if name.startswith("delete") else args.warmup
+            out[name] = await run_scenario(A, table[name], n, warmup, args.concurrency)
+            r = out[name]
+            print(f"{name:>20}  p50 {r['p50_ms']:8.2f}  p95 {r['p95_ms']:8.2f}  p99 {r['p99_ms']:8.2f} ms"
+                  f"  {r['rps']:8.1f} req/s  {r['queries_per_request']:6.1f} q/req  {r['status']}")
+    return out
+
+def _meta(A, args) -> dict:
+    conn = A.get_db(); cur = conn.cursor()
+    counts = {t: cur.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+              for t in ("nodes", "containers", "items", "item_field_values", "item_types")}
+    conn.close()
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "git": rev, "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version, "platform": platform.platform(), "db": os.path.abspath(args.db),
+            "rows": counts, "seed": args.seed, "iterations": args.iterations, "concurrency": args.concurrency,
+            "response_cache": args.response_cache}
+
+def compare(base: dict, cur: dict):
+    print(f"\n{'route':>20}  {'p50 base':>9} {'p50 now':>9} {'Δ':>7}   {'p95 base':>9} {'p95 now':>9} {'Δ':>7}   q/req")
+    for name, r in cur["routes"].items():
+        b = base.get("routes", {}).get(name)
+        if not b:
+            continue
+        d = lambda k: f"{(r[k] - b[k]) / b[k] * 100:+6.1f}%" if b[k] else "    n/a"
+        print(f"{name:>20}  {b['p50_ms']:9.2f} {r['p50_ms']:9.2f} {d('p50_ms')}   "
+              f"{b['p95_ms']:9.2f} {r['p95_ms']:9.2f} {d('p95_ms')}   {b['queries_per_request']:g} -> {r['queries_per_request']:g}")
+
+
+# -------------- CLI --------------
+def _load_app(db: str):
+    os.environ["DB_PATH"] = os.path.abspath(db)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic inventory generator and route benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    g = sub.add_parser("generate", help="Create a seeded synthetic inventory in a new database")
+    g.add_argument("--db", default="bench.sqlite3")
+    g.add_argument("--seed", type=int, default=1)
+    g.add_argument("--scale", choices=SCALES, default="small")
+    for key in ("cabinets", "shelves", "drawers", "containers", "items"):
+        g.add_argument(f"--{key}", type=int, help=f"override the scale's {key}")
+    g.add_argument("--types", type=int, default=8, help="item types")
+    g.add_argument("--fields", type=int, default=5, help="fields per item type")
+    g.add_argument("--typed", type=float, default=0.7, help="share of items with a type")
+    g.add_argument("--fill", type=float, default=0.8, help="share of a typed item's fields with a value")
+
+    r = sub.add_parser("run", help="Benchmark the routes against a generated database")
+    r.add_argument("--db", default="bench.sqlite3")
+    r.add_argument("--seed", type=int, default=1)
+    r.add_argument("--iterations", type=int, default=200)
+    r.add_argument("--warmup", type=int, default=5)
+    r.add_argument("--concurrency", type=int, default=1, help="requests in flight at once")
+    r.add_argument("--routes", help="comma-separated scenario names (default: all)")
+    r.add_argument("--response-cache", action="store_true", help="keep the rendered-response cache on")
+    r.add_argument("--out", help="write results as JSON")
+    r.add_argument("--compare", help="baseline JSON to compare against")
+    r.add_argument("--list", action="store_true", help="list scenario names and exit")
+    args = parser.parse_args()
+
+    if args.cmd == "generate":
+        if os.path.exists(args.db):
+            raise SystemExit(f"{args.db} exists; generate into a new file")
+        A = _load_app(args.db)
+        sizes = {**SCALES[args.scale], **{k: getattr(args, k) for k in SCALES["small"] if getattr(args, k) is not None}}
+        t0 = time.perf_counter()
+        counts = generate(A, args.seed, types=args.types, fields=args.fields, typed=args.typed, fill=args.fill, **sizes)
+        print(f"Generated {', '.join(f'{v} {k}' for k, v in counts.items())} in {time.perf_counter() - t0:.1f}s -> {args.db}")
+        return
+
+    names = list(scenarios(random.Random(0), {}).keys())
+    if args.list:
+        print("\n".join(names))
+        return
+    if args.routes:
+        wanted = [n.strip() for n in args.routes.split(",") if n.strip()]
+        unknown = set(wanted) - set(names)
+        if unknown:
+            raise SystemExit(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+        names = [n for n in names if n in wanted]
+    if not os.path.exists(args.db):
+        raise SystemExit(f"{args.db} not found; run `python bench.py generate` first")
+    A = _load_app(args.db)
+    _install_query_counter(A)
+    if not args.response_cache:
+        A.response_cache.max_bytes = 0            # measure the routes, not the LRU in front of them
+    rng = random.Random(args.seed)
+    fx = _fixtures(A, rng)
+    results = {"meta": _meta(A, args), "routes": asyncio.run(run_all(A, names, args, fx, rng))}
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+        print(f"Results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(json.load(fh), results)
+
+if __name__ == "__main__":
+    main()
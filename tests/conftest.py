@@ -0,0 +1,81 @@
+import asyncio
+import json
+import sys
+from pathlib import Path
+from urllib.parse import urlencode
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import app as A  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated database behind the app's pool, with the per-process caches reset."""
+    monkeypatch.setattr(A, "db_pool", A.ConnectionPool(str(tmp_path / "inventory.sqlite3")))
+    monkeypatch.setattr(A, "_db_ready", False)
+    monkeypatch.setattr(A, "response_cache", A.ResponseCache())
+    monkeypatch.setattr(A, "type_schemas", A.TypeSchemaCache())
+    monkeypatch.setattr(A, "scan_cache", A.ScanCache())
+    monkeypatch.setattr(A, "QRCODES_DIR", str(tmp_path))
+    A.ensure_db()
+    A.asset_manifest()                    # as lifespan does
+    return A
+
+
+def query(sql, params=()):
+    conn = A.get_db()
+    try:
+        return [tuple(r) for r in conn.execute(sql, params).fetchall()]
+    finally:
+        conn.close()
+
+
+def write(sql, params=()):
+    conn = A.get_db(write=True)
+    try:
+        cur = conn.execute(sql, params)
+        conn.commit()
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+
+def send(method, path, body=b"", headers=()):
+    """In-process request; returns (status, {header: value}, raw body)."""
+    headers = [(k.lower().encode(), v.encode()) for k, v in dict(headers).items()]
+    status, resp_headers, data = asyncio.run(A.asgi_request(method, path, body, headers))
+    return status, {k.decode(): v.decode() for k, v in resp_headers}, data
+
+
+def request(method, path, form=None, payload=None, headers=()):
+    """In-process request; returns (status, parsed JSON or raw body)."""
+    body, headers = b"", dict(headers)
+    if form is not None:
+        body, headers["content-type"] = urlencode(form).encode(), "application/x-www-form-urlencoded"
+    elif payload is not None:
+        body, headers["content-type"] = json.dumps(payload).encode(), "application/json"
+    status, resp_headers, data = send(method, path, body, headers)
+    if resp_headers.get("content-type", "").startswith("application/json"):
+        data = json.loads(data)
+    return status, data
+
+
+@pytest.fixture
+def inventory(db):
+    """Cabinet > Shelf > boxes B1, B2 and a Drawer; a typed item with two values in B1, plain ones in B2."""
+    for nid, typ, parent in (("CAB", "Cabinet", None), ("SH1", "Shelf", "CAB"), ("DR1", "Drawer", "CAB")):
+        write("INSERT INTO nodes(id, type, name, parent_id) VALUES (?, ?, ?, ?)", (nid, typ, nid.lower(), parent))
+    for cid, parent in (("B1", "SH1"), ("B2", "SH1"), ("B3", "DR1")):
+        write("INSERT INTO containers(id, type, name, parent_id) VALUES (?, 'Box', ?, ?)", (cid, cid.lower(), parent))
+    write("INSERT INTO item_types(id, name) VALUES ('T1', 'Cable')")
+    for ord_, (fid, key) in enumerate((("F1", "length"), ("F2", "color")), 1):
+        write("INSERT INTO item_fields(id, type_id, name, label, kind, ord) VALUES (?, 'T1', ?, ?, 'text', ?)",
+              (fid, key, key, ord_))
+    ids = {"typed": write("INSERT INTO items(container_id, name, qty, type_id) VALUES ('B1', 'usb cable', 2, 'T1')")}
+    for fid, value in (("F1", "1m"), ("F2", "black")):
+        write("INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, ?, ?)", (ids["typed"], fid, value))
+    ids["plain"] = write("INSERT INTO items(container_id, name, qty) VALUES ('B2', 'tape', 1)")
+    ids["other"] = write("INSERT INTO items(container_id, name, qty) VALUES ('B2', 'glue', 3)")
+    return ids
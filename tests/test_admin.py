@@ -0,0 +1,20 @@
+import pytest
+
+import app as A
+from conftest import request
+
+STATS = ["/api/db/stats", "/api/stats/loop", "/metrics", "/api/debug/slow-queries"]
+
+
+@pytest.mark.parametrize("path", STATS)
+def test_stats_endpoints_are_off_without_a_token(db, path):
+    assert request("GET", path)[0] == 403
+
+
+@pytest.mark.parametrize("path", STATS)
+def test_stats_endpoints_need_the_admin_token(db, monkeypatch, path):
+    monkeypatch.setattr(A, "ADMIN_TOKEN", "s3cret")
+    assert request("GET", path)[0] == 401
+    assert request("GET", path, headers={"Authorization": "Bearer wrong"})[0] == 401
+    assert request("GET", path, headers={"Authorization": "Bearer s3cret"})[0] == 200
+    assert request("GET", path, headers={"X-Admin-Token": "s3cret"})[0] == 200
@@ -0,0 +1,48 @@
+import gzip
+import logging
+
+import app as A
+from conftest import send
+
+
+def test_assets_are_hashed_and_precompressed(tmp_path, monkeypatch):
+    (tmp_path / "style.css").write_text("body { color: red }")
+    (tmp_path / "icon.png").write_bytes(b"\x89PNG")
+    monkeypatch.setattr(A, "STATIC_DIR", str(tmp_path))
+    manifest = A.load_asset_manifest()
+    css, png = manifest["style.css"], manifest["icon.png"]
+    assert css.startswith("style.") and css != "style.css"
+    dist = tmp_path / A.ASSET_DIST
+    assert gzip.decompress((dist / f"{css}.gz").read_bytes()) == b"body { color: red }"
+    assert not (dist / f"{png}.gz").exists()             # images are served as they are
+
+    (tmp_path / "style.css").write_text("body { color: blue }")
+    assert A.load_asset_manifest()["style.css"] != css   # a changed file gets a new name
+
+
+def test_unwritable_dist_falls_back_to_plain_static(tmp_path, monkeypatch, caplog):
+    (tmp_path / "style.css").write_text("body {}")
+    (tmp_path / A.ASSET_DIST).write_text("not a directory")
+    monkeypatch.setattr(A, "STATIC_DIR", str(tmp_path))
+    with caplog.at_level(logging.WARNING, logger="inventory"):
+        assert A.load_asset_manifest() == {}
+    assert "Static assets not built" in caplog.text
+
+
+def test_hashed_assets_are_immutable_and_served_precompressed(db):
+    url = A.asset("style.css")
+    assert url.startswith(f"/static/{A.ASSET_DIST}/style.")
+    status, headers, body = send("GET", url, headers={"Accept-Encoding": "gzip"})
+    assert status == 200 and headers["content-encoding"] == "gzip"
+    assert headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert headers["content-type"].startswith("text/css")
+    assert gzip.decompress(body) == (A.Path(A.STATIC_DIR) / "style.css").read_bytes()
+
+    status, headers, _ = send("GET", "/static/style.css")
+    assert status == 200 and headers["cache-control"] == "no-cache"
+    assert "content-encoding" not in headers
+
+
+def test_pages_link_the_hashed_copies(db):
+    _, _, body = send("GET", "/")
+    assert A.asset("style.css").encode() in body and b'href="/static/style.css"' not in body
@@ -0,0 +1,36 @@
+from conftest import query, request
+
+
+def snapshot():
+    return (query("SELECT id, container_id, name, qty FROM items ORDER BY id"),
+            query("SELECT id, parent_id FROM containers ORDER BY id"))
+
+
+def test_invalid_op_rolls_back_the_whole_batch(inventory):
+    before = snapshot()
+    status, body = request("POST", "/api/batch", payload={"ops": [
+        {"op": "move_item", "item_id": inventory["plain"], "dest_container_id": "B3"},
+        {"op": "update_item", "item_id": inventory["other"], "qty": 5},
+        {"op": "move_item", "item_id": inventory["typed"], "dest_container_id": "NOPE"},
+    ]})
+    assert status == 400 and body["applied"] == 0
+    assert [r["ok"] for r in body["results"]] == [True, True, False]
+    assert snapshot() == before
+
+
+def test_ops_see_earlier_ops_of_the_same_batch(inventory):
+    status, body = request("POST", "/api/batch", payload={"ops": [
+        {"op": "delete_container", "container_id": "B2"},
+        {"op": "move_item", "item_id": inventory["typed"], "dest_container_id": "B2"},
+    ]})
+    assert status == 400 and "not found" in body["results"][1]["error"]
+    assert query("SELECT COUNT(*) FROM containers WHERE id='B2'") == [(1,)]
+
+
+def test_non_atomic_batch_skips_only_the_invalid_ops(inventory):
+    status, body = request("POST", "/api/batch", payload={"atomic": False, "ops": [
+        {"op": "update_item", "item_id": inventory["plain"], "qty": 9},
+        {"op": "delete_item", "item_id": 999999},
+    ]})
+    assert status == 200 and body["applied"] == 1 and not body["ok"]
+    assert query("SELECT qty FROM items WHERE id=?", (inventory["plain"],)) == [(9,)]
@@ -0,0 +1,49 @@
+import asyncio
+import random
+
+import app as A
+import bench
+from conftest import query
+
+TINY = dict(cabinets=2, shelves=2, drawers=1, containers=2, items=3, types=2, fields=5)
+
+
+def rows():
+    return [query(f"SELECT * FROM {t} ORDER BY 1, 2") for t in ("nodes", "containers", "items", "item_field_values")]
+
+
+def test_generate_is_reproducible_and_consistent(db, tmp_path, monkeypatch):
+    counts = bench.generate(A, 7, **TINY)
+    assert (counts["nodes"], counts["containers"]) == (2 + 2 * 3, 2 * 3 * 2)
+    assert query("SELECT COUNT(*) FROM items") == [(counts["items"],)]
+    conn = A.get_db()
+    try:
+        assert A.check_counts(conn) == []
+    finally:
+        conn.close()
+    first = rows()
+
+    monkeypatch.setattr(A, "db_pool", A.ConnectionPool(str(tmp_path / "again.sqlite3")))
+    monkeypatch.setattr(A, "_db_ready", False)
+    bench.generate(A, 7, **TINY)
+    assert rows() == first
+
+
+def test_every_scenario_runs_against_a_generated_inventory(db, monkeypatch):
+    monkeypatch.setattr(A, "qr_cache", A.QRCache(spill_dir=""))
+    monkeypatch.setattr(A, "db_pool", A.ConnectionPool(A.db_pool.path))   # as bench.py does: no connection opened yet
+    bench._install_query_counter(A)
+    bench.generate(A, 3, **TINY)
+    rng = random.Random(3)
+    fx = bench._fixtures(A, rng)
+
+    async def run():
+        out = {}
+        for name, make in bench.scenarios(rng, fx).items():
+            out[name] = await bench.run_scenario(A, make, iterations=2, warmup=0, concurrency=1)
+        return out
+
+    results = asyncio.run(run())
+    for name, r in results.items():
+        assert set(r["status"]) <= {"200", "303"}, (name, r["status"])
+        assert r["n"] == 2 and r["queries_per_request"] > 0, name
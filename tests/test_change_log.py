@@ -0,0 +1,83 @@
+import asyncio
+import sqlite3
+
+import app as A
+from conftest import query, request
+
+
+def changes_since(seq):
+    return query("SELECT kind, op, ref_id, path FROM change_log WHERE seq > ? ORDER BY seq", (seq,))
+
+
+def latest():
+    return query("SELECT COALESCE(MAX(seq), 0) FROM change_log")[0][0]
+
+
+def test_item_delete_journals_one_scoped_event(inventory):
+    seq = latest()
+    status, _ = request("POST", f"/container/B1/items/{inventory['typed']}/delete")
+    assert status == 303
+    events = changes_since(seq)
+    assert [(kind, op) for kind, op, _, _ in events] == [("item", "delete")]
+    assert all(path is not None for _, _, _, path in events)
+    assert "/CAB/" in events[0][3] and "/B1/" in events[0][3]
+
+
+def test_value_edit_is_scoped_to_its_container(inventory):
+    seq = latest()
+    status, _ = request("POST", f"/container/B1/items/{inventory['typed']}/update",
+                        form={"name": "usb cable", "qty": "2", "note": "", "type_id": "T1",
+                              "field_F1": "2m", "field_F2": "black"})
+    assert status == 303
+    fields = [e for e in changes_since(seq) if e[1] == "fields"]
+    assert fields and all("/SH1/" in path and "/B1/" in path for _, _, _, path in fields)
+
+
+def test_container_delete_journals_the_container_not_its_items(inventory):
+    seq = latest()
+    status, _ = request("POST", "/container/B2/delete")
+    assert status == 303
+    events = changes_since(seq)
+    assert [(kind, op, ref) for kind, op, ref, _ in events] == [("container", "delete", "B2")]
+    assert "/CAB/" in events[0][3] and "/SH1/" in events[0][3]
+
+
+def test_item_move_reaches_both_places(inventory):
+    seq = latest()
+    status, _ = request("POST", "/container/B2/items/move",
+                        form={"item_id": inventory["plain"], "dest_container_id": "B3"})
+    assert status == 303
+    [(kind, op, _, path)] = changes_since(seq)
+    assert (kind, op) == ("item", "move")
+    assert "/B2/" in path and "/B3/" in path and "/DR1/" in path
+
+
+def poll_once(feed):
+    async def run():
+        feed.subscribers.add(A.ChangeSubscriber(None, 0))
+        feed.last = 0
+        feed.start()
+        await asyncio.sleep(0.2)
+        await feed.stop()
+    asyncio.run(run())
+
+
+def test_feed_counts_and_logs_unexpected_poll_errors(db, monkeypatch, caplog):
+    def broken(conn, after):
+        raise KeyError("seq")
+    monkeypatch.setattr(A, "read_changes", broken)
+    feed = A.ChangeFeed(interval=0.01)
+    poll_once(feed)
+    assert feed.stats["errors"] > 0
+    assert "change feed poll failed" in caplog.text
+    assert "inventory_change_feed_errors" in A.metrics_text()
+
+
+def test_feed_retries_quietly_while_the_database_is_busy(db, monkeypatch, caplog):
+    def busy(conn, after):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(A, "read_changes", busy)
+    feed = A.ChangeFeed(interval=0.01)
+    poll_once(feed)
+    assert feed.stats["polls"] > 1 and feed.stats["errors"] == 0
+    assert not caplog.text
@@ -0,0 +1,28 @@
+import app as A
+from conftest import send, write
+
+
+def get(path, etag=None):
+    status, headers, _ = send("GET", path, headers={"If-None-Match": etag} if etag else {})
+    return status, headers.get("etag", "")
+
+
+def test_unchanged_page_revalidates_with_304(inventory):
+    status, etag = get("/container/B1")
+    assert status == 200 and etag
+    assert get("/container/B1", etag)[0] == 304
+
+
+def test_write_changes_the_etag(inventory):
+    _, etag = get("/container/B1")
+    write("UPDATE items SET qty = qty + 1 WHERE id = ?", (inventory["typed"],))
+    assert get("/container/B1", etag)[0] == 200
+
+
+def test_certificate_export_changes_the_etag(inventory, tmp_path, monkeypatch):
+    certs = tmp_path / "certs"
+    certs.mkdir()
+    monkeypatch.setattr(A, "CERTS_DIR", str(certs))
+    _, etag = get("/")
+    (certs / "rootCA.pem").write_text("-----BEGIN CERTIFICATE-----\n")
+    assert get("/", etag)[0] == 200
@@ -0,0 +1,49 @@
+import app as A
+from conftest import query, request, write
+
+
+def counts_ok():
+    conn = A.get_db()
+    try:
+        return A.check_counts(conn)
+    finally:
+        conn.close()
+
+
+def node_counts(node_id):
+    return query("SELECT * FROM node_counts WHERE node_id=?", (node_id,))
+
+
+def test_counts_follow_route_writes(inventory):
+    assert counts_ok() == []
+    before = node_counts("CAB")
+
+    steps = [
+        ("POST", "/container/B1/items", {"name": "drill", "qty": "4", "note": ""}),
+        ("POST", f"/container/B2/items/{inventory['plain']}/update", {"name": "tape", "qty": "7", "note": ""}),
+        ("POST", "/container/B2/items/move", {"item_id": inventory["other"], "dest_container_id": "B3"}),
+        ("POST", "/container/B1/move", {"dest_parent_id": "DR1"}),
+        ("POST", "/nodes", {"name": "side", "type": "Shelf", "parent_id": "CAB"}),
+        ("POST", "/container/B2/delete", {}),
+        ("POST", "/node/DR1/delete", {}),
+    ]
+    for method, path, form in steps:
+        status, _ = request(method, path, form=form)
+        assert status == 303, path
+        assert counts_ok() == [], path
+    assert node_counts("CAB") != before
+
+
+def test_counts_follow_batch_and_raw_sql(inventory):
+    status, body = request("POST", "/api/batch", payload={"ops": [
+        {"op": "move_item", "item_id": inventory["typed"], "dest_container_id": "B3"},
+        {"op": "update_item", "item_id": inventory["plain"], "qty": 12},
+        {"op": "delete_item", "item_id": inventory["other"]},
+        {"op": "move_container", "container_id": "B2", "dest_parent_id": "DR1"},
+    ]})
+    assert status == 200 and body["ok"]
+    assert counts_ok() == []
+
+    write("UPDATE items SET qty = 0 WHERE container_id = 'B3'")
+    write("DELETE FROM containers WHERE id = 'B1'")
+    assert counts_ok() == []
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import app as A
+from conftest import query, request
+
+
+def test_calls_run_off_the_loop_and_commit_writes(inventory):
+    def rename(conn, item_id):
+        conn.execute("UPDATE items SET name='renamed' WHERE id=?", (item_id,))
+        return threading.current_thread().name
+
+    thread = asyncio.run(A.run_db(rename, inventory["plain"], write=True))
+    assert thread.startswith("db") and thread != threading.current_thread().name
+    assert query("SELECT name FROM items WHERE id=?", (inventory["plain"],)) == [("renamed",)]
+
+
+def test_a_failed_write_is_rolled_back(inventory):
+    def half_done(conn):
+        conn.execute("DELETE FROM items")
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(A.run_db(half_done, write=True))
+    assert query("SELECT COUNT(*) FROM items") == [(3,)]
+
+
+def test_a_full_queue_rejects_with_503(db, monkeypatch):
+    monkeypatch.setattr(A, "DB_QUEUE_TIMEOUT", 0.05)
+    executor, release = A.DBExecutor(workers=1, queue_max=1), threading.Event()
+
+    async def run():
+        busy = asyncio.ensure_future(executor.run(lambda conn: release.wait(5)))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException) as err:
+            await executor.run(lambda conn: None)
+        release.set()
+        await busy
+        return err.value.status_code
+
+    try:
+        assert asyncio.run(run()) == 503
+        assert executor.snapshot()["rejected"] == 1
+    finally:
+        executor.shutdown()
+
+
+def test_async_routes_write_through_the_executor(inventory):
+    calls = A.db_executor.snapshot()["calls"]
+    status, _ = request("POST", "/container/B3/items", form={"name": "rope", "qty": "2", "note": ""})
+    assert status == 303
+    assert A.db_executor.snapshot()["calls"] > calls
+    assert query("SELECT container_id FROM items WHERE name='rope'") == [("B3",)]
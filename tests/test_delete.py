@@ -0,0 +1,45 @@
+import os
+
+import app as A
+from conftest import query, request
+
+
+def qr_files():
+    return sorted(f for f in os.listdir(A.QRCODES_DIR) if f.endswith(".png"))
+
+
+def test_node_delete_removes_the_whole_subtree(inventory):
+    for cid in ("B1", "B2", "B3"):
+        open(os.path.join(A.QRCODES_DIR, f"{cid}.png"), "wb").close()
+    status, _ = request("POST", "/node/CAB/delete")
+    assert status == 303
+    for table in ("nodes", "containers", "items", "item_field_values"):
+        assert query(f"SELECT COUNT(*) FROM {table}") == [(0,)], table
+    assert qr_files() == []                     # removed after the response, by a background task
+
+
+def test_container_delete_leaves_its_siblings(inventory):
+    for cid in ("B1", "B2"):
+        open(os.path.join(A.QRCODES_DIR, f"{cid}.png"), "wb").close()
+    status, _ = request("POST", "/container/B1/delete")
+    assert status == 303
+    assert query("SELECT id FROM containers ORDER BY id") == [("B2",), ("B3",)]
+    assert query("SELECT COUNT(*) FROM item_field_values") == [(0,)]
+    assert query("SELECT COUNT(*) FROM items") == [(2,)]
+    assert qr_files() == ["B2.png"]
+
+
+def test_cascade_delete_returns_the_containers_and_touches_no_files(inventory):
+    open(os.path.join(A.QRCODES_DIR, "B3.png"), "wb").close()
+    conn = A.get_db(write=True)
+    try:
+        removed = A.cascade_delete(conn, node_ids=["DR1"], container_ids=["B2"])
+        conn.commit()
+    finally:
+        conn.close()
+    assert sorted(removed) == ["B2", "B3"]
+    assert query("SELECT id FROM nodes ORDER BY id") == [("CAB",), ("SH1",)]
+    assert query("SELECT name FROM items") == [("usb cable",)]
+    assert qr_files() == ["B3.png"]
+    assert query("SELECT COUNT(*) FROM hierarchy WHERE descendant_id IN ('DR1', 'B2', 'B3')") == [(0,)]
+    assert query("SELECT COUNT(*) FROM search_docs WHERE ref_id IN ('DR1', 'B2', 'B3')") == [(0,)]
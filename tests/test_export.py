@@ -0,0 +1,49 @@
+import csv
+import io
+import json
+
+import app as A
+from conftest import send
+
+
+def export(query):
+    status, headers, body = send("GET", f"/api/export?{query}")
+    assert status == 200
+    return headers, body.decode()
+
+
+def test_jsonl_carries_structure_then_items_with_their_values(inventory):
+    headers, text = export("format=jsonl")
+    assert headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in text.splitlines()]
+    assert [r["kind"] for r in records] == ["node"] * 3 + ["container"] * 3 + ["item"] * 3
+    assert records[0]["id"] == "CAB"                  # parents before children
+    typed = next(r for r in records if r["kind"] == "item" and r["id"] == inventory["typed"])
+    assert typed["fields"] == {"length": "1m", "color": "black"}
+    assert typed["location"] == "cab › sh1" and typed["type"] == "Cable"
+
+
+def test_csv_is_items_only_and_filters_by_subtree_and_type(inventory):
+    _, text = export("format=csv&node_id=SH1")
+    rows = list(csv.DictReader(io.StringIO(text)))
+    assert list(rows[0]) == A.EXPORT_CSV_COLUMNS
+    assert sorted(r["name"] for r in rows) == ["glue", "tape", "usb cable"]
+    assert json.loads(next(r for r in rows if r["type"])["fields"]) == {"length": "1m", "color": "black"}
+
+    _, text = export("format=csv&type_id=T1")
+    assert [r["name"] for r in csv.DictReader(io.StringIO(text))] == ["usb cable"]
+    _, text = export("format=jsonl&node_id=DR1")
+    assert [json.loads(line)["id"] for line in text.splitlines()] == ["DR1", "B3"]
+
+
+def test_large_exports_are_streamed_in_chunks(inventory, monkeypatch):
+    monkeypatch.setattr(A, "EXPORT_CHUNK_BYTES", 64)
+    chunks = list(A.iter_export("jsonl"))
+    assert len(chunks) > 3 and all(c.endswith("\n") for c in chunks)
+    assert "".join(chunks) == export("format=jsonl")[1]
+
+
+def test_bad_requests(inventory):
+    assert send("GET", "/api/export?format=xml")[0] == 400
+    assert send("GET", "/api/export?node_id=NOPE")[0] == 404
+    assert send("GET", "/api/export?type_id=NOPE")[0] == 404
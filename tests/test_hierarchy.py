@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+import app as A
+from conftest import query, request, write
+
+
+def closure():
+    return query("SELECT ancestor_id, descendant_id, kind, depth FROM hierarchy ORDER BY 1, 2, 3")
+
+
+def rebuilt():
+    conn = A.get_db(write=True)
+    try:
+        A.rebuild_hierarchy(conn)
+        return [tuple(r) for r in conn.execute("SELECT ancestor_id, descendant_id, kind, depth FROM hierarchy ORDER BY 1, 2, 3")]
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def ancestors(kind, ref_id):
+    conn = A.get_db()
+    try:
+        return [n["id"] for n in A.ancestors_of(conn, kind, ref_id)]
+    finally:
+        conn.close()
+
+
+def test_inserts_link_every_ancestor(inventory):
+    assert ancestors("container", "B1") == ["CAB", "SH1"]
+    assert ancestors("node", "DR1") == ["CAB"] and ancestors("node", "CAB") == []
+    assert closure() == rebuilt()
+
+
+def test_moves_relink_the_subtree(inventory):
+    write("INSERT INTO nodes(id, type, name) VALUES ('WR', 'Wardrobe', 'wardrobe')")
+    status, _ = request("POST", "/container/B1/move", form={"dest_parent_id": "DR1"})
+    assert status == 303 and ancestors("container", "B1") == ["CAB", "DR1"]
+
+    status, body = request("POST", "/api/batch", payload={"ops": [{"op": "move_node", "node_id": "SH1", "dest_parent_id": "WR"}]})
+    assert status == 200 and body["ok"]
+    assert ancestors("container", "B2") == ["WR", "SH1"]
+    assert query("SELECT depth FROM hierarchy WHERE ancestor_id='WR' AND descendant_id='B2'") == [(2,)]
+    assert query("SELECT COUNT(*) FROM hierarchy WHERE ancestor_id='CAB' AND descendant_id IN ('SH1', 'B2')") == [(0,)]
+    assert closure() == rebuilt()
+
+
+def test_a_node_cannot_move_below_itself(inventory):
+    write("INSERT INTO nodes(id, type, name, parent_id) VALUES ('SUB', 'Shelf', 'sub', 'SH1')")
+    for parent in ("SUB", "CAB"):
+        with pytest.raises(sqlite3.IntegrityError, match="below itself"):
+            write("UPDATE nodes SET parent_id=? WHERE id='CAB'", (parent,))
+    with pytest.raises(sqlite3.IntegrityError):
+        write("UPDATE nodes SET parent_id='SH1' WHERE id='SH1'")
+    assert closure() == rebuilt()
+
@@ -0,0 +1,37 @@
+import io
+
+import app as A
+from conftest import query
+
+
+def run_import(text, fmt, chunk_size=2):
+    return A.import_items(A.iter_import_rows(io.StringIO(text), fmt), chunk_size=chunk_size)
+
+
+def test_csv_import_reports_bad_rows_and_keeps_the_rest(inventory):
+    report = run_import(
+        "container_id,name,qty,type,field.length\n"
+        "B1,hdmi,2,Cable,2m\n"
+        "B1,,1,,\n"
+        "NOPE,lost,1,,\n"
+        "B2,tape,x,,\n"
+        "B3,rope,3,,\n", "csv")
+    assert (report["rows"], report["imported"], report["failed"]) == (5, 2, 3)
+    assert sorted(e["line"] for e in report["errors"]) == [3, 4, 5]
+    [(item_id,)] = query("SELECT id FROM items WHERE name='hdmi'")
+    assert query("SELECT field_id, value FROM item_field_values WHERE item_id=?", (item_id,)) == [("F1", "2m")]
+
+
+def test_imported_items_are_indexed_counted_and_versioned(inventory):
+    report = run_import("".join(f'{{"container_id": "B3", "name": "bolt {n}", "qty": 2}}\n' for n in range(5)), "jsonl")
+    assert report["imported"] == 5
+    conn = A.get_db()
+    try:
+        assert A.check_counts(conn) == []
+        _, items_by_container = A.search_inventory(conn, "bolt")
+        assert len(items_by_container["B3"]) == 5
+    finally:
+        conn.close()
+    versions = [v for (v,) in query("SELECT row_version FROM items WHERE name LIKE 'bolt%'")]
+    assert 0 not in versions and len(set(versions)) == 5
+    assert query("SELECT kind, op FROM change_log ORDER BY seq DESC LIMIT 1") == [("inventory", "bulk")]
@@ -0,0 +1,76 @@
+from concurrent.futures import Future
+
+import app as A
+from conftest import request, send
+
+
+class QueuedPool:
+    """Stands in for the label pool: the first `ready` labels render at once, the rest stay queued."""
+    def __init__(self, ready):
+        self.ready, self.futures = ready, []
+
+    def submit(self, fn, *args):
+        future = Future()
+        if len(self.futures) < self.ready:
+            future.set_result(fn(*args))
+        self.futures.append(future)
+        return future
+
+
+def test_label_revalidates_until_the_container_is_renamed(inventory, monkeypatch):
+    monkeypatch.setattr(A, "qr_cache", A.QRCache(spill_dir=""))
+    status, headers, png = send("GET", "/container/B1/qr.png")
+    assert status == 200 and png.startswith(b"\x89PNG") and headers["cache-control"] == "no-cache"
+    etag = headers["etag"]
+    assert send("GET", "/container/B1/qr.png", headers={"If-None-Match": etag})[0] == 304
+    assert A.qr_cache.stats["misses"] == 1
+
+    request("POST", "/container/B1/update", form={"name": "leads", "note": ""})
+    status, headers, _ = send("GET", "/container/B1/qr.png", headers={"If-None-Match": etag})
+    assert status == 200 and headers["etag"] != etag
+    assert send("GET", "/container/NOPE/qr.png")[0] == 404
+
+
+def test_cache_evicts_by_bytes_and_spills_to_disk(tmp_path):
+    cache = A.QRCache(max_bytes=10, spill_dir=str(tmp_path))
+    keys = {p: cache.key(p, "label") for p in ("a", "b", "c")}
+    for p, key in keys.items():
+        cache.put(p, key, p.encode() * 6)
+    assert cache.stats["evictions"] == 2 and len(list(tmp_path.iterdir())) == 2
+    assert cache.get("a", keys["a"]) == b"aaaaaa" and cache.stats["disk_hits"] == 1
+
+    cache.invalidate("a", "b")
+    assert cache.get("a", keys["a"]) is None and cache.get("b", keys["b"]) is None
+    assert cache.get("c", keys["c"]) == b"cccccc"
+
+
+def test_sheet_streams_one_pdf_page_per_sheet(db, monkeypatch):
+    monkeypatch.setattr(A, "qr_cache", A.QRCache(spill_dir=""))
+    monkeypatch.setattr(A, "label_pool", lambda: QueuedPool(ready=5))
+    pdf = b"".join(A.iter_label_sheet_pdf([(f"C{n}", f"box {n}") for n in range(5)], cols=2, rows=2))
+    assert pdf.startswith(b"%PDF-1.4") and pdf.endswith(b"%%EOF\n")
+    assert pdf.count(b"/Type /Page ") == 2 and b"/Count 2" in pdf
+
+
+def test_aborted_download_cancels_queued_renders(db, monkeypatch):
+    pool = QueuedPool(ready=4)                        # the first page of 2 x 2
+    monkeypatch.setattr(A, "qr_cache", A.QRCache(spill_dir=""))
+    monkeypatch.setattr(A, "label_pool", lambda: pool)
+    stream = A.iter_label_sheet_pdf([(f"C{n}", f"box {n}") for n in range(12)], cols=2, rows=2)
+    next(stream)                                      # header
+    next(stream)                                      # first page; the second one is queued
+    stream.close()                                    # the client went away
+    assert len(pool.futures) == 8
+    assert all(f.cancelled() for f in pool.futures[4:])
+
+
+def test_sheet_route_pages_a_subtree(inventory, monkeypatch):
+    monkeypatch.setattr(A, "qr_cache", A.QRCache(spill_dir=""))
+    monkeypatch.setattr(A, "label_pool", lambda: QueuedPool(ready=100))
+    status, headers, png = send("GET", "/labels/sheet?node_id=CAB&format=png&cols=1&rows=2&page=2")
+    assert status == 200 and headers["x-page-count"] == "2" and png.startswith(b"\x89PNG")
+    assert send("GET", "/labels/sheet?node_id=CAB&format=png&cols=1&rows=2&page=3")[0] == 404
+    status, headers, pdf = send("GET", "/labels/sheet?ids=B3,b1,NOPE")
+    assert status == 200 and headers["content-type"] == "application/pdf" and headers["x-page-count"] == "1"
+    assert send("GET", "/labels/sheet?node_id=CAB&paper=a3")[0] == 400
+    assert send("GET", "/labels/sheet?ids=NOPE")[0] == 404
@@ -0,0 +1,44 @@
+import app as A
+from conftest import send
+
+
+def sample(metric, **labels):
+    """Current value of one series in the /metrics text (0 if it has not been seen yet)."""
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    for line in A.metrics_text().splitlines():
+        if line.startswith(f"{metric}{{{want}}} "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+def test_requests_are_counted_by_route_template(inventory):
+    route = "/container/{cont_id}"
+    ok = sample("inventory_http_requests_total", method="GET", route=route, status="200")
+    missing = sample("inventory_http_requests_total", method="GET", route=route, status="404")
+    timed = sample("inventory_http_request_duration_seconds_count", method="GET", route=route)
+    send("GET", "/container/B1")
+    send("GET", "/container/B2")
+    send("GET", "/container/NOPE")
+    assert sample("inventory_http_requests_total", method="GET", route=route, status="200") == ok + 2
+    assert sample("inventory_http_requests_total", method="GET", route=route, status="404") == missing + 1
+    assert sample("inventory_http_request_duration_seconds_count", method="GET", route=route) == timed + 3
+    assert 'route="/container/B1"' not in A.metrics_text()
+
+
+def test_sql_and_render_time_are_charged_to_the_request(inventory):
+    route = "/container/{cont_id}"
+    queries = sample("inventory_http_request_queries_sum", route=route)
+    templates = sample("inventory_render_seconds_count", kind="template", name="container.html")
+    A.response_cache.max_bytes = 0                    # render it, don't serve it from the cache
+    send("GET", "/container/B1")
+    assert sample("inventory_http_request_queries_sum", route=route) > queries
+    assert sample("inventory_render_seconds_count", kind="template", name="container.html") == templates + 1
+    assert sample("inventory_http_request_phase_seconds_sum", route=route, phase="sqlite") > 0
+
+
+def test_unrouted_and_static_requests_do_not_explode_the_labels(db):
+    before = sample("inventory_http_requests_total", method="GET", route="<unmatched>", status="404")
+    send("GET", "/no/such/page")
+    send("GET", "/static/style.css")
+    assert sample("inventory_http_requests_total", method="GET", route="<unmatched>", status="404") == before + 1
+    assert sample("inventory_http_requests_total", method="GET", route="/static/{path}", status="200") > 0
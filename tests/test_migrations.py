@@ -0,0 +1,56 @@
+import re
+import sqlite3
+
+import pytest
+
+import app as A
+
+
+def connect(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def schema(conn):
+    rows = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL ORDER BY type, name")
+    return {(t, n): re.sub(r"\s+", " ", sql).replace("( ", "(").strip() for t, n, sql in rows}
+
+
+def user_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def test_fresh_database_runs_every_step(tmp_path):
+    conn = connect(tmp_path / "fresh.sqlite3")
+    assert user_version(conn) == 0
+    assert A.migrate(conn) == [name for name, _ in A.MIGRATIONS]
+    assert user_version(conn) == A.SCHEMA_VERSION
+    assert A.migrate(conn) == []
+
+
+@pytest.mark.parametrize("stop", range(1, len(A.MIGRATIONS)))
+def test_upgrade_from_every_version_matches_a_fresh_schema(tmp_path, stop):
+    fresh = connect(tmp_path / "fresh.sqlite3")
+    A.migrate(fresh)
+
+    old = connect(tmp_path / "old.sqlite3")
+    for _, step in A.MIGRATIONS[:stop]:   # a database last opened by the release with `stop` steps
+        step(old)
+    old.execute(f"PRAGMA user_version={stop}")
+    # some data written under the old schema, for the later steps to backfill
+    old.execute("INSERT INTO nodes(id, type, name) VALUES ('CAB', 'Cabinet', 'hall cabinet')")
+    old.execute("INSERT INTO nodes(id, type, name, parent_id) VALUES ('SH1', 'Shelf', 'top', 'CAB')")
+    old.execute("INSERT INTO containers(id, type, name, parent_id) VALUES ('B1', 'Box', 'cables', 'SH1')")
+    old.execute("INSERT INTO items(container_id, name, qty) VALUES ('B1', 'hdmi lead', 2)")
+    old.commit()
+
+    assert A.migrate(old) == [name for name, _ in A.MIGRATIONS[stop:]]
+    assert schema(old) == schema(fresh)
+    assert A.check_counts(old) == []
+    assert [r[0] for r in old.execute("SELECT ref_id FROM search_docs WHERE kind='item'")] == [1]
+    assert old.execute("SELECT COUNT(*) FROM hierarchy WHERE descendant_id='B1'").fetchone()[0] == 2
+    versions = [r[0] for r in old.execute(
+        "SELECT row_version FROM nodes UNION ALL SELECT row_version FROM containers UNION ALL SELECT row_version FROM items")]
+    assert 0 not in versions and len(set(versions)) == len(versions)
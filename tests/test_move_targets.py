@@ -0,0 +1,32 @@
+from conftest import request, write
+
+
+def pages(query, limit):
+    ids, after = [], ""
+    while True:
+        status, body = request("GET", f"/api/move-targets?{query}&limit={limit}{after}")
+        assert status == 200
+        ids += [(t["id"], t["path"]) for t in body["items"]]
+        if body["next"] is None:
+            return ids
+        after = f"&after={body['next']}"
+
+
+def test_containers_page_by_name_and_skip_the_current_one(inventory):
+    write("INSERT INTO containers(id, type, name, parent_id) VALUES ('B0', 'Box', 'B2', 'DR1')")   # same name, other id
+    everything = pages("kind=container&exclude=B1", limit=50)
+    assert [cid for cid, _ in everything] == ["B0", "B2", "B3"]
+    assert dict(everything)["B2"] == "cab › sh1"
+    assert pages("kind=container&exclude=B1", limit=1) == everything
+
+
+def test_name_prefix_is_case_insensitive(inventory):
+    write("INSERT INTO containers(id, type, name, parent_id) VALUES ('T9', 'Box', 'Tools', 'DR1')")
+    assert [cid for cid, _ in pages("kind=container&q=to", limit=10)] == ["T9"]
+    assert pages("kind=container&q=zz", limit=10) == []
+
+
+def test_nodes_are_filtered_by_what_they_accept(inventory):
+    assert [nid for nid, _ in pages("kind=node&for_type=Box", limit=1)] == ["DR1", "SH1"]
+    assert pages("kind=node&for_type=Cabinet", limit=10) == []
+    assert request("GET", "/api/move-targets?kind=item")[0] == 400
@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+import app as A
+from conftest import request, send
+
+
+def spin_here(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_samples_every_thread_and_exports_both_formats():
+    stop = threading.Event()
+    worker = threading.Thread(target=spin_here, args=(stop,))
+    worker.start()
+    try:
+        prof = A.SamplingProfiler.start(0.3, 0.005)
+        with pytest.raises(RuntimeError):
+            A.SamplingProfiler.start(0.1, 0.005)        # one session at a time
+        assert prof.done.wait(5)
+    finally:
+        stop.set()
+        worker.join()
+    assert prof.samples > 0
+    lines = prof.collapsed().splitlines()
+    assert any("spin_here (tests/test_profiler.py:" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    doc = prof.speedscope()
+    assert doc["profiles"][0]["type"] == "sampled" and len(doc["profiles"][0]["samples"]) == len(lines)
+    assert "spin_here" in {f["name"] for f in doc["shared"]["frames"]}
+
+
+def test_a_route_session_ends_after_its_requests(inventory):
+    prof = A.SamplingProfiler.start(30, 0.005, "/container/{cont_id}", 2)
+    assert A._handler_codes("/container/{cont_id}") == prof.codes and prof.codes
+    for _ in range(2):
+        send("GET", "/container/B1")
+    send("GET", "/")                                     # other routes don't count
+    assert prof.done.wait(5) and prof.completed == 2
+    assert time.perf_counter() - prof.started < 30
+
+
+def test_endpoint_validates_its_arguments(db, monkeypatch):
+    monkeypatch.setattr(A, "ADMIN_TOKEN", "s3cret")
+    admin = {"Authorization": "Bearer s3cret"}
+    assert request("POST", "/api/debug/profile?seconds=0.1")[0] == 401
+    assert request("POST", "/api/debug/profile?format=pprof", headers=admin)[0] == 400
+    assert request("POST", "/api/debug/profile?requests=5", headers=admin)[0] == 400
+    assert request("POST", "/api/debug/profile?route=/nowhere", headers=admin)[0] == 404
+    status, headers, body = send("POST", "/api/debug/profile?seconds=0.1&route=/container/B1", headers=admin)
+    assert status == 200 and "x-profile-samples" in headers
@@ -0,0 +1,44 @@
+import app as A
+from conftest import request, write
+
+
+def test_codes_are_normalized():
+    assert A.normalize_scan_code(" b1 ") == "B1"
+    assert A.normalize_scan_code("https://inv.local/container/b1/") == "B1"
+    assert A.normalize_scan_code("item:7") == "ITEM:7"
+
+
+def test_cards_for_each_kind(inventory):
+    status, card = request("GET", "/api/scan/b2")
+    assert status == 200 and card["kind"] == "container" and card["url"] == "/container/B2"
+    assert [p["id"] for p in card["path"]] == ["CAB", "SH1"]
+    assert card["counts"] == {"items": 2, "qty": 4} and [i["name"] for i in card["preview"]] == ["glue", "tape"]
+
+    status, card = request("GET", "/api/scan/SH1")
+    assert card["kind"] == "node" and card["counts"] == {"items": 3, "qty": 6, "containers": 2}
+    assert [c["id"] for c in card["preview"]] == ["B1", "B2"]
+
+    status, card = request("GET", f"/api/scan/item:{inventory['typed']}")
+    assert card["kind"] == "item" and card["type"] == "Cable" and card["url"] == "/container/B1"
+    assert [p["id"] for p in card["path"]] == ["CAB", "SH1", "B1"]
+
+    assert request("GET", "/api/scan/NOPE")[0] == 404
+    assert request("GET", "/api/scan/item:999")[0] == 404
+
+
+def test_cache_is_dropped_on_write(inventory):
+    conn = A.get_db()
+    try:
+        assert A.scan_cache.get(conn, "NEW") is None
+        assert A.scan_cache.get(conn, "B2")["counts"]["items"] == 2
+        assert A.scan_cache.get(conn, "B2")["counts"]["items"] == 2
+        assert A.scan_cache.stats["hits"] == 1
+
+        write("INSERT INTO items(container_id, name, qty) VALUES ('B2', 'string', 5)")
+        write("INSERT INTO containers(id, type, name, parent_id) VALUES ('NEW', 'Box', 'new', 'DR1')")
+        assert A.scan_cache.get(conn, "B2")["counts"] == {"items": 3, "qty": 9}
+        assert A.scan_cache.get(conn, "NEW")["kind"] == "container"   # unknown codes don't outlive a write
+        assert A.scan_cache.snapshot()["resets"] == 1
+    finally:
+        conn.close()
+    assert request("GET", "/api/scan/B2")[1]["counts"]["items"] == 3
@@ -0,0 +1,59 @@
+import app as A
+from conftest import request, write
+
+
+def search(q):
+    conn = A.get_db()
+    try:
+        containers, items = A.search_inventory(conn, q)
+        return [c["id"] for c in containers], {cid: [i["name"] for i in rows] for cid, rows in items.items()}
+    finally:
+        conn.close()
+
+
+def test_finds_containers_items_and_field_values(inventory):
+    assert search("b2")[0] == ["B2"]
+    assert search("usb cab") == (["B1"], {"B1": ["usb cable"]})       # every word as a prefix
+    assert search("black") == (["B1"], {"B1": ["usb cable"]})         # dynamic values are indexed
+    assert search("") == ([], {}) and search('"*') == ([], {})
+
+
+def test_node_hit_matches_every_container_below_it(inventory):
+    assert sorted(search("sh1")[0]) == ["B1", "B2"]
+    assert sorted(search("cab")[0]) == ["B1", "B2", "B3"]
+
+
+def test_index_follows_edits_moves_and_deletes(inventory):
+    status, _ = request("POST", f"/container/B2/items/{inventory['plain']}/update",
+                        form={"name": "duct tape", "qty": "1", "note": "silver"})
+    assert status == 303
+    assert search("duct silver") == (["B2"], {"B2": ["duct tape"]})
+
+    request("POST", "/container/B2/items/move", form={"item_id": inventory["plain"], "dest_container_id": "B3"})
+    assert search("duct") == (["B3"], {"B3": ["duct tape"]})
+
+    write("UPDATE item_field_values SET value='white' WHERE item_id=? AND field_id='F2'", (inventory["typed"],))
+    assert search("black") == ([], {}) and search("white")[0] == ["B1"]
+
+    request("POST", "/container/B1/update", form={"name": "leads", "note": ""})
+    assert search("leads")[0] == ["B1"]
+
+    request("POST", f"/container/B3/items/{inventory['plain']}/delete")
+    request("POST", "/node/SH1/delete")
+    assert search("duct") == ([], {}) and search("leads") == ([], {})
+
+
+def test_rebuild_matches_the_trigger_maintained_index(inventory):
+    before = search("cable"), search("glue"), search("drawer dr1")
+    conn = A.get_db(write=True)
+    try:
+        A.rebuild_search_index(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    assert (search("cable"), search("glue"), search("drawer dr1")) == before
+
+
+def test_map_view_search(inventory):
+    status, body = request("GET", "/?q=glue")
+    assert status == 200 and b"b2" in body
@@ -0,0 +1,49 @@
+import json
+
+import app as A
+from conftest import request, write
+
+
+def test_shapes_collapse_literals_and_placeholder_lists():
+    assert A.sql_shape("SELECT * FROM items WHERE id IN (?, ?,?) AND name = 'x''y' AND qty > 10") == \
+        "SELECT * FROM items WHERE id IN (?+) AND name = ? AND qty > ?"
+    assert A.sql_shape("SELECT  a\n FROM t WHERE b = ?") == A.sql_shape("SELECT a FROM t WHERE b = ?")
+
+
+def test_slow_statements_are_logged_with_their_plan(inventory, tmp_path, monkeypatch):
+    log = A.SlowQueryLog(threshold_ms=1e-6, path=str(tmp_path / "slow.log"))
+    monkeypatch.setattr(A, "slow_log", log)
+    write("SELECT name FROM items WHERE note LIKE ? AND qty > 1", ("%x%",))
+    write("SELECT name FROM items WHERE note LIKE ? AND qty > 5", ("%y%",))
+
+    [agg] = [a for a in log.worst(50) if a["shape"] == "SELECT name FROM items WHERE note LIKE ? AND qty > ?"]
+    assert agg["count"] == 2 and agg["params"] == 1
+    assert agg["full_scan"] and any("SCAN items" in line for line in agg["plan"])
+    logged = [json.loads(line) for line in (tmp_path / "slow.log").read_text().splitlines()]
+    assert sum(e["shape"] == agg["shape"] for e in logged) == 2
+
+
+def test_entries_name_the_request_that_ran_them(inventory, monkeypatch):
+    log = A.SlowQueryLog(threshold_ms=1e-6, path="")
+    monkeypatch.setattr(A, "slow_log", log)
+    request("GET", "/container/B1")
+    assert "GET /container/B1" in {e["request"] for e in log.recent}
+
+
+def test_a_zero_threshold_disables_the_log(inventory, monkeypatch):
+    log = A.SlowQueryLog(threshold_ms=0, path="")
+    monkeypatch.setattr(A, "slow_log", log)
+    request("GET", "/container/B1")
+    assert log.snapshot()["shapes"] == 0
+
+
+def test_endpoint_lists_the_worst_shapes(inventory, monkeypatch):
+    monkeypatch.setattr(A, "ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(A, "slow_log", A.SlowQueryLog(threshold_ms=1e-6, path=""))
+    request("GET", "/container/B1")
+    admin = {"X-Admin-Token": "s3cret"}
+    status, body = request("GET", "/api/debug/slow-queries?limit=3&order=count&reset=true", headers=admin)
+    assert status == 200 and len(body["worst"]) == 3
+    assert [a["count"] for a in body["worst"]] == sorted((a["count"] for a in body["worst"]), reverse=True)
+    assert request("GET", "/api/debug/slow-queries", headers=admin)[1]["shapes"] == 0
+    assert request("GET", "/api/debug/slow-queries?order=rows", headers=admin)[0] == 400
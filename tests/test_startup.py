@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+PROBE = """
+import asyncio, json, os, sys
+import app
+state = {"db": os.path.exists(os.environ["DB_PATH"]), "imaging": "PIL" in sys.modules or "qrcode" in sys.modules}
+status, _ = asyncio.run(app.asgi_get("/"))
+state.update(status=status, db_after=os.path.exists(os.environ["DB_PATH"]))
+print(json.dumps(state))
+"""
+
+
+def test_import_does_no_io_and_the_first_request_sets_up(tmp_path):
+    marker = tmp_path / "mkcert-ran"
+    fake = tmp_path / "bin" / "mkcert"
+    fake.parent.mkdir()
+    fake.write_text(f"#!/bin/sh\ntouch {marker}\n")
+    fake.chmod(0o755)
+    env = {**os.environ, "DB_PATH": str(tmp_path / "inventory.sqlite3"),
+           "PATH": f"{fake.parent}{os.pathsep}{os.environ.get('PATH', '')}"}
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    state = json.loads(out.stdout.splitlines()[-1])
+    assert state == {"db": False, "imaging": False, "status": 200, "db_after": True}
+    assert not marker.exists()                  # the certificate export belongs to the startup hook
@@ -0,0 +1,145 @@
+import app as A
+from conftest import query, request, write
+
+
+class Replica:
+    """A client-side copy kept up to date the way the README describes."""
+    def __init__(self):
+        self.rows = {"nodes": {}, "containers": {}, "items": {}, "values": {}}
+        self.cursor = "0"
+        self.resets = 0
+
+    def key(self, table, row):
+        return tuple(row[:2]) if table == "values" else row[0]
+
+    def apply(self, page):
+        if page["reset"]:
+            self.resets += 1
+            for rows in self.rows.values():
+                rows.clear()
+        deleted = page["deleted"]
+        for kind, table in (("node", "nodes"), ("container", "containers"), ("item", "items")):
+            for ref in deleted[kind]:
+                self.rows[table].pop(ref, None)
+        gone = set(deleted["item"])             # a deleted item takes its values with it
+        for key in [k for k in self.rows["values"] if k[0] in gone]:
+            del self.rows["values"][key]
+        for item_id, field_id in deleted["value"]:
+            self.rows["values"].pop((item_id, field_id), None)
+        for table in self.rows:
+            for row in page[table]:
+                self.rows[table][self.key(table, row)] = tuple(row)
+
+    def sync(self, limit=3):
+        pages = 0
+        while True:
+            status, page = request("GET", f"/api/sync?since={self.cursor}&limit={limit}")
+            assert status == 200
+            self.apply(page)
+            self.cursor = page["next"]
+            pages += 1
+            if not page["more"]:
+                return pages
+
+
+def server_rows():
+    rows = {}
+    for table, (_, key) in A.SYNC_TABLES.items():
+        cols = A.DATA_COLUMNS[table]
+        rows[key] = {tuple(r[:2]) if key == "values" else r[0]: r
+                     for r in query(f"SELECT {', '.join(cols)} FROM {table}")}
+    return rows
+
+
+def test_replica_converges_through_every_kind_of_write(inventory):
+    replica = Replica()
+    assert replica.sync() > 1                   # paged: more rows than the limit
+    assert replica.rows == server_rows() and replica.resets == 1
+
+    # item delete: the foreign-key cascade drops its values without tombstones of their own
+    request("POST", f"/container/B1/items/{inventory['typed']}/delete")
+    replica.sync()
+    assert replica.rows == server_rows()
+    assert not [k for k in replica.rows["values"] if k[0] == inventory["typed"]]
+
+    item = write("INSERT INTO items(container_id, name, type_id) VALUES ('B3', 'hdmi', 'T1')")
+    write("INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, 'F1', '2m'), (?, 'F2', 'red')", (item, item))
+    request("POST", f"/container/B3/items/{item}/update",
+            form={"name": "hdmi lead", "qty": "1", "note": "", "type_id": "T1", "field_F1": "3m"})
+    request("POST", "/container/B2/items/move", form={"item_id": inventory["plain"], "dest_container_id": "B3"})
+    A.import_items(enumerate([{"container_id": "B1", "name": f"screw {n}", "type_id": "T1",
+                               "fields": {"length": f"{n}cm"}} for n in range(4)], 1))
+    replica.sync()
+    assert replica.rows == server_rows()
+    assert (item, "F2") not in replica.rows["values"]
+
+    # cascades: a container, then a node with everything under it, then a field of a type
+    request("POST", "/container/B2/delete")
+    request("POST", "/node/SH1/delete")
+    write("DELETE FROM item_fields WHERE id = 'F1'")
+    replica.sync(limit=1)
+    assert replica.rows == server_rows()
+    assert replica.resets == 1
+
+
+def test_unchanged_replica_gets_an_empty_page(inventory):
+    replica = Replica()
+    replica.sync(limit=1000)
+    status, page = request("GET", f"/api/sync?since={replica.cursor}")
+    assert status == 200 and not page["more"] and not page["reset"]
+    assert page["next"] == replica.cursor
+    assert not any(page[t] for t in replica.rows) and not any(page["deleted"].values())
+
+
+def test_pruned_tombstones_force_a_reset(inventory):
+    replica = Replica()
+    replica.sync()
+    request("POST", f"/container/B2/items/{inventory['plain']}/delete")
+    assert prune() == 1
+    replica.sync()
+    assert replica.resets == 2 and replica.rows == server_rows()
+
+
+def prune():
+    conn = A.get_db(write=True)
+    try:
+        pruned = A.prune_tombstones(conn, retention_days=-1)
+        conn.commit()
+        return pruned
+    finally:
+        conn.close()
+
+
+def test_full_sync_pages_survive_an_old_floor_but_not_a_new_prune(inventory):
+    request("POST", f"/container/B2/items/{inventory['plain']}/delete")
+    assert prune() == 1
+    _, first = request("GET", "/api/sync?since=0&limit=2")
+    assert first["reset"] and first["more"] and ":" in first["next"]
+    _, second = request("GET", f"/api/sync?since={first['next']}&limit=2")
+    assert not second["reset"]
+
+    # a plain cursor that old has lost tombstones it needs
+    version = first["next"].split(":")[0]
+    _, stale = request("GET", f"/api/sync?since={version}&limit=2")
+    assert stale["reset"]
+
+    # so has a full sync cursor once tombstones are pruned under it
+    request("POST", f"/container/B2/items/{inventory['other']}/delete")
+    assert prune() == 1
+    _, restarted = request("GET", f"/api/sync?since={second['next']}&limit=2")
+    assert restarted["reset"]
+
+
+def test_cursor_from_another_database_resets(inventory):
+    head = query("SELECT value FROM app_meta WHERE key='row_version'")[0][0]
+    _, page = request("GET", f"/api/sync?since={head + 100}")
+    assert page["reset"] and page["since"] == 0
+
+
+def test_malformed_cursor_is_rejected(db):
+    assert request("GET", "/api/sync?since=12:x")[0] == 400
+
+
+def test_limit_is_bounded(db):
+    assert request("GET", "/api/sync?limit=0")[0] == 400
+    assert request("GET", f"/api/sync?limit={A.SYNC_MAX_PAGE_ROWS + 1}")[0] == 400
@@ -0,0 +1,38 @@
+import app as A
+from conftest import query, write
+
+
+def schema(type_id="T1"):
+    conn = A.get_db()
+    try:
+        return [(f["id"], f["label"]) for f in A.type_schemas.get(conn, type_id).fields]
+    finally:
+        conn.close()
+
+
+def test_rolled_back_batch_leaves_no_schema_in_the_cache(inventory):
+    assert schema() == [("F1", "length"), ("F2", "color")]
+    conn = A.get_db(write=True)
+    try:   # api_batch's 409 path: the ops applied, then the transaction rolled back
+        conn.execute("BEGIN IMMEDIATE")
+        A.apply_batch(conn, A.validate_batch(conn, [
+            {"op": "reorder_fields", "type_id": "T1", "order": ["F2", "F1"]},
+            {"op": "reorder_fields", "type_id": "T1", "order": ["F2", "F1"]},
+        ]))
+        conn.rollback()
+    finally:
+        conn.close()
+    # two committed edits take types_version to the number the rolled-back batch had reached
+    write("UPDATE item_fields SET label='Length' WHERE id='F1'")
+    write("UPDATE item_fields SET label='Colour' WHERE id='F2'")
+    assert schema() == [("F1", "Length"), ("F2", "Colour")]
+
+
+def test_committed_edits_reload_the_schema(inventory):
+    schema()
+    loads = A.type_schemas.snapshot()["loads"]
+    schema()
+    assert A.type_schemas.snapshot()["loads"] == loads
+    write("INSERT INTO item_fields(id, type_id, name, label, kind, ord) VALUES ('F3', 'T1', 'gauge', 'gauge', 'number', 3)")
+    assert [fid for fid, _ in schema()] == ["F1", "F2", "F3"]
+    assert query("SELECT value FROM app_meta WHERE key='types_version'")[0][0] == A.type_schemas.snapshot()["version"]
@@ -0,0 +1,64 @@
+import pytest
+
+from conftest import query, request, write
+
+
+@pytest.fixture
+def audit(inventory):
+    """Every row-level write to items and item_field_values, in order."""
+    write("CREATE TABLE audit(tbl TEXT, op TEXT, field_id TEXT)")
+    write("""CREATE TRIGGER audit_items AFTER UPDATE OF container_id, name, qty, note, type_id ON items
+              BEGIN INSERT INTO audit VALUES ('items', 'update', NULL); END""")
+    for op, row in (("INSERT", "new"), ("UPDATE OF value", "new"), ("DELETE", "old")):
+        write(f"""CREATE TRIGGER audit_values_{op.split()[0].lower()} AFTER {op} ON item_field_values
+                  BEGIN INSERT INTO audit VALUES ('values', '{op.split()[0].lower()}', {row}.field_id); END""")
+    write("INSERT INTO item_fields(id, type_id, name, label, kind, ord) VALUES ('F3', 'T1', 'shielded', 'shielded', 'checkbox', 3)")
+    write("INSERT INTO item_field_values(item_id, field_id, value) VALUES (?, 'F3', 'on')", (inventory["typed"],))
+    write("DELETE FROM audit")
+    return lambda: query("SELECT tbl, op, field_id FROM audit")
+
+
+def submit(item_id, **fields):
+    form = {"name": "usb cable", "qty": "2", "note": "", "type_id": "T1", **fields}
+    status, _ = request("POST", f"/container/B1/items/{item_id}/update", form=form)
+    assert status == 303
+
+
+def values(item_id):
+    return dict(query("SELECT field_id, value FROM item_field_values WHERE item_id=?", (item_id,)))
+
+
+def test_resubmitting_the_same_form_writes_nothing(inventory, audit):
+    submit(inventory["typed"], field_F1="1m", field_F2=" black ", field_F3="on")
+    assert audit() == []
+
+
+def test_only_changed_values_are_written(inventory, audit):
+    submit(inventory["typed"], field_F1="2m", field_F2="black", field_F3="on")
+    assert audit() == [("values", "update", "F1")]
+    assert values(inventory["typed"]) == {"F1": "2m", "F2": "black", "F3": "on"}
+
+
+def test_unchecking_a_checkbox_clears_its_value(inventory, audit):
+    submit(inventory["typed"], field_F1="1m", field_F2="black")          # browsers omit unchecked boxes
+    assert audit() == [("values", "delete", "F3")]
+    assert values(inventory["typed"]) == {"F1": "1m", "F2": "black"}
+    submit(inventory["typed"], field_F1="1m", field_F2="black", field_F3="on")
+    assert audit()[1:] == [("values", "insert", "F3")]
+
+
+def test_item_columns_are_updated_only_when_they_change(inventory, audit):
+    submit(inventory["typed"], name="usb-c cable", field_F1="1m", field_F2="black", field_F3="on")
+    assert audit() == [("items", "update", None)]
+    assert query("SELECT name FROM items WHERE id=?", (inventory["typed"],)) == [("usb-c cable",)]
+
+
+def test_dropping_the_type_drops_the_values(inventory, audit):
+    submit(inventory["typed"], type_id="")
+    assert values(inventory["typed"]) == {}
+    assert query("SELECT type_id FROM items WHERE id=?", (inventory["typed"],)) == [(None,)]
+
+
+def test_wrong_container_is_404(inventory):
+    status, _ = request("POST", f"/container/B2/items/{inventory['typed']}/update", form={"name": "x"})
+    assert status == 404